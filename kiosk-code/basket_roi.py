@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+basket_roi.py — 바구니 관심영역(ROI)
+- parse_roi("x,y,w,h")  : 고정 ROI (픽셀, 또는 모두 0~1 이면 프레임 비율)
+- calibrate_roi(gray)   : 빈 바구니 기준 프레임에서 바구니 외곽(가장 큰 윤곽) 자동 검출
+- 모든 ROI 는 짝수 좌표/크기로 맞춤 (I420 U/V 평면을 그대로 잘라 쓰기 위함)
+
+  python3 basket_roi.py empty_basket.jpg [--margin 0.04]   → ROI 출력 + 확인용 이미지
+"""
+
+import argparse
+
+import cv2
+
+
+def align_roi(x, y, w, h, fw, fh):
+    """프레임 안으로 자르고 짝수로 맞춤 → (x, y, w, h)"""
+    x0 = max(0, min(int(x), fw - 2)) & ~1
+    y0 = max(0, min(int(y), fh - 2)) & ~1
+    x1 = min(fw, int(round(x + w)))
+    y1 = min(fh, int(round(y + h)))
+    w = max(2, (x1 - x0) & ~1)
+    h = max(2, (y1 - y0) & ~1)
+    return x0, y0, w, h
+
+
+def parse_roi(spec, fw, fh):
+    """'x,y,w,h' → ROI. 값이 모두 1 이하면 비율로 해석. 빈 문자열이면 None"""
+    if not spec:
+        return None
+    v = [float(s) for s in spec.split(",")]
+    if len(v) != 4:
+        raise ValueError(f"ROI must be x,y,w,h: {spec!r}")
+    if all(0 <= a <= 1 for a in v):
+        v = [v[0] * fw, v[1] * fh, v[2] * fw, v[3] * fh]
+    return align_roi(*v, fw, fh)
+
+
+def calibrate_roi(gray, margin=0.04, min_area=0.10, max_area=0.95):
+    """
+    빈 바구니 기준 프레임(Y 평면)에서 바구니 영역 추정.
+    에지 → 닫힘 연산 → 외곽 윤곽 중 면적이 [min_area, max_area] 인 가장 큰 것의 bbox + margin.
+    못 찾으면 None (전체 프레임 사용).
+    """
+    fh, fw = gray.shape[:2]
+    blur = cv2.GaussianBlur(gray, (5, 5), 0)
+    edges = cv2.Canny(blur, 30, 90)
+    k = cv2.getStructuringElement(cv2.MORPH_RECT, (9, 9))
+    edges = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, k, iterations=2)
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    best, best_area = None, 0
+    for c in contours:
+        x, y, w, h = cv2.boundingRect(c)
+        a = (w * h) / float(fw * fh)
+        if min_area <= a <= max_area and w * h > best_area:
+            best, best_area = (x, y, w, h), w * h
+    if best is None:
+        return None
+    x, y, w, h = best
+    mx, my = int(w * margin), int(h * margin)
+    return align_roi(x - mx, y - my, w + 2 * mx, h + 2 * my, fw, fh)
+
+
+def load_reference(path):
+    """기준 이미지(jpg/png) → Y(gray) 평면. 없거나 못 읽으면 None"""
+    return cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="빈 바구니 사진에서 BASKET_ROI 계산")
+    ap.add_argument("image")
+    ap.add_argument("--margin", type=float, default=0.04)
+    ap.add_argument("--out", default="roi_check.jpg")
+    args = ap.parse_args()
+
+    gray = load_reference(args.image)
+    if gray is None:
+        raise SystemExit(f"cannot read {args.image}")
+    roi = calibrate_roi(gray, args.margin)
+    if roi is None:
+        print("basket not found → full frame")
+        return
+    x, y, w, h = roi
+    vis = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+    cv2.rectangle(vis, (x, y), (x + w, y + h), (0, 255, 0), 2)
+    cv2.imwrite(args.out, vis)
+    print(f"BASKET_ROI={x},{y},{w},{h}   (check: {args.out})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,518 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+camera_broker.py — 카메라 브로커 (센서 하나를 컨트롤러/정지 감지가 같이 씀)
+- 브로커 프로세스 하나가 rpicam-vid(frame_source) 를 소유하고 공유 메모리 링에 프레임을 readinto
+- 공유 메모리 배치: [슬롯 × I420 프레임][헤더][슬롯별 seq/ts][클라이언트별 pin 표]
+  프레임이 맨 앞이라 FrameRing(attach=이름) 으로도 그대로 붙음 (WORKERS 워커 프로세스)
+- 클라이언트는 자기 pin 행만 씀, 브로커는 어느 클라이언트든 잡고 있는 슬롯/최신 슬롯은 건너뜀
+  브로커의 슬롯 선점(pin 확인 + seq=0 표시)/게시와 클라이언트의 고정(최신 슬롯 읽기 + pin)은
+  프로세스 간 잠금(<sock 디렉터리>/<이름>.lock, flock) 안에서 → 둘이 서로의 옛 값을 읽고 엇갈리지 않음
+  (공유 메모리 저장/읽기 사이에 울타리가 없어 x86 에서도 재정렬됨, flock 시스템 호출이 울타리 역할)
+- 알림: 유닉스 데이터그램 소켓으로 새 프레임 seq(8바이트) 만 보냄 (프레임 바이트는 프로세스 간 복사 없음)
+  구독 시 fps 를 주면 그 간격으로 솎아서 알림, 죽은 클라이언트는 pin 행을 비움
+- BrokerClient : FrameRing 과 같은 소비자 인터페이스 (latest / wait_newer / seq / RingFrame.release)
+  gray_only=True 면 프레임 뷰가 Y 평면뿐 (정지 감지처럼 밝기만 쓰는 소비자)
+
+  python3 camera_broker.py [--source rpicam] [--width 640] [--height 480] [--fps 25] [--slots 8]
+  소비자: CAM_SOURCE=broker (controller_ws3) / STILL_SOURCE=broker (pi_still_monitor)
+"""
+
+import argparse
+import atexit
+import fcntl
+import json
+import os
+import select
+import signal
+import socket
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+
+from frame_ring import RingFrame, attach_shm
+from frame_source import open_source
+from kiosk_log import get_logger, install_dump_signal
+
+BROKER_NAME = os.environ.get("CAM_BROKER", "kiosk_cam")    # 공유 메모리 이름 (/dev/shm/<이름>)
+BROKER_SOCK_DIR = os.environ.get("CAM_BROKER_SOCK_DIR", "/tmp")
+MAX_CLIENTS = 8
+
+_MAGIC = 0x4B43414D   # "KCAM"
+# 헤더 int64: magic, w, h, slots, max_clients, latest 슬롯, 마지막 seq, 브로커 pid
+_H_MAGIC, _H_W, _H_H, _H_SLOTS, _H_CLIENTS, _H_LATEST, _H_SEQ, _H_PID = range(8)
+_HDR_N = 8
+_SEQ = struct.Struct("q")
+
+
+def sock_path(name):
+    return os.path.join(BROKER_SOCK_DIR, f"{name}.sock")
+
+
+class _ShmLock:
+    """브로커/클라이언트 공용 프로세스 간 잠금 (flock). 같은 프로세스 안 스레드끼리는 호출 쪽 잠금으로 구분"""
+
+    def __init__(self, name):
+        self.path = os.path.join(BROKER_SOCK_DIR, f"{name}.lock")
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+
+    def __enter__(self):
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def broker_pid(name=BROKER_NAME, timeout=0.5):
+    """같은 이름의 브로커가 응답하면 그 pid, 아니면 0"""
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        s.bind("")
+        s.sendto(b"ping", sock_path(name))
+        r, _, _ = select.select([s], [], [], timeout)
+        return json.loads(s.recv(512)).get("pid", 0) if r else 0
+    except (OSError, ValueError):
+        return 0
+    finally:
+        s.close()
+
+
+class _Layout:
+    """공유 메모리 위 배열들 (브로커/클라이언트 공용, 클라이언트는 w/h/slots 를 구독 응답으로 받음)"""
+
+    def __init__(self, buf, w, h, slots, clients):
+        fs = w * h * 3 // 2
+        off = slots * fs
+        self.frames = np.ndarray((slots, h * 3 // 2, w), np.uint8, buffer=buf)
+        self.hdr = np.ndarray(_HDR_N, np.int64, buffer=buf, offset=off)
+        off += _HDR_N * 8
+        self.seq = np.ndarray(slots, np.int64, buffer=buf, offset=off)
+        off += slots * 8
+        self.ts = np.ndarray(slots, np.float64, buffer=buf, offset=off)
+        off += slots * 8
+        self.pins = np.ndarray((clients, slots), np.int32, buffer=buf, offset=off)
+
+    @staticmethod
+    def size(w, h, slots, clients):
+        return slots * (w * h * 3 // 2) + _HDR_N * 8 + slots * 16 + clients * slots * 4
+
+
+# ─────────────────────────────────────────────
+# 브로커 (writer)
+# ─────────────────────────────────────────────
+class CameraBroker:
+    def __init__(self, source, w, h, fps, slots=8, name=BROKER_NAME, log=None, **cam):
+        if slots < 3:
+            raise ValueError("broker ring needs at least 3 slots")
+        from multiprocessing import shared_memory
+
+        self.w, self.h, self.fps, self.slots = int(w), int(h), int(fps), int(slots)
+        self.name = name
+        self.log = log or get_logger("broker")
+        self._source_spec = source
+        self._cam = cam
+        self.frame_size = self.w * self.h * 3 // 2
+
+        pid = broker_pid(name)
+        if pid:
+            raise RuntimeError(f"camera broker {name!r} already running (pid {pid})")
+        size = _Layout.size(self.w, self.h, self.slots, MAX_CLIENTS)
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # 이전 브로커가 비정상 종료하며 남긴 것 → 새로 만듦 (붙어 있던 클라이언트는 pid 로 재구독)
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.mem = _Layout(self.shm.buf, self.w, self.h, self.slots, MAX_CLIENTS)
+        self.mem.seq[:] = 0
+        self.mem.ts[:] = 0
+        self.mem.pins[:] = 0
+        self.mem.hdr[:] = (_MAGIC, self.w, self.h, self.slots, MAX_CLIENTS, -1, 0, os.getpid())
+        self._mv = [memoryview(self.mem.frames[i]).cast("B") for i in range(self.slots)]
+        self._wpos = 0
+        self._closed = False
+        self._xlock = _ShmLock(name)   # 슬롯 선점/게시 ↔ 클라이언트 고정
+
+        # 구독자: 행 번호 → [주소, pid, 최소 간격, 마지막 알림 시각]
+        self._subs = {}
+        self._subs_lock = threading.Lock()
+        self.sock_path = sock_path(name)
+        try:
+            os.unlink(self.sock_path)
+        except FileNotFoundError:
+            pass
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(self.sock_path)
+        self._send = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._send.setblocking(False)
+        atexit.register(self.close)
+
+        self.published = self.dropped_full = 0
+        self.source = None
+
+    # ── 제어 소켓 (구독/해지 + 죽은 클라이언트 정리)
+    def _control_loop(self):
+        last_check = time.monotonic()
+        while not self._closed:
+            r, _, _ = select.select([self._sock], [], [], 1.0)
+            if r:
+                try:
+                    data, addr = self._sock.recvfrom(256)
+                    self._handle(data.decode("utf-8", "replace").split(), addr)
+                except OSError:
+                    if self._closed:
+                        return
+            if time.monotonic() - last_check >= 2.0:
+                last_check = time.monotonic()
+                for row, sub in list(self._subs.items()):
+                    try:
+                        os.kill(sub[1], 0)
+                    except ProcessLookupError:
+                        self._drop(row, "process gone")
+                    except PermissionError:
+                        pass
+
+    def _handle(self, parts, addr):
+        if not parts:
+            return
+        if parts[0] == "sub" and len(parts) >= 3:
+            pid, fps = int(parts[1]), float(parts[2])
+            with self._subs_lock:
+                # 같은 pid 가 다시 구독하면(재연결) 이전 행 재사용
+                row = next((r for r, s in self._subs.items() if s[1] == pid and s[0] == addr), None)
+                if row is None:
+                    row = next((r for r in range(MAX_CLIENTS) if r not in self._subs), -1)
+                if row >= 0:
+                    self.mem.pins[row] = 0
+                    self._subs[row] = [addr, pid, 1.0 / fps if fps > 0 else 0.0, 0.0]
+            reply = {"row": row, "w": self.w, "h": self.h, "slots": self.slots, "clients": MAX_CLIENTS,
+                     "shm": self.name, "pid": os.getpid(), "fps": self.fps}
+            if row < 0:
+                reply["error"] = "too many clients"
+            self._reply(addr, reply)
+            self.log.info("[BROKER] sub pid=%d row=%d fps=%s", pid, row, parts[2])
+        elif parts[0] == "unsub" and len(parts) >= 2:
+            self._drop(int(parts[1]), "unsubscribed")
+        elif parts[0] == "ping":
+            self._reply(addr, {"pid": os.getpid()})
+
+    def _reply(self, addr, obj):
+        try:
+            self._send.sendto(json.dumps(obj).encode(), addr)
+        except OSError:
+            pass
+
+    def _drop(self, row, why):
+        with self._subs_lock:
+            sub = self._subs.pop(row, None)
+            self.mem.pins[row] = 0   # 죽은 클라이언트가 잡고 있던 슬롯 해제
+        if sub is not None:
+            self.log.info("[BROKER] drop row=%d pid=%d (%s)", row, sub[1], why)
+
+    # ── 프레임 쓰기/게시
+    def _pick_write_slot(self):
+        m = self.mem
+        with self._xlock:
+            latest = int(m.hdr[_H_LATEST])
+            for k in range(self.slots):
+                i = (self._wpos + k) % self.slots
+                if i == latest or m.pins[:, i].any():
+                    continue
+                m.seq[i] = 0                 # 쓰는 중 표시 (잠금을 풀면 클라이언트는 이 슬롯을 고정하지 않음)
+                self._wpos = (i + 1) % self.slots
+                return i
+        return -1
+
+    def fill_from(self, stream):
+        """FrameRing.fill_from 과 같음: 한 프레임을 빈 슬롯에 readinto 후 게시 (EOF 면 False, 빈 슬롯 없으면 None)"""
+        i = self._pick_write_slot()
+        if i < 0:
+            self.dropped_full += 1
+            time.sleep(0.001)
+            return None
+        mv = self._mv[i]
+        got = 0
+        while got < self.frame_size:
+            n = stream.readinto(mv[got:])
+            if not n:
+                return False
+            got += n
+        self._publish(i)
+        return True
+
+    def _publish(self, i):
+        m = self.mem
+        seq = int(m.hdr[_H_SEQ]) + 1
+        now = time.monotonic()
+        with self._xlock:   # 프레임 바이트까지 다 쓴 뒤 게시 (잠금 = 울타리)
+            m.ts[i] = now
+            m.seq[i] = seq
+            m.hdr[_H_LATEST] = i
+            m.hdr[_H_SEQ] = seq
+        self.published += 1
+        msg = _SEQ.pack(seq)
+        slack = 0.5 / self.fps if self.fps > 0 else 0.0
+        with self._subs_lock:
+            subs = list(self._subs.items())
+        for row, sub in subs:
+            addr, _, interval, last = sub
+            if interval and now - last < interval - slack:
+                continue
+            try:
+                self._send.sendto(msg, addr)
+                sub[3] = now
+            except BlockingIOError:
+                pass   # 클라이언트가 밀려 있음 → 이번 알림만 생략 (최신 프레임만 의미 있음)
+            except OSError:
+                self._drop(row, "socket gone")
+
+    def _open(self):
+        self.source = open_source(self._source_spec, self.w, self.h, self.fps, **self._cam)
+        self.log.info("[BROKER] source: %s", self.source)
+
+    def run(self):
+        threading.Thread(target=self._control_loop, name="broker-ctl", daemon=True).start()
+        self._open()
+        self.log.info("[BROKER] %dx%d@%d slots=%d shm=/dev/shm/%s sock=%s",
+                      self.w, self.h, self.fps, self.slots, self.name, self.sock_path)
+        t_hb = time.monotonic()
+        while not self._closed:
+            if self.fill_from(self.source.stream) is False:
+                if getattr(self.source, "proc", None) is None and self.source.done:
+                    self.log.info("[BROKER] source finished: %s", self.source)
+                    return
+                self.log.warn("[BROKER] camera pipe closed → restart", key="broker_restart")
+                self.source.close()
+                time.sleep(0.5)
+                self._open()
+            if time.monotonic() - t_hb >= 10.0:
+                t_hb = time.monotonic()
+                self.log.info("[BROKER] seq=%d clients=%d full_drops=%d",
+                              int(self.mem.hdr[_H_SEQ]), len(self._subs), self.dropped_full)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self.source is not None:
+            self.source.close()
+        for s in (self._sock, self._send):
+            try:
+                s.close()
+            except OSError:
+                pass
+        try:
+            os.unlink(self.sock_path)
+        except OSError:
+            pass
+        self._mv = None
+        self.mem = None
+        self._xlock.close()
+        try:
+            self.shm.unlink()
+            self.shm.close()
+        except (BufferError, FileNotFoundError):
+            pass
+
+
+# ─────────────────────────────────────────────
+# 클라이언트 (consumer)
+# ─────────────────────────────────────────────
+class BrokerClient:
+    """
+    FrameRing 소비자 쪽과 같은 인터페이스. 알림은 pump() 를 도는 스레드 하나가 받아서
+    wait_newer() 대기자를 깨우고 on_publish 를 부름 (FrameRing 의 reader 스레드 자리).
+    """
+
+    def __init__(self, name=BROKER_NAME, fps=0, gray_only=False, on_publish=None, timeout=5.0):
+        self.name = name
+        self.fps = float(fps)
+        self.gray_only = bool(gray_only)
+        self._on_publish = on_publish
+        self._lock = threading.Lock()
+        self._new_frame = threading.Condition(self._lock)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind("")            # 리눅스 abstract 자동 주소
+        self.shm = None
+        self.mem = None
+        self.row = -1
+        self.broker_pid = 0
+        self._xlock = _ShmLock(name)
+        self._subscribe(timeout)
+
+    # ── 구독 / 재구독 (브로커 재시작 시 공유 메모리도 새로 붙음)
+    def _subscribe(self, timeout):
+        path = sock_path(self.name)
+        t_end = time.monotonic() + timeout
+        while True:
+            try:
+                self._sock.sendto(f"sub {os.getpid()} {self.fps:g}".encode(), path)
+                r, _, _ = select.select([self._sock], [], [], 1.0)
+                while r:
+                    data = self._sock.recv(512)
+                    if data[:1] == b"{":
+                        info = json.loads(data)
+                        break
+                    r, _, _ = select.select([self._sock], [], [], 1.0)   # 밀려 있던 seq 알림은 버림
+                else:
+                    info = None
+            except (FileNotFoundError, ConnectionRefusedError):
+                info = None
+            if info is not None:
+                break
+            if time.monotonic() > t_end:
+                raise TimeoutError(f"camera broker not responding at {path}")
+            time.sleep(0.2)
+        if info.get("error"):
+            raise RuntimeError(f"camera broker: {info['error']}")
+
+        with self._lock:
+            if info["pid"] != self.broker_pid:
+                self._detach()
+                self.shm = attach_shm(info["shm"])
+                self.w, self.h, self.slots = info["w"], info["h"], info["slots"]
+                self.frame_size = self.w * self.h * 3 // 2
+                self.mem = _Layout(self.shm.buf, self.w, self.h, self.slots, info["clients"])
+                self._views = []
+                for i in range(self.slots):
+                    v = self.mem.frames[i][:self.h] if self.gray_only else self.mem.frames[i]
+                    v = v.view()
+                    v.flags.writeable = False
+                    self._views.append(v)
+                self.broker_pid = info["pid"]
+            self.row = info["row"]
+            self.mem.pins[self.row] = 0
+            self._last = int(self.mem.hdr[_H_SEQ])
+        return info
+
+    def resubscribe(self, timeout=5.0):
+        return self._subscribe(timeout)
+
+    def _detach(self):
+        self.mem = None
+        self._views = []
+        if self.shm is not None:
+            try:
+                self.shm.close()
+            except BufferError:
+                pass   # 아직 뷰를 잡은 프레임이 있음 (브로커 재시작) → 프로세스 종료 시 해제
+            self.shm = None
+
+    @property
+    def seq(self):
+        """마지막으로 알림 받은 프레임 seq"""
+        return self._last
+
+    # ── 알림 수신 (reader 스레드에서 반복 호출)
+    def pump(self, timeout=1.0):
+        """새 프레임 알림을 기다림 → 있으면 대기자 깨우고 True, timeout 이면 False"""
+        r, _, _ = select.select([self._sock], [], [], timeout)
+        if not r:
+            return False
+        seq = 0
+        while True:   # 밀린 알림은 한꺼번에 (최신 seq 만)
+            try:
+                data = self._sock.recv(512, socket.MSG_DONTWAIT)
+            except BlockingIOError:
+                break
+            if len(data) == _SEQ.size:
+                seq = max(seq, _SEQ.unpack(data)[0])
+        if not seq:
+            return False
+        with self._lock:
+            self._last = max(self._last, seq)
+            self._new_frame.notify_all()
+        if self._on_publish is not None:
+            self._on_publish()
+        return True
+
+    # ── 소비자 쪽 (FrameRing 과 같음)
+    def _pin_latest(self):
+        # self._lock(스레드) + 프로세스 간 잠금: 브로커가 이 슬롯을 선점하기 전이면 고정, 후면 게시 전이라 seq=0
+        m = self.mem
+        with self._xlock:
+            i = int(m.hdr[_H_LATEST])
+            if i < 0 or int(m.seq[i]) == 0:
+                return None
+            m.pins[self.row, i] += 1
+            return RingFrame(self, i, int(m.seq[i]), float(m.ts[i]), self._views[i])
+
+    def latest(self):
+        with self._lock:
+            if self.mem is None:
+                return None
+            return self._pin_latest()
+
+    def wait_newer(self, after_seq, timeout=None):
+        with self._lock:
+            if not self._new_frame.wait_for(lambda: self._last > after_seq, timeout):
+                return None
+            f = self._pin_latest() if self.mem is not None else None
+        if f is not None and after_seq:
+            f.skipped = max(0, f.seq - after_seq - 1)
+        return f
+
+    def frame_at(self, slot, seq, ts):
+        f = RingFrame(self, slot, seq, ts, self._views[slot])
+        f._ring = None
+        return f
+
+    def _unpin(self, i):
+        with self._lock:
+            if self.mem is not None:
+                self.mem.pins[self.row, i] -= 1
+
+    def close(self):
+        try:
+            self._sock.sendto(f"unsub {self.row}".encode(), sock_path(self.name))
+        except OSError:
+            pass
+        self._sock.close()
+        with self._lock:
+            self._detach()
+            self._xlock.close()
+
+    def __str__(self):
+        return f"broker {self.name} {self.w}x{self.h} row={self.row}{' gray' if self.gray_only else ''}"
+
+
+def main():
+    ap = argparse.ArgumentParser(description="카메라 브로커 (rpicam-vid 하나 → 공유 메모리 링 + 여러 소비자)")
+    ap.add_argument("--source", default=os.environ.get("CAM_SOURCE", "rpicam"),
+                    help="rpicam[:N] | replay:/path.i420 | synthetic")
+    ap.add_argument("--width", type=int, default=int(os.environ.get("CAM_W", "640")))
+    ap.add_argument("--height", type=int, default=int(os.environ.get("CAM_H", "480")))
+    ap.add_argument("--fps", type=int, default=int(os.environ.get("CAM_FPS", "25")))
+    ap.add_argument("--slots", type=int, default=int(os.environ.get("CAM_BROKER_SLOTS", "8")),
+                    help="링 슬롯 수 (소비자들이 동시에 잡는 프레임 수 + 2 이상)")
+    ap.add_argument("--shutter", type=int, default=int(os.environ.get("CAM_SHUTTER", "20000")))
+    ap.add_argument("--gain", type=float, default=float(os.environ.get("CAM_GAIN", "1.0")))
+    ap.add_argument("--denoise", default=os.environ.get("CAM_DENOISE", "off"))
+    ap.add_argument("--name", default=BROKER_NAME)
+    args = ap.parse_args()
+
+    install_dump_signal()
+    broker = CameraBroker(args.source, args.width, args.height, args.fps, args.slots, args.name,
+                          shutter=args.shutter, gain=args.gain, denoise=args.denoise)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))   # atexit 로 공유 메모리/소켓 정리
+    try:
+        broker.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        broker.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+capture_index.py — 캡처 SQLite 인덱스 + 날짜별 샤드 압축 + 조회
+- captures 테이블: ts / day / session / label / cnt / conf / counts(JSON) / boxes(JSON) / path
+  CaptureWriter 워커가 add() 로 쌓고 batch 개 또는 flush_s 초마다 한 트랜잭션으로 커밋 (WAL)
+- 지난 날짜 폴더는 compact_day() 로 <root>/<day>.shard 하나에 이어 붙이고
+  (샤드, offset, size) 를 인덱스에 기록 + <day>.shard.idx (이름\\toffset\\tsize, DB 없이도 복구용)
+  → 낱개 파일/폴더는 삭제 (플래시에 작은 파일 수천 개 대신 하루 1개)
+  압축은 명시적으로만: CLI compact, 또는 CaptureWriter(compact_at=시각) 의 야간 작업 (기본 끔)
+  압축된 날짜의 imgPath(원래 경로)는 파일이 없음 → read_path(path) / `cat <path>` 로 샤드에서 꺼냄
+- 인덱스 이전 캡처(파일명만 있음)는 압축하면서 파일명을 파싱해 같이 등록
+- 조회: query(label=, session=, since=, min_conf=, ...) → 행, read(row) → JPEG 바이트 (낱개/샤드 무관)
+
+  python3 capture_index.py query --label cola --max-conf 0.5 --since 7d
+  python3 capture_index.py export review/ --label cola --since 7d
+  python3 capture_index.py compact            (오늘 이전 날짜 폴더 전부)
+  python3 capture_index.py cat /home/pi/kiosk_captures/20250101/120000_000_cola_cnt1_conf0.90.jpg > a.jpg
+  python3 capture_index.py stats
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+CAPTURE_ROOT = os.environ.get("CAPTURE_ROOT", "/home/pi/kiosk_captures")
+CAPTURE_INDEX = os.environ.get("CAPTURE_INDEX", os.path.join(CAPTURE_ROOT, "index.sqlite"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS captures (
+    id       INTEGER PRIMARY KEY,
+    ts       REAL NOT NULL,          -- epoch 초
+    day      TEXT NOT NULL,          -- YYYYMMDD (로컬)
+    session  TEXT,                   -- 멀티 카메라 레인 sessionId (단일이면 NULL)
+    label    TEXT NOT NULL,          -- 대표 클래스
+    cnt      INTEGER,
+    conf     REAL,
+    counts   TEXT,                   -- {name: count} JSON
+    boxes    TEXT,                   -- raw 모드: 박스 메타 JSON (사이드카 파일 대신)
+    mode     TEXT,                   -- annotated | raw | legacy
+    path     TEXT NOT NULL UNIQUE,   -- 원래 파일 경로 (imgPath)
+    shard    TEXT,                   -- 압축 후: root 기준 샤드 파일 이름
+    offset   INTEGER,
+    size     INTEGER
+);
+CREATE INDEX IF NOT EXISTS ix_captures_ts ON captures(ts);
+CREATE INDEX IF NOT EXISTS ix_captures_label_ts ON captures(label, ts);
+CREATE INDEX IF NOT EXISTS ix_captures_session_ts ON captures(session, ts);
+CREATE INDEX IF NOT EXISTS ix_captures_day ON captures(day);
+"""
+
+_COLS = ("ts", "day", "session", "label", "cnt", "conf", "counts", "boxes", "mode", "path")
+
+# make_filename(): HHMMSS_mmm_<label>_cnt<N>_conf<C>.jpg (멀티 카메라면 label 앞에 '<sid>_')
+_NAME_RE = re.compile(r"^(?P<hms>\d{6})_(?P<ms>\d{3})_(?P<label>.+)_cnt(?P<cnt>\d+)_conf(?P<conf>[\d.]+)\.jpg$")
+
+
+def parse_filename(day, name):
+    """파일명 → 인덱스 행 일부 (형식이 다르면 None)"""
+    m = _NAME_RE.match(name)
+    if not m:
+        return None
+    ts = datetime.strptime(day + m["hms"], "%Y%m%d%H%M%S").timestamp() + int(m["ms"]) / 1000.0
+    return {"ts": ts, "day": day, "label": m["label"], "cnt": int(m["cnt"]), "conf": float(m["conf"])}
+
+
+def parse_since(s):
+    """'7d' / '12h' / '30m' / 'YYYYMMDD' / epoch → epoch 초"""
+    if s is None:
+        return None
+    m = re.fullmatch(r"(\d+(?:\.\d+)?)([dhm])", s)
+    if m:
+        mult = {"d": 86400, "h": 3600, "m": 60}[m[2]]
+        return time.time() - float(m[1]) * mult
+    if re.fullmatch(r"\d{8}", s):
+        return datetime.strptime(s, "%Y%m%d").timestamp()
+    return float(s)
+
+
+class CaptureIndex:
+    """스레드마다 연결 하나 (sqlite3 연결은 스레드 간 공유 불가). add() 는 한 스레드(캡처 워커)에서만."""
+
+    def __init__(self, path=CAPTURE_INDEX, root=None, batch=32, flush_s=5.0):
+        self.path = path
+        self.root = root or os.path.dirname(os.path.abspath(path))
+        self.batch = max(1, int(batch))
+        self.flush_s = float(flush_s)
+        self._local = threading.local()
+        self._pending = []
+        self._pending_t = 0.0
+        os.makedirs(self.root, exist_ok=True)
+        with self._conn() as c:
+            c.executescript(_SCHEMA)
+
+    def _conn(self):
+        c = getattr(self._local, "conn", None)
+        if c is None:
+            c = sqlite3.connect(self.path, timeout=30)
+            c.row_factory = sqlite3.Row
+            c.execute("PRAGMA journal_mode=WAL")
+            c.execute("PRAGMA synchronous=NORMAL")   # WAL 이면 전원 차단에도 DB 는 일관, 마지막 커밋만 잃을 수 있음
+            self._local.conn = c
+        return c
+
+    # ── 쓰기 (batch 트랜잭션)
+    def add(self, ts, label, cnt, conf, path, session=None, counts=None, boxes=None, mode=None):
+        if not self._pending:
+            self._pending_t = time.monotonic()
+        day = datetime.fromtimestamp(ts).strftime("%Y%m%d")
+        self._pending.append((ts, day, session, label, cnt, conf,
+                              json.dumps(counts, ensure_ascii=False) if counts is not None else None,
+                              json.dumps(boxes, ensure_ascii=False) if boxes is not None else None,
+                              mode, path))
+        if len(self._pending) >= self.batch:
+            self.flush()
+
+    def due(self):
+        """대기 중인 행이 flush_s 보다 오래됐으면 True (워커가 큐 대기 타임아웃에 확인)"""
+        return bool(self._pending) and time.monotonic() - self._pending_t >= self.flush_s
+
+    def flush(self):
+        if not self._pending:
+            return 0
+        rows, self._pending = self._pending, []
+        c = self._conn()
+        with c:
+            c.executemany(f"INSERT OR IGNORE INTO captures ({','.join(_COLS)}) VALUES ({','.join('?' * len(_COLS))})",
+                          rows)
+        return len(rows)
+
+    def forget(self, paths):
+        """낱개 파일이 지워졌을 때 (하루 용량 회전)"""
+        c = self._conn()
+        with c:
+            c.executemany("DELETE FROM captures WHERE path = ?", [(p,) for p in paths])
+
+    def purge_before(self, day):
+        """day(YYYYMMDD) 이전 행 삭제 + 해당 샤드 파일 삭제"""
+        c = self._conn()
+        shards = [r[0] for r in c.execute("SELECT DISTINCT shard FROM captures WHERE day < ? AND shard IS NOT NULL",
+                                          (day,))]
+        with c:
+            c.execute("DELETE FROM captures WHERE day < ?", (day,))
+        for s in shards:
+            for p in (os.path.join(self.root, s), os.path.join(self.root, s + ".idx")):
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+        return len(shards)
+
+    # ── 조회
+    def query(self, label=None, session=None, since=None, until=None, min_conf=None, max_conf=None,
+              day=None, mode=None, limit=100, newest_first=True):
+        where, args = [], []
+        for col, op, v in (("label", "=", label), ("session", "=", session), ("ts", ">=", since),
+                           ("ts", "<", until), ("conf", ">=", min_conf), ("conf", "<", max_conf),
+                           ("day", "=", day), ("mode", "=", mode)):
+            if v is not None:
+                where.append(f"{col} {op} ?")
+                args.append(v)
+        sql = "SELECT * FROM captures"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY ts {'DESC' if newest_first else 'ASC'}"
+        if limit:
+            sql += " LIMIT ?"
+            args.append(int(limit))
+        return [dict(r) for r in self._conn().execute(sql, args)]
+
+    def read(self, row):
+        """행 → JPEG 바이트 (압축 전이면 낱개 파일, 후면 샤드에서 offset 으로)"""
+        if row.get("shard"):
+            with open(os.path.join(self.root, row["shard"]), "rb") as f:
+                f.seek(row["offset"])
+                return f.read(row["size"])
+        with open(row["path"], "rb") as f:
+            return f.read()
+
+    def read_path(self, path):
+        """imgPath(원래 파일 경로) → JPEG 바이트. 압축됐으면 샤드에서, 아니면 파일에서 (인덱스에 없어도)"""
+        r = self._conn().execute("SELECT * FROM captures WHERE path = ?", (path,)).fetchone()
+        if r is not None:
+            return self.read(dict(r))
+        with open(path, "rb") as f:
+            return f.read()
+
+    def stats(self):
+        c = self._conn()
+        per_day = c.execute("SELECT day, COUNT(*), SUM(shard IS NOT NULL), COUNT(DISTINCT label) "
+                            "FROM captures GROUP BY day ORDER BY day").fetchall()
+        top = c.execute("SELECT label, COUNT(*) n FROM captures GROUP BY label ORDER BY n DESC LIMIT 10").fetchall()
+        return [tuple(r) for r in per_day], [tuple(r) for r in top]
+
+    # ── 압축 (지난 날짜 폴더 → 샤드 1개)
+    def compact_day(self, day):
+        """
+        <root>/<day>/ 의 파일을 <root>/<day>.shard 에 이어 붙이고 인덱스에 offset 기록 후 폴더 삭제.
+        반환: 압축한 jpg 수 (폴더 없으면 0)
+        """
+        ddir = os.path.join(self.root, day)
+        if not os.path.isdir(ddir):
+            return 0
+        files = sorted((e for e in os.scandir(ddir) if e.is_file() and e.name.endswith((".jpg", ".json"))),
+                       key=lambda e: e.name)
+        name = f"{day}.shard"
+        k = 1
+        while os.path.exists(os.path.join(self.root, name)):   # 중간에 끊긴 이전 압축이 있으면 새 이름
+            name = f"{day}-{k}.shard"
+            k += 1
+        shard = os.path.join(self.root, name)
+
+        entries, sidecars = [], {}
+        tmp = shard + ".tmp"
+        with open(tmp, "wb") as out:
+            for e in files:
+                with open(e.path, "rb") as f:
+                    data = f.read()
+                if e.name.endswith(".json"):
+                    # 인덱스 이전 raw 캡처의 박스 사이드카 → boxes 컬럼으로 (샤드엔 안 넣음)
+                    sidecars[e.name[:-5]] = data.decode("utf-8", "replace")
+                    continue
+                entries.append((e.path, e.name, out.tell(), len(data)))
+                out.write(data)
+            out.flush()
+            os.fsync(out.fileno())
+        with open(shard + ".idx.tmp", "w", encoding="utf-8") as f:
+            f.writelines(f"{n}\t{off}\t{size}\n" for _, n, off, size in entries)
+        os.replace(tmp, shard)
+        os.replace(shard + ".idx.tmp", shard + ".idx")
+
+        c = self._conn()
+        with c:
+            for path, fn, off, size in entries:
+                cur = c.execute("UPDATE captures SET shard=?, offset=?, size=? WHERE path=?", (name, off, size, path))
+                if cur.rowcount:
+                    continue
+                meta = parse_filename(day, fn) or {"ts": os.path.getmtime(path), "day": day,
+                                                  "label": "?", "cnt": None, "conf": None}
+                boxes = sidecars.get(fn[:-4])
+                c.execute(f"INSERT INTO captures (ts, day, label, cnt, conf, boxes, mode, path, shard, offset, size) "
+                          f"VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+                          (meta["ts"], day, meta["label"], meta["cnt"], meta["conf"], boxes,
+                           "raw" if boxes else "legacy", path, name, off, size))
+        shutil.rmtree(ddir, ignore_errors=True)
+        return len(entries)
+
+    def compact_before(self, day=None):
+        """day(기본 오늘) 이전의 날짜 폴더 전부 압축 → [(day, 파일 수)]"""
+        day = day or datetime.now().strftime("%Y%m%d")
+        done = []
+        for e in sorted(os.scandir(self.root), key=lambda e: e.name):
+            if e.is_dir() and e.name.isdigit() and len(e.name) == 8 and e.name < day:
+                done.append((e.name, self.compact_day(e.name)))
+        return done
+
+
+def main():
+    ap = argparse.ArgumentParser(description="캡처 인덱스 조회/압축")
+    ap.add_argument("--index", default=CAPTURE_INDEX)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    def filters(p):
+        p.add_argument("--label")
+        p.add_argument("--session")
+        p.add_argument("--since", help="7d | 12h | YYYYMMDD | epoch")
+        p.add_argument("--until")
+        p.add_argument("--min-conf", type=float)
+        p.add_argument("--max-conf", type=float)
+        p.add_argument("--day")
+        p.add_argument("--mode", choices=("annotated", "raw", "legacy"))
+        p.add_argument("--limit", type=int, default=100)
+
+    filters(sub.add_parser("query", help="조건에 맞는 캡처 목록"))
+    p = sub.add_parser("export", help="조건에 맞는 캡처를 폴더로 꺼내기 (리뷰/재학습)")
+    p.add_argument("out")
+    filters(p)
+    p = sub.add_parser("compact", help="지난 날짜 폴더 → 샤드")
+    p.add_argument("--day", help="이 날짜만 (기본: 오늘 이전 전부)")
+    sub.add_parser("stats", help="날짜별 개수 / 상위 라벨")
+    p = sub.add_parser("cat", help="imgPath → JPEG 바이트를 stdout 으로 (압축된 날짜도)")
+    p.add_argument("path")
+    args = ap.parse_args()
+
+    idx = CaptureIndex(args.index)
+    if args.cmd == "cat":
+        sys.stdout.buffer.write(idx.read_path(args.path))
+        return
+    if args.cmd == "compact":
+        done = [(args.day, idx.compact_day(args.day))] if args.day else idx.compact_before()
+        for day, n in done:
+            print(f"{day}: {n} files → shard")
+        return
+    if args.cmd == "stats":
+        per_day, top = idx.stats()
+        for day, n, sharded, labels in per_day:
+            print(f"{day} {n:>6} captures  {'sharded' if sharded == n else f'{sharded} sharded'}  {labels} labels")
+        print("top:", ", ".join(f"{l}={n}" for l, n in top))
+        return
+
+    rows = idx.query(label=args.label, session=args.session, since=parse_since(args.since),
+                     until=parse_since(args.until), min_conf=args.min_conf, max_conf=args.max_conf,
+                     day=args.day, mode=args.mode, limit=args.limit)
+    if args.cmd == "query":
+        for r in rows:
+            where = f"{r['shard']}@{r['offset']}" if r["shard"] else r["path"]
+            t = datetime.fromtimestamp(r["ts"]).strftime("%Y-%m-%d %H:%M:%S")
+            print(f"{r['id']:>7} {t} {r['session'] or '-':>8} {r['label']:>16} cnt={r['cnt']} "
+                  f"conf={r['conf'] or 0:.2f} {where}")
+        print(f"{len(rows)} rows")
+        return
+
+    os.makedirs(args.out, exist_ok=True)
+    for r in rows:
+        name = f"{r['day']}_{os.path.basename(r['path'])}"   # 파일명엔 시각만 있어 날짜를 붙임
+        with open(os.path.join(args.out, name), "wb") as f:
+            f.write(idx.read(r))
+        if r["boxes"]:
+            with open(os.path.join(args.out, name[:-4] + ".json"), "w", encoding="utf-8") as f:
+                f.write(r["boxes"])
+    print(f"exported {len(rows)} captures → {args.out}")
+
+
+if __name__ == "__main__":
+    main()
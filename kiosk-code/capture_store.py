@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+capture_store.py — 검출 캡처 저장 (백그라운드)
+- 추론 스레드는 경로만 정하고 바로 반환 (imgPath 즉시 사용 가능), 실제 인코딩/쓰기는 워커 스레드
+- 큐가 가득 차면 저장을 포기(drop)하고 None 반환 → 검출 이벤트가 SD 카드 쓰기를 기다리지 않음
+- 원본 I420 프레임(raw)을 받으면 전체 해상도로 저장하고 박스를 원본 좌표로 옮김 (ROI 크롭이어도 프레임 전체)
+  YUV→BGR 변환/박스 그리기도 워커에서. raw 가 없으면 모델 입력(크롭) 그대로
+- mode="annotated" : 박스 그린 JPEG
+  mode="raw"       : 카메라 원본 프레임(보정/크롭/축소 전) JPEG + 박스 메타데이터 JSON (학습/리뷰용)
+                     메타에 roi/모델 입력 크기 기록
+- 하루 용량 한도 초과 시 그날 가장 오래된 파일부터 삭제, keep_days 지난 날짜 폴더 삭제
+- index 경로가 있으면 저장마다 SQLite 인덱스에 행 추가 (batch 트랜잭션, raw 박스 JSON 도 boxes 컬럼에)
+- 지난 날짜 압축은 opt-in (compact_at=시각): 매일 그 시각에 compact_after_days 일 지난 날짜 폴더만 샤드로
+
+디스크 구조
+  <root>/<YYYYMMDD>/<HHMMSS_mmm>_<label>_cnt<N>_conf<C>.jpg (+ raw 모드면 같은 이름 .json)   ← imgPath
+  <root>/index.sqlite                                    ← 인덱스 (index="" 면 없음)
+  압축 후: <root>/<YYYYMMDD>.shard + .shard.idx, 그 날짜 폴더는 삭제
+    → 그 날의 imgPath 는 파일로 못 열고 인덱스로 찾음: CaptureIndex.read_path(imgPath) / capture_index.py cat <imgPath>
+    (최근 compact_after_days 일은 낱개 파일 그대로라 방금 보낸 imgPath 는 계속 열림)
+"""
+
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta
+
+import cv2
+
+from capture_index import CAPTURE_INDEX, CAPTURE_ROOT, CaptureIndex
+from detectors import draw_detections
+from kiosk_log import get_logger
+
+log = get_logger("capture")
+
+
+def ensure_day_dir(root=CAPTURE_ROOT):
+    day = datetime.now().strftime("%Y%m%d")
+    base = os.path.join(root, day)
+    os.makedirs(base, exist_ok=True)
+    return base
+
+
+def make_filename(label, cnt, conf):
+    ts = datetime.now().strftime("%H%M%S_%f")[:-3]
+    return f"{ts}_{label}_cnt{cnt}_conf{conf:.2f}.jpg"
+
+
+class CaptureWriter:
+    def __init__(self, root=CAPTURE_ROOT, mode="annotated", qlen=8, jpeg_quality=90,
+                 day_quota_mb=500, keep_days=30, metrics=None, index=CAPTURE_INDEX,
+                 compact_at=None, compact_after_days=7):
+        self.root = root
+        self._metrics = metrics
+        self.mode = mode
+        self.jpeg_quality = int(jpeg_quality)
+        self.day_quota = int(day_quota_mb * 1024 * 1024) if day_quota_mb > 0 else 0
+        self.keep_days = int(keep_days)
+
+        self._q = queue.Queue(maxsize=max(1, int(qlen)))
+        self.dropped = 0
+        self.written = 0
+
+        # 날짜 폴더는 날짜가 바뀔 때만 만든다 (매번 makedirs 안 함)
+        self._day = None
+        self._day_dir = None
+        self._acct_dir = None   # 용량 계산 중인 폴더 (워커 전용, _day_bytes 와 함께)
+        self._day_bytes = 0
+
+        # SQLite 인덱스 (연결은 워커 스레드에서 열림)
+        self.index = None
+        if index:
+            try:
+                self.index = CaptureIndex(index, root=root)
+            except Exception as e:
+                log.warn("[IMG] index disabled: %s", e)
+
+        threading.Thread(target=self._worker, daemon=True).start()
+
+        # 지난 날짜 압축 (opt-in, 인덱스 필요): 매일 compact_at 시에 한 번
+        self.compact_at = compact_at
+        self.compact_after_days = max(1, int(compact_after_days))
+        if compact_at is not None:
+            if self.index is None:
+                log.warn("[IMG] compaction needs the index → off")
+            else:
+                threading.Thread(target=self._compact_loop, daemon=True).start()
+
+    def _current_dir(self):
+        day = datetime.now().strftime("%Y%m%d")
+        if day != self._day:
+            self._day_dir = ensure_day_dir(self.root)
+            self._day = day
+        return self._day_dir
+
+    def submit(self, label, cnt, conf, img, dets, names, base_wh, session=None, counts=None,
+               raw=None, roi=None):
+        """
+        저장 예약. 바로 쓸 경로(또는 drop 시 None) 반환 (session = 멀티 카메라 레인, 파일명 접두)
+        img/dets = 모델 입력(크롭 base_wh 를 축소)과 그 좌표의 박스, raw = 원본 I420 프레임, roi = 크롭 영역
+        """
+        ts = time.time()
+        try:
+            name = make_filename(f"{session}_{label}" if session else label, cnt, conf)
+            path = os.path.join(self._current_dir(), name)
+        except Exception as e:
+            log.warn("[IMG] save failed: %s", e, key="img_save_err", every=10.0)
+            return None
+        try:
+            # img/raw 는 재사용 버퍼·링 슬롯일 수 있으므로 복사본을 넘김 (검출 이벤트 때만)
+            full = raw is not None
+            src = raw.copy() if full else img.copy()
+            self._q.put_nowait((path, src, dets, names, (base_wh, img.shape[1::-1], roi, full),
+                                (ts, label, cnt, conf, session, counts)))
+        except queue.Full:
+            self.dropped += 1
+            return None
+        return path
+
+    # ── 워커
+    def _worker(self):
+        while True:
+            try:
+                # 인덱스에 대기 행이 있으면 flush_s 안에 깨어나 커밋
+                job = self._q.get(timeout=self.index.flush_s if self.index is not None and self.index._pending else None)
+            except queue.Empty:
+                self._flush_index()
+                continue
+            path, img, dets, names, geom, info = job
+            try:
+                t0 = time.perf_counter()
+                size, meta = self._write(path, img, dets, names, geom)
+                if self._metrics is not None:
+                    self._metrics.observe("capture_save", t0)
+                self.written += 1
+                if self.index is not None:
+                    ts, label, cnt, conf, session, counts = info
+                    self.index.add(ts, label, cnt, conf, path, session=session, counts=counts,
+                                   boxes=meta, mode=self.mode)
+                self._account(os.path.dirname(path), size)
+            except Exception as e:
+                log.warn("[IMG] save failed: %s", e, key="img_save_err", every=10.0)
+            if self.index is not None and self.index.due():
+                self._flush_index()
+
+    def _flush_index(self):
+        try:
+            self.index.flush()
+        except Exception as e:
+            log.warn("[IMG] index flush failed: %s", e, key="img_index_err", every=10.0)
+
+    def _write(self, path, img, dets, names, geom):
+        """→ (쓴 바이트, raw 박스 메타 또는 None)"""
+        params = [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality]
+        (cw, ch), (iw, ih), roi, full = geom
+        if full:
+            # 원본 I420 → 전체 해상도 BGR, 박스는 모델 입력(크롭 축소) 좌표 → 원본 프레임 좌표
+            img = cv2.cvtColor(img, cv2.COLOR_YUV2BGR_I420)
+            ox, oy = roi[:2] if roi else (0, 0)
+            sx, sy = cw / iw, ch / ih
+            dets = dets._replace(xyxy=dets.xyxy * (sx, sy, sx, sy) + (ox, oy, ox, oy))
+
+        if self.mode == "raw":
+            cv2.imwrite(path, img, params)
+            h, w = img.shape[:2]
+            meta = {
+                "imgSize": [w, h],          # 저장 이미지 크기 (원본 프레임, 없었으면 모델 입력), 박스 좌표 기준
+                "inputSize": [iw, ih],      # 모델 입력 크기 (크롭을 축소)
+                "roi": list(roi) if roi else None,
+                "boxes": [
+                    {"cls": names.get(c, str(c)), "conf": round(s, 4), "xyxy": [round(v, 1) for v in b]}
+                    for c, s, b in zip(dets.cls.tolist(), dets.conf.tolist(), dets.xyxy.tolist())
+                ],
+            }
+            # 인덱스가 있어도 사이드카는 씀 (폴더만 보는 도구/스크립트가 그대로 동작)
+            side = os.path.splitext(path)[0] + ".json"
+            with open(side, "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+            return os.path.getsize(path) + os.path.getsize(side), meta
+
+        ann = draw_detections(img, dets, names)
+        if not full:
+            ann = cv2.resize(ann, (cw, ch))
+        cv2.imwrite(path, ann, params)
+        return os.path.getsize(path), None
+
+    # ── 용량 관리 (워커 스레드 전용: _acct_dir/_day_bytes 는 submit 쪽에서 건드리지 않음)
+    def _account(self, day_dir, size):
+        if day_dir != self._acct_dir:
+            # 날짜가 바뀐 뒤 첫 저장 (큐는 순서대로라 지난 날짜 작업은 더 오지 않음) → 실제 사용량 계산
+            self._acct_dir = day_dir
+            self._day_bytes = sum(e.stat().st_size for e in os.scandir(day_dir) if e.is_file())
+            self._purge_old_days()
+        else:
+            self._day_bytes += size
+        if self.day_quota and self._day_bytes > self.day_quota:
+            self._rotate(day_dir)
+
+    def _rotate(self, day_dir):
+        # 파일명이 HHMMSS_ms 로 시작 → 이름순 = 시간순. 한도의 90% 까지 오래된 것부터 삭제
+        target = int(self.day_quota * 0.9)
+        files = [e for e in os.scandir(day_dir) if e.is_file()]
+        removed = []
+        for e in sorted(files, key=lambda e: e.name):
+            if self._day_bytes <= target:
+                break
+            try:
+                sz = e.stat().st_size
+                os.remove(e.path)
+                self._day_bytes -= sz
+                removed.append(e.path)
+            except OSError:
+                pass
+        if self.index is not None and removed:
+            self._flush_index()
+            self.index.forget(removed)
+        log.info("[IMG] day quota rotate → %dMB", self._day_bytes // (1024 * 1024), key="img_rotate", every=60.0)
+
+    def _purge_old_days(self):
+        if self.keep_days <= 0:
+            return
+        cutoff = (datetime.now() - timedelta(days=self.keep_days)).strftime("%Y%m%d")
+        if self.index is not None:
+            n = self.index.purge_before(cutoff)
+            if n:
+                log.info("[IMG] purge %d shards before %s", n, cutoff)
+        for e in os.scandir(self.root):
+            if e.is_dir() and e.name.isdigit() and len(e.name) == 8 and e.name < cutoff:
+                shutil.rmtree(e.path, ignore_errors=True)
+                log.info("[IMG] purge old day %s", e.name)
+
+    # ── 지난 날짜 압축 (opt-in, 매일 compact_at 시)
+    def _compact_loop(self):
+        try:
+            os.nice(10)   # 검출/송신보다 뒤로 (이 스레드만)
+        except (AttributeError, OSError):
+            pass
+        while True:
+            now = datetime.now()
+            at = now.replace(hour=int(self.compact_at), minute=0, second=0, microsecond=0)
+            if at <= now:
+                at += timedelta(days=1)
+            time.sleep((at - now).total_seconds())
+            self.compact_now()
+
+    def compact_now(self):
+        """compact_after_days 일 지난 날짜 폴더 → 샤드 (최근 며칠은 낱개 파일로 남김)"""
+        cutoff = (datetime.now() - timedelta(days=self.compact_after_days)).strftime("%Y%m%d")
+        try:
+            for day, n in self.index.compact_before(cutoff):
+                log.info("[IMG] compact %s: %d files → shard", day, n)
+        except Exception as e:
+            log.warn("[IMG] compact failed: %s", e)
@@ -7,9 +7,22 @@ from collections import deque
 
 import numpy as np
 import cv2
-from ultralytics import YOLO
 import websocket  # pip install websocket-client
-import re
+
+from frame_ring import FrameRing
+from vision_pipeline import VisionPipeline
+from vision_workers import WorkerPool
+from detectors import load_detector
+from det_aggregate import Aggregator
+from motion import MotionGate
+from capture_store import CaptureWriter
+from tracker import Tracker
+from vision_metrics import Metrics, serve_metrics
+from kiosk_log import get_logger, install_dump_signal
+from frame_source import open_source
+from camera_broker import BROKER_NAME, BrokerClient
+from basket_roi import parse_roi, calibrate_roi, load_reference
+from enhance import Enhancer
 
 # ─────────────────────────────────────────────
 # 설정값
@@ -17,18 +30,69 @@ import re
 WS_URL              = os.environ.get("WS_URL", "ws://localhost:3000")
 OV_MODEL_DIR        = os.environ.get("OV_MODEL_DIR", "/home/pi/Desktop/detect/finetune_my53/weights/best_openvino_model")
 MODEL_IMG           = int(os.environ.get("MODEL_IMG", "640"))
+DETECTOR_BACKEND    = os.environ.get("DETECTOR_BACKEND", "openvino")  # openvino | ultralytics(torch 필요, 폴백)
+OV_DEVICE           = os.environ.get("OV_DEVICE", "CPU")
+OV_CACHE_DIR        = os.environ.get("OV_CACHE_DIR", "/home/pi/.cache/kiosk_ov")  # 컴파일 blob 캐시 ("" = 끔)
+BOOT_PARALLEL       = os.environ.get("BOOT_PARALLEL", "1") == "1"  # 카메라/WS/모델을 부팅 즉시 동시에 시작
 
 PRIMARY_CONF        = float(os.environ.get("PRIMARY_CONF", "0.12"))   # 모델 내부 conf
 IOU_THRESHOLD       = float(os.environ.get("IOU_THRESHOLD", "0.6"))
 CONF_THRESHOLD      = float(os.environ.get("CONF_THRESHOLD", "0.15")) # 후단 필터링 conf
 DETECTION_THRESHOLD = int(os.environ.get("DETECTION_THRESHOLD", "1")) # 안정 프레임 임계 (no-still 모드라도 프레임 내 안정성)
 APPLY_LIGHT_ENHANCE = os.environ.get("APPLY_LIGHT_ENHANCE", "1") == "1"
+# legacy = 기존 보정과 출력 동일 (기본). fused/luma 는 모델 입력이 달라지므로 검증 후 명시적으로 켬
+ENHANCE_MODE        = os.environ.get("ENHANCE_MODE", "legacy" if APPLY_LIGHT_ENHANCE else "off")  # off | legacy | fused | luma
+ENHANCE_AMOUNT      = float(os.environ.get("ENHANCE_AMOUNT", "0.6"))   # 언샤프 강도
+ENHANCE_TAPS        = int(os.environ.get("ENHANCE_TAPS", "3"))         # 3 = 십자 커널 1패스 | 5 = 5×5 블러+가중합
+ENHANCE_SKIP_SHARPNESS = float(os.environ.get("ENHANCE_SKIP_SHARPNESS", "0"))  # Laplacian 분산 ≥ 이면 보정 생략 (0=항상)
+
+# ---- 파이프라인(전처리 → OpenVINO 비동기 추론 → 후처리) ----
+PIPELINE_ENABLE     = os.environ.get("PIPELINE", "1") == "1"
+OV_PERF_HINT        = os.environ.get("OV_PERF_HINT", "THROUGHPUT")   # THROUGHPUT | LATENCY
+OV_INFER_REQUESTS   = int(os.environ.get("OV_INFER_REQUESTS", "0"))  # 동시 추론 요청 수 (0=장치 최적값)
+PIPE_QUEUE_LEN      = int(os.environ.get("PIPE_QUEUE_LEN", "2"))     # 단계별 큐 길이 (넘치면 오래된 것 버림)
+
+# ---- 멀티 프로세스 워커: 프레임은 공유 메모리 링, 워커 N 개가 변환~NMS, 이 프로세스는 WS/집계만 ----
+WORKERS             = int(os.environ.get("WORKERS", "0"))            # 0 = 끔 (스레드 파이프라인/동기)
+WORKER_THREADS      = int(os.environ.get("WORKER_THREADS", "0"))     # 워커당 OpenVINO 스레드 (0 = 코어 수 / WORKERS)
 
 SAVE_IMAGES         = os.environ.get("SAVE_IMAGES", "1") == "1"
 JPEG_QUALITY        = int(os.environ.get("JPEG_QUALITY", "90"))
+CAPTURE_MODE        = os.environ.get("CAPTURE_MODE", "annotated")    # annotated | raw(원본 프레임+박스/roi JSON)
+CAPTURE_QUEUE       = int(os.environ.get("CAPTURE_QUEUE", "8"))       # 저장 대기 큐 (가득 차면 저장 생략)
+CAPTURE_DAY_QUOTA_MB = float(os.environ.get("CAPTURE_DAY_QUOTA_MB", "500"))  # 하루 용량 한도 (0=무제한)
+CAPTURE_KEEP_DAYS   = int(os.environ.get("CAPTURE_KEEP_DAYS", "30"))  # 지난 날짜 폴더 보관 일수 (0=무제한)
+CAPTURE_COMPACT_AT  = os.environ.get("CAPTURE_COMPACT_AT", "")      # "" = 압축 안 함 (기본) | 0~23: 매일 이 시각에 지난 날짜 폴더 → 샤드
+CAPTURE_COMPACT_AFTER = int(os.environ.get("CAPTURE_COMPACT_AFTER", "7"))  # 이 일수 지난 날짜만 압축 (최근 imgPath 는 파일 그대로)
+
+# ---- 바구니 ROI: 이 영역만 잘라 letterbox → 작은 MODEL_IMG 로도 같은 정확도 ----
+BASKET_ROI          = os.environ.get("BASKET_ROI", "")       # "" = 전체 | x,y,w,h (픽셀 또는 0~1 비율) | auto
+BASKET_ROI_REF      = os.environ.get("BASKET_ROI_REF", "/home/pi/kiosk_basket_ref.png")  # auto 기준(빈 바구니) 이미지
+BASKET_ROI_MARGIN   = float(os.environ.get("BASKET_ROI_MARGIN", "0.04"))
+ROI_CALIB_FRAME     = int(os.environ.get("ROI_CALIB_FRAME", "15"))  # auto + 기준 없음: 이 프레임(AE 안정) 이후, 검출 0개인 프레임으로 보정
+
+# ---- 모션 게이트: 장면 변화 없으면 추론 생략(직전 결과 유지, 안정화는 새 추론만) ----
+MOTION_GATE         = os.environ.get("MOTION_GATE", "1") == "1"
+MOTION_DOWNSCALE    = int(os.environ.get("MOTION_DOWNSCALE", "8"))       # Y 평면 축소 배율
+MOTION_THRESHOLD    = float(os.environ.get("MOTION_THRESHOLD", "3.0"))   # mean abs diff (0..255)
+MOTION_REFRESH_N    = int(os.environ.get("MOTION_REFRESH_N", "10"))      # 연속 생략 N 프레임마다 강제 추론
+
+# ---- 추적기(옵션): 트랙 단위 클래스 투표로 개수 안정화 → 더 적은 프레임으로 최종 확정 ----
+TRACKER_ENABLE      = os.environ.get("TRACKER", "0") == "1"
+TRACK_IOU           = float(os.environ.get("TRACK_IOU", "0.3"))
+TRACK_HIGH_CONF     = float(os.environ.get("TRACK_HIGH_CONF", "0.4"))     # 1단계 매칭 (이 미만은 기존 트랙 유지용 2단계)
+TRACK_BIRTH_CONF    = float(os.environ.get("TRACK_BIRTH_CONF", str(CONF_THRESHOLD)))  # 새 트랙 생성 하한 (기본 = 후단 conf)
+TRACK_MIN_HITS      = int(os.environ.get("TRACK_MIN_HITS", "2"))         # 트랙 확정 최소 매칭 수
+TRACK_MAX_AGE       = int(os.environ.get("TRACK_MAX_AGE", "8"))          # 안 보여도 유지할 업데이트 수
+TRACK_STABLE_FRAMES = int(os.environ.get("TRACK_STABLE_FRAMES", "4"))    # 추적 개수 연속 동일 → final
+TRACK_MIN_PURITY    = float(os.environ.get("TRACK_MIN_PURITY", "0.6"))   # 트랙 클래스 투표 집중도 하한
+
+# ---- 계측: 단계별 지연 p50/p95/p99 + 드롭 카운터 ----
+METRICS_ADDR        = os.environ.get("METRICS_ADDR", "")   # "" = 끔 (기본) | host:port (예: 127.0.0.1:9110) | unix:/path
+VISION_STATS_PERIOD_S = float(os.environ.get("VISION_STATS_PERIOD_S", "0"))  # >0 이면 visionStats WS 주기 송신
 
-LOOP_SLEEP_S        = float(os.environ.get("LOOP_SLEEP_S", "0.02"))   # 메인루프 쉼
 HB_PERIOD_S         = float(os.environ.get("HB_PERIOD_S", "1.0"))     # 하트비트 주기
+LOOP_SLEEP_S        = os.environ.get("LOOP_SLEEP_S")   # 더 이상 안 씀 (메인 루프는 프레임 게시/상태 변화에 깨어남), 설정돼 있으면 경고만
 
 CAM_W               = int(os.environ.get("CAM_W", "640"))
 CAM_H               = int(os.environ.get("CAM_H", "480"))
@@ -36,6 +100,16 @@ CAM_FPS             = int(os.environ.get("CAM_FPS", "25"))
 CAM_SHUTTER         = int(os.environ.get("CAM_SHUTTER", "20000"))
 CAM_GAIN            = float(os.environ.get("CAM_GAIN", "1.0"))
 CAM_DENOISE         = os.environ.get("CAM_DENOISE", "off")
+FRAME_RING_SLOTS    = int(os.environ.get("FRAME_RING_SLOTS", "4"))  # 프레임 링 슬롯 수(>=3)
+CAM_SOURCE          = os.environ.get("CAM_SOURCE", "rpicam")  # rpicam | replay:/path.i420 | synthetic[:N] | broker[:이름]
+CAM_BROKER_FPS      = float(os.environ.get("CAM_BROKER_FPS", "0"))  # broker 소스: 알림 fps (0 = 모든 프레임)
+CAM_REPLAY_REALTIME = os.environ.get("CAM_REPLAY_REALTIME", "1") == "1"  # 0 = 최대 속도 재생
+CAM_REPLAY_LOOP     = os.environ.get("CAM_REPLAY_LOOP", "0") == "1"
+CAM_RECORD          = os.environ.get("CAM_RECORD", "")  # 경로 지정 시 받은 raw I420 을 그대로 녹화 (카메라 열 때마다 덮어씀)
+
+# ---- 멀티 카메라: 컨트롤러 하나가 카메라 N 대(레인) 를 맡고 모델은 한 벌만 공유 ----
+CAMERAS             = os.environ.get("CAMERAS", "")  # "" = 단일(CAM_SOURCE) | "lane1=rpicam:0,lane2=rpicam:1" (이름 = Node sessionId)
+BATCH_INFER         = os.environ.get("BATCH_INFER", "1") == "1"  # 레인별 새 프레임을 batch=N 한 번에 추론 (0 = 파이프라인/개별)
 
 # ---- one-shot / stopVision 종료 옵션 ----
 ONE_SHOT = os.environ.get("ONE_SHOT", "1") == "1"             # 기본 ON (요청하신대로)
@@ -45,27 +119,123 @@ EXIT_ON_STOPVISION = os.environ.get("EXIT_ON_STOPVISION", "1") == "1"  # 기본
 # ─────────────────────────────────────────────
 # 유틸
 # ─────────────────────────────────────────────
+log = get_logger("controller")
+
+def parse_cameras(spec):
+    """'sid=source,sid=source' → [(sid, source)]. 빈 문자열이면 단일 카메라 [(None, CAM_SOURCE)]"""
+    lanes = []
+    for part in filter(None, (p.strip() for p in (spec or "").split(","))):
+        sid, eq, src = part.partition("=")
+        if not eq or not sid.strip():
+            raise ValueError(f"CAMERAS entry must be sid=source: {part!r}")
+        lanes.append((sid.strip(), src.strip()))
+    if len({sid for sid, _ in lanes}) != len(lanes):
+        raise ValueError(f"duplicate sessionId in CAMERAS: {spec!r}")
+    return lanes or [(None, CAM_SOURCE)]
+
 def now_iso(with_tz=True):
     if with_tz:
         return datetime.now(timezone.utc).isoformat(timespec="milliseconds")
     return datetime.utcnow().replace(tzinfo=timezone.utc).isoformat(timespec="milliseconds")
 
-def ensure_day_dir():
-    day = datetime.now().strftime("%Y%m%d")
-    base = f"/home/pi/kiosk_captures/{day}"
-    os.makedirs(base, exist_ok=True)
-    return base
+# ─────────────────────────────────────────────
+# 레인: 카메라 한 대 분의 상태 (프레임 링 / ROI / 모션 게이트 / 추적기 / 안정화)
+# ─────────────────────────────────────────────
+class Lane:
+    def __init__(self, index, sid, source, slots, on_publish=None):
+        self.index = index
+        self.sid = sid              # Node sessionId (단일 카메라면 None → 이벤트에 안 붙임)
+        self.source = source
+        self.active = True          # 멀티 카메라: 해당 세션 stopVision 이면 이 레인만 멈춤
+        # broker[:이름] = camera_broker 프로세스의 공유 메모리 링에 붙음 (해상도/슬롯 수는 브로커 설정)
+        self.broker = source.startswith("broker")
+        if self.broker:
+            self.frames = BrokerClient(source.partition(":")[2] or BROKER_NAME, fps=CAM_BROKER_FPS,
+                                       on_publish=on_publish)
+            if self.frames.slots < slots:
+                log.warn("[CAM]%s broker slots=%d < %d needed (CAM_BROKER_SLOTS)", self.tag, self.frames.slots, slots)
+        else:
+            self.frames = FrameRing(CAM_W, CAM_H, slots=slots, on_publish=on_publish, shared=WORKERS > 0)
+        fw, fh = self.frames.w, self.frames.h
+        self.cam_source = None
+        self.cam_proc = None
+        self.cam_thread = None
+        self._last_seen_seq = 0
+
+        # 바구니 ROI (레인별 BASKET_ROI_<sid> 가 있으면 우선, 기준 이미지는 파일명에 _<sid>)
+        # auto 인데 기준 이미지가 없으면 검출기가 비었다고 판정한 프레임으로 보정 (그 전까지 전체 프레임)
+        spec = os.environ.get(f"BASKET_ROI_{sid}", BASKET_ROI) if sid else BASKET_ROI
+        root, ext = os.path.splitext(BASKET_ROI_REF)
+        self.roi_ref = f"{root}_{sid}{ext}" if sid else BASKET_ROI_REF
+        self.roi = None
+        self._roi_pending = False
+        if spec == "auto":
+            ref = load_reference(self.roi_ref) if os.path.exists(self.roi_ref) else None
+            if ref is not None and ref.shape == (fh, fw):
+                self.roi = calibrate_roi(ref, BASKET_ROI_MARGIN)
+                log.info("[ROI]%s auto from %s → %s", self.tag, self.roi_ref, self.roi)
+            else:
+                self._roi_pending = True
+        else:
+            self.roi = parse_roi(spec, fw, fh)
+            if self.roi:
+                log.info("[ROI]%s static %s", self.tag, self.roi)
+
+        # 모션 게이트 (장면 변화 없으면 추론 생략)
+        self.motion = MotionGate(fw, fh, MOTION_DOWNSCALE, MOTION_THRESHOLD, MOTION_REFRESH_N) if MOTION_GATE else None
+        self._last_gate_seq = 0
+        self._tick_lock = threading.Lock()
+        self.tracker = None               # TRACKER=1 이면 검출기 로드 후 생성
+
+        # 내부 안정화용(프레임 서명)
+        self._last_frame_sig     = None
+        self._same_sig_frames    = 0
+        self._last_frame_time_ms = 0
+        self._last_sent_sig      = None
+        self._last_sent_final    = False
+
+    @property
+    def tag(self):
+        return f"[{self.sid}]" if self.sid else ""
+
+    def reset(self):
+        """stopVision: 게이트/추적 초기화 (다음 스캔은 처음부터)"""
+        if self.motion is not None:
+            self.motion.reset()
+        if self.tracker is not None:
+            self.tracker.reset()
+
+    def roi_gray(self, frame):
+        gray = frame.gray
+        if self.roi:
+            x, y, w, h = self.roi
+            gray = gray[y:y + h, x:x + w]
+        return gray
+
+    # ── 바구니 ROI 자동 보정 (검출 0개 = 빈 바구니 프레임 → 기준 이미지 저장)
+    def start_calibration(self, gray):
+        """gray = 빈 바구니로 확인된 프레임의 Y 평면 복사본. 윤곽 검출/파일 쓰기는 별도 스레드 (카메라/추론 스레드 안 막음)"""
+        self._roi_pending = False
+        threading.Thread(target=self._calibrate, args=(gray,), daemon=True).start()
+
+    def _calibrate(self, gray):
+        roi = calibrate_roi(gray, BASKET_ROI_MARGIN)
+        try:
+            cv2.imwrite(self.roi_ref, gray)
+        except Exception as e:
+            log.warn("[ROI]%s reference save failed: %s", self.tag, e)
+        self.roi = roi
+        log.info("[ROI]%s auto (empty basket) → %s (ref saved: %s)", self.tag, roi, self.roi_ref)
 
-def make_filename(label, cnt, conf):
-    ts = datetime.now().strftime("%H%M%S_%f")[:-3]
-    return f"{ts}_{label}_cnt{cnt}_conf{conf:.2f}.jpg"
 
 # ─────────────────────────────────────────────
 # 컨트롤러
 # ─────────────────────────────────────────────
 class Controller:
     def __init__(self):
-        print("[BOOT] controller start", flush=True)
+        log.info("[BOOT] controller start")
+        if LOOP_SLEEP_S is not None:
+            log.warn("[BOOT] LOOP_SLEEP_S=%s is deprecated and ignored: the main loop now wakes on frame publish", LOOP_SLEEP_S)
 
         # 상태
         self.phase = "waiting"       # waiting | scanning
@@ -74,36 +244,71 @@ class Controller:
 
         self.yolo_enabled = False
         self.yolo_ready   = False
-        self.model        = None
+        self.detector     = None   # detectors.Detector
+        self._agg         = None   # det_aggregate.Aggregator (검출기 클래스표 기준)
 
         self.ws_app = None
         self.ws     = None
 
-        # 프레임 큐
-        self.frame_q    = deque(maxlen=3)
-        self.frame_lock = threading.Lock()
-
-        # 내부 안정화용(프레임 서명)
-        self._last_frame_sig     = None
-        self._same_sig_frames    = 0
-        self._last_frame_time_ms = 0
-        self._last_sent_sig      = None
-
         # 하트비트
         self._hb_last = time.time()
-
-        # 카메라 프로세스
-        self.cam_proc = None
-        self.cam_thread = None
+        # 메인 루프 깨우기 (phase/모델 준비 상태가 바뀔 때, 어느 레인이든 새 프레임이 게시될 때)
+        self._wake = threading.Event()
+        self._new_frame = threading.Event()
+
+        # 계측 (단계별 지연/드롭)
+        self.metrics = Metrics()
+        self._stats_last = time.time()
+
+        # 레인 (카메라별 프레임 링 = 미리 할당된 I420 슬롯, 소비자는 읽기전용 뷰를 받음)
+        # (파이프라인 큐에 잡혀있는 프레임 + 최신 + 쓰기용 슬롯이 항상 남도록)
+        # (워커: 처리 중 + 전/후 큐)
+        if WORKERS > 0:
+            slots = max(FRAME_RING_SLOTS, WORKERS + 2 * PIPE_QUEUE_LEN + 3)
+        else:
+            slots = max(FRAME_RING_SLOTS, PIPE_QUEUE_LEN + 3) if PIPELINE_ENABLE else FRAME_RING_SLOTS
+        self.lanes = [Lane(i, sid, src, slots, on_publish=self._new_frame.set)
+                      for i, (sid, src) in enumerate(parse_cameras(CAMERAS))]
+        self._lane_by_sid = {lane.sid: lane for lane in self.lanes if lane.sid}
+        if self._lane_by_sid:
+            log.info("[CAM] lanes: %s", ", ".join(f"{l.sid}={l.source}" for l in self.lanes))
+
+        # 캡처 저장 (백그라운드 워커)
+        self.capture = CaptureWriter(
+            mode=CAPTURE_MODE, qlen=CAPTURE_QUEUE, jpeg_quality=JPEG_QUALITY,
+            day_quota_mb=CAPTURE_DAY_QUOTA_MB, keep_days=CAPTURE_KEEP_DAYS, metrics=self.metrics,
+            compact_at=int(CAPTURE_COMPACT_AT) if CAPTURE_COMPACT_AT else None,
+            compact_after_days=CAPTURE_COMPACT_AFTER,
+        ) if SAVE_IMAGES else None
+        if self.capture is not None:
+            self.metrics.gauge("capture_dropped", lambda: self.capture.dropped)
+        self.metrics.gauge("pipe_pre_dropped", lambda: self.pipeline.pre_q.dropped if self.pipeline else 0)
+        self.metrics.gauge("pipe_post_dropped", lambda: self.pipeline.post_q.dropped if self.pipeline else 0)
+        if METRICS_ADDR:
+            try:
+                serve_metrics(self.metrics, METRICS_ADDR)
+                log.info("[METRICS] serving on %s", METRICS_ADDR)
+            except Exception as e:
+                log.warn("[METRICS] serve failed: %s", e)
 
         # YOLO 스타트 쓰레드 중복 방지
         self._yolo_starting = False
 
+        # 비동기 파이프라인 (PIPELINE=1 + openvino 백엔드일 때)
+        self.pipeline = None
+        self.enhancer = None   # start_yolo 에서 파이프라인 깊이에 맞춰 생성
+
         # 입력 크기 상태 변수
         self._imgsz = int(os.environ.get("IMG_SIZE", str(MODEL_IMG)))  # 기본 640, 필요시 런타임 조정
 
+        # 부팅 단계별 준비 시각 (visionReady 는 셋 다 준비됐을 때만)
+        self._boot_t0 = time.monotonic()
+        self._boot_ready = {"camera": None, "ws": None, "model": None}
+        self._boot_lock = threading.Lock()
+        self._ready_pending = False   # 현재 WS 연결에 visionReady 보내야 함
+
         def request_quit(self, reason=""):
-            print(f"[QUIT] {reason}", flush=True)
+            log.info("[QUIT] %s", reason)
             # 더 이상 추론/송신 안 하도록 플래그
             try: self.yolo_enabled = False
             except: pass
@@ -112,14 +317,15 @@ class Controller:
 
             # 카메라 프로세스 종료
             try:
-                if getattr(self, "cam_proc", None):
-                    self.cam_proc.terminate()
+                for lane in self.lanes:
+                    if lane.cam_proc:
+                        lane.cam_proc.terminate()
             except: pass
 
             # YOLO 스레드/자원 정리 (있는 경우)
             try:
                 self.yolo_ready = False
-                self.model = None
+                self.detector = None
             except: pass
 
             # 웹소켓 닫기
@@ -135,72 +341,143 @@ class Controller:
     # ── WS 보조
     def ws_send_json(self, obj: dict):
         try:
+            t0 = time.perf_counter()
             data = json.dumps(obj, ensure_ascii=False)
             if self.ws:
                 self.ws.send(data)
             elif self.ws_app:
                 self.ws_app.send(data)
+            self.metrics.observe("ws_send", t0)
         except Exception as e:
-            print("[WS] send err:", e, flush=True)
+            log.warn("[WS] send err: %s", e, key="ws_send_err")
 
     # ── WS 콜백
     def _on_ws_open(self, ws):
-        print("[WS] connected (controller)", flush=True)
+        log.info("[WS] connected (controller)")
         self.ws = ws
 
-        # ★ 정지 감지 없이 '자가부팅 스캔'
-        self.phase = "scanning"
-        self.yolo_enabled = True          # 사용 on
-        # yolo_ready는 절대 여기서 False로 내리지 않음
-
-        # 모델 비동기 로드
-        self.start_yolo_async()
+        # ★ 정지 감지 없이 '자가부팅 스캔' (모델은 비동기 로드, BOOT_PARALLEL 이면 이미 진행 중)
+        self.enable_vision()
 
-        # Node가 컨트롤러 준비로 전환할 수 있게 ACK 선제 발송
-        self.ws_send_json({"type": "visionReady", "ts": now_iso(False)})
-        print("[WS] visionReady sent (autostart)", flush=True)
+        # Node가 컨트롤러 준비로 전환할 수 있게 ACK 발송 (카메라/모델까지 준비되면)
+        self._ready_pending = True
+        self._mark_boot_ready("ws")
 
     def _on_ws_close(self, ws, code, msg):
-        print("[WS] closed:", code, msg, flush=True)
+        log.info("[WS] closed: %s %s", code, msg)
         self.ws = None
+        self._ready_pending = False
 
     def _on_ws_error(self, ws, err):
-        print("[WS] error:", err, flush=True)
+        log.warn("[WS] error: %s", err)
 
     def _on_ws_message(self, ws, raw):
         # 필요 로그
-        # print("[WS<- RAW]", raw, flush=True)
+        log.debug("[WS<- RAW] %s", raw)
         try:
             data = json.loads(raw)
         except Exception:
             return
         kind = (data.get("type") or data.get("action") or "").strip()
 
+        # 멀티 카메라: sessionId 가 레인을 가리키면 그 레인만 멈춤/재개 (모델/다른 레인은 그대로)
+        lane = self._lane_by_sid.get(data.get("sessionId"))
+        if lane is not None and kind in ("startVision", "stopVision"):
+            lane.active = kind == "startVision"
+            if not lane.active:
+                lane.reset()
+            log.info("[WS] %s%s", kind, lane.tag)
+            self._wake.set()
+            if lane.active and all(v is not None for v in self._boot_ready.values()):
+                self._send_vision_ready([lane])   # 해당 세션에만 ACK
+            return
+
         if kind == "startVision":
-            # 자가부팅 모드: 재진입/리셋 금지, ACK만 재송신
-            print("[WS] startVision ignored (controller autostart)", flush=True)
-            self.ws_send_json({"type": "visionReady", "ts": now_iso(False)})
+            if self.phase == "scanning":
+                # 자가부팅 모드: 재진입/리셋 금지, ACK만 재송신
+                log.info("[WS] startVision ignored (controller autostart)")
+            else:
+                # stopVision 뒤 재개: 로드된(prewarm 된) 검출기 그대로 스캔만 켬
+                log.info("[WS] startVision (model=%s)", "ready" if self.yolo_ready else "loading")
+                self.enable_vision()
+            self._ready_pending = True
+            self._send_vision_ready_if_all()
+            return
+
+        if kind == "prewarm":
+            self.prewarm(data)
             return
 
         if kind == "stopVision":
             if self.phase != "scanning":
-                print("[WS] stopVision ignored (not scanning)", flush=True)
+                log.info("[WS] stopVision ignored (not scanning)")
                 return
-            print("[WS] stopVision", flush=True)
+            log.info("[WS] stopVision")
             self.stop_yolo()
             self.phase = "waiting"
-            # 정지 감지 안씀
-            self.yolo_enabled = False
-            self.yolo_ready   = False     # ready False는 오직 여기에서만!
+            # 검출기는 로드된 채로 유지 (yolo_ready 그대로) → 다음 startVision/prewarm 은 재로딩 없음
             # (정지기/버퍼 초기화가 필요하면 여기에)
+            for lane in self.lanes:
+                lane.reset()
+            self._wake.set()
             return
 
         # 기타 메시지는 필요 시 확장
 
+    def prewarm(self, data):
+        """lidar 접근 예측: 세션/스캔 상태(phase/yolo_enabled)는 건드리지 않고 카메라와 모델만 미리 올림"""
+        cams = sum(1 for lane in self.lanes if not (lane.cam_thread and lane.cam_thread.is_alive()))
+        model = "ready" if (self.detector is not None and self.yolo_ready) else \
+            "loading" if self._yolo_starting else "start"
+        if not cams and model != "start":
+            log.info("[WS] prewarm ignored (camera on, model %s)", model)
+            return
+        self.metrics.count("prewarm")
+        log.info("[WS] prewarm eta=%ss dist=%scm → camera start=%d model=%s",
+                 data.get("eta"), data.get("distance"), cams, model)
+        if cams:
+            self.start_camera()
+        if model == "start":
+            self.start_yolo_async()
+
+    # ── 부팅 준비 추적
+    def _mark_boot_ready(self, phase):
+        with self._boot_lock:
+            if self._boot_ready[phase] is None:
+                ms = int((time.monotonic() - self._boot_t0) * 1000)
+                self._boot_ready[phase] = ms
+                log.info("[BOOT] %s ready +%sms", phase, ms)
+        self._send_vision_ready_if_all()
+
+    def _send_vision_ready_if_all(self):
+        with self._boot_lock:
+            if not self._ready_pending or not self.ws:
+                return
+            if any(v is None for v in self._boot_ready.values()):
+                return
+            self._ready_pending = False
+        self._send_vision_ready(self.lanes)
+        b = self._boot_ready
+        log.info("[WS] visionReady sent (autostart) camera=+%sms ws=+%sms model=+%sms", b["camera"], b["ws"], b["model"])
+
+    def _send_vision_ready(self, lanes):
+        # 멀티 카메라 컨트롤러는 session=* 로 붙으므로 레인별 sessionId 를 실어야 Node 가 세션을 구분함
+        if not self._lane_by_sid:
+            self.ws_send_json({"type": "visionReady", "ts": now_iso(False)})
+            return
+        for lane in lanes:
+            if lane.active:
+                self.ws_send_json({"type": "visionReady", "sessionId": lane.sid, "ts": now_iso(False)})
+
     # ── WS 실행
     def start_ws(self):
+        url = WS_URL
+        if "?" not in url:
+            # role=controller: prewarm 등 컨트롤러 전용 메시지를 받도록
+            # 멀티 카메라: 모든 세션의 startVision/stopVision 을 받도록 와일드카드 세션으로 접속
+            url += "?role=controller&session=*" if self._lane_by_sid else "?role=controller"
         self.ws_app = websocket.WebSocketApp(
-            WS_URL,
+            url,
             on_open=self._on_ws_open,
             on_message=self._on_ws_message,
             on_close=self._on_ws_close,
@@ -209,63 +486,97 @@ class Controller:
         t = threading.Thread(target=self.ws_app.run_forever, kwargs={"ping_interval": 20, "ping_timeout": 10}, daemon=True)
         t.start()
 
-    # ── 카메라: rpicam-vid 파이프(YUV420) → BGR
+    # ── 카메라: 프레임 소스(rpicam-vid 파이프 / 녹화 재생 / 합성) → 레인별 프레임 링
     def start_camera(self):
-        if self.cam_thread and self.cam_thread.is_alive():
+        for lane in self.lanes:
+            self._start_lane_camera(lane)
+
+    def _start_lane_camera(self, lane):
+        if lane.cam_thread and lane.cam_thread.is_alive():
             return
-        cmd = [
-            "rpicam-vid",
-            "-t", "0",
-            "--width", str(CAM_W),
-            "--height", str(CAM_H),
-            "--framerate", str(CAM_FPS),
-            "--codec", "yuv420",
-            "--shutter", str(CAM_SHUTTER),
-            "--gain", str(CAM_GAIN),
-            "--denoise", str(CAM_DENOISE),
-            "-o", "-"
-        ]
-        print("[CAM] exec:", " ".join(map(str, cmd)), flush=True)
-        self.cam_proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=0)
-        print(f"[CAM] rpicam-vid PID={self.cam_proc.pid}", flush=True)
-
-        # ★ 누적 버퍼
-        self._yuv_stash = bytearray()
+        if lane.broker:
+            log.info("[CAM]%s source: %s", lane.tag, lane.frames)
+            lane.cam_thread = threading.Thread(target=self._broker_reader, args=(lane,), daemon=True)
+            lane.cam_thread.start()
+            return
+        record = CAM_RECORD or None
+        if record and lane.sid:
+            root, ext = os.path.splitext(record)
+            record = f"{root}_{lane.sid}{ext}"
+        lane.cam_source = open_source(
+            lane.source, CAM_W, CAM_H, CAM_FPS,
+            realtime=CAM_REPLAY_REALTIME, loop=CAM_REPLAY_LOOP, record=record,
+            shutter=CAM_SHUTTER, gain=CAM_GAIN, denoise=CAM_DENOISE,
+        )
+        src = getattr(lane.cam_source, "source", lane.cam_source)
+        lane.cam_proc = getattr(src, "proc", None)
+        if lane.cam_proc is not None:
+            log.info("[CAM]%s exec: %s", lane.tag, " ".join(map(str, src.cmd)))
+        log.info("[CAM]%s source: %s", lane.tag, lane.cam_source)
 
         def _reader():
-            frame_size = CAM_W * CAM_H * 3 // 2  # YUV420(I420)
+            # 파이프에서 링 슬롯으로 직접 readinto (프레임당 할당/복사 없음)
+            frames = lane.frames
             while True:
                 try:
-                    # 파이프는 chunk 단위로 오므로, 누적해서 프레임 단위로 자른다
-                    chunk = self.cam_proc.stdout.read(4096)
-                    if not chunk:
+                    t0 = time.perf_counter()
+                    got = frames.fill_from(lane.cam_source.stream)
+                    if got is None:
+                        continue    # 모든 슬롯이 잡혀 있음 → 게시된 프레임 없음 (계측/알림 없이 재시도)
+                    if not got:
+                        if lane.cam_source.done and lane.cam_proc is None:
+                            log.info("[CAM]%s source finished: %s", lane.tag, lane.cam_source)
+                            lane.cam_source.close()
+                            return
                         time.sleep(0.005)
                         continue
-                    self._yuv_stash.extend(chunk)
-
-                    # 프레임 여러 장이 한꺼번에 쌓일 수 있으므로 while로 소진
-                    while len(self._yuv_stash) >= frame_size:
-                        frame_bytes = self._yuv_stash[:frame_size]
-                        del self._yuv_stash[:frame_size]
-
-                        yuv = np.frombuffer(frame_bytes, dtype=np.uint8).reshape((CAM_H * 3 // 2, CAM_W))
-                        bgr = cv2.cvtColor(yuv, cv2.COLOR_YUV2BGR_I420)
-                        gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
-                        with self.frame_lock:
-                            self.frame_q.append((bgr, gray))
-
+                    # frame_wait = 다음 프레임을 기다린 시간 (읽기 비용이 아니라 대부분 카메라 주기)
+                    self.metrics.observe("frame_wait", t0)
+                    self._on_lane_frame(lane)
                 except Exception as e:
                     # 스트림 hiccup 시 잠깐 대기 후 재시도
                     time.sleep(0.01)
 
-        self.cam_thread = threading.Thread(target=_reader, daemon=True)
-        self.cam_thread.start()
+        lane.cam_thread = threading.Thread(target=_reader, daemon=True)
+        lane.cam_thread.start()
 
+    def _on_lane_frame(self, lane):
+        if self._boot_ready["camera"] is None and all(l.frames.seq for l in self.lanes):
+            self._mark_boot_ready("camera")
+
+    def _broker_reader(self, lane):
+        # 프레임은 브로커가 공유 메모리에 씀 → 여기선 알림만 받아 링 대기자를 깨움
+        idle = 0.0
+        while True:
+            try:
+                if lane.frames.pump(1.0):
+                    idle = 0.0
+                    self._on_lane_frame(lane)
+                    continue
+                idle += 1.0
+                if idle >= 3.0:
+                    # 브로커 재시작/정지 → 다시 구독 (새 공유 메모리면 다시 붙음)
+                    log.warn("[CAM]%s no frames from broker for %.0fs → resubscribe", lane.tag, idle, key="broker_idle")
+                    lane.frames.resubscribe(timeout=2.0)
+                    idle = 0.0
+            except Exception as e:
+                log.warn("[CAM]%s broker: %s", lane.tag, e, key="broker_err")
+                time.sleep(1.0)
 
-    # ── YOLO 로딩(비동기)
+    # ── 스캔 켜기 (모델 로드와 별개: 로드돼 있으면 그대로 쓰고, 아니면 로드 시작 → 끝나면 메인 루프가 깨어남)
+    def enable_vision(self):
+        self.phase = "scanning"
+        self.had_detection = False
+        self.last_detect_ts = time.time()
+        self.yolo_enabled = True
+        self._wake.set()
+        if self.detector is None or not self.yolo_ready:
+            self.start_yolo_async()
+
+    # ── YOLO 로딩(비동기): 검출기만 준비 (yolo_ready), 스캔 on/off(yolo_enabled/phase)는 건드리지 않음
     def start_yolo_async(self):
         if self._yolo_starting:
-            print("[YOLO] already starting/started", flush=True)
+            log.info("[YOLO] already starting/started")
             return
         self._yolo_starting = True
 
@@ -278,155 +589,346 @@ class Controller:
 
     def start_yolo(self):
         # 이미 준비된 상태면 재로딩 불필요
-        if (self.model is not None) and self.yolo_ready:
-            print("[YOLO] already ready", flush=True)
-            self.yolo_enabled = True
+        if (self.detector is not None) and self.yolo_ready:
+            log.info("[YOLO] already ready")
             return
 
-        print("[YOLO] starting...", flush=True)
-        self.model = YOLO(OV_MODEL_DIR)  # OpenVINO format path
-        dummy = np.zeros((self._imgsz, self._imgsz, 3), np.uint8)
-        _ = self.model(dummy, imgsz=self._imgsz, verbose=False)
+        log.info("[YOLO] starting...")
+        # 멀티 카메라 + BATCH_INFER: 레인 수만큼 batch 로 컴파일, 동기 batch 추론 (파이프라인 안 씀)
+        # (openvino 백엔드만, 나머지는 레인마다 한 장씩)
+        batch = len(self.lanes) if (len(self.lanes) > 1 and BATCH_INFER and WORKERS <= 0
+                                    and DETECTOR_BACKEND == "openvino") else 1
+        use_pipe = PIPELINE_ENABLE and DETECTOR_BACKEND == "openvino" and batch == 1
+        if WORKERS > 0:
+            # 멀티 프로세스: 모델은 워커들이 각자 로드 (이 프로세스는 클래스표/입력 크기만), 재시작해도 워커 유지
+            if not isinstance(self.pipeline, WorkerPool):
+                self.pipeline = self._start_workers()
+            self.detector = self.pipeline.model
+        else:
+            kw = {"batch": batch} if batch > 1 else {}
+            self.detector = load_detector(
+                DETECTOR_BACKEND, OV_MODEL_DIR,
+                device=OV_DEVICE, perf_hint=(OV_PERF_HINT if use_pipe else "LATENCY"),
+                imgsz=self._imgsz, conf=PRIMARY_CONF, iou=IOU_THRESHOLD, cache_dir=OV_CACHE_DIR, **kw,
+            )
+        log.info("[YOLO] loaded in %sms cache=%s", getattr(self.detector, "load_ms", "?"), getattr(self.detector, "cache", "off"))
+        # 모델에 고정된 입력 크기를 그대로 따름
+        self._imgsz = self.detector.imgsz
+        self._agg = Aggregator(self.detector.names, CONF_THRESHOLD)
+        if TRACKER_ENABLE:
+            if TRACK_BIRTH_CONF > CONF_THRESHOLD:
+                log.warn("[TRACK] TRACK_BIRTH_CONF=%.2f > CONF_THRESHOLD=%.2f: 그 사이 conf 검출은 추적 개수에서 빠짐",
+                         TRACK_BIRTH_CONF, CONF_THRESHOLD)
+            for lane in self.lanes:
+                lane.tracker = Tracker(
+                    self._agg.nc, TRACK_IOU, TRACK_HIGH_CONF, TRACK_MIN_HITS,
+                    TRACK_MAX_AGE, TRACK_STABLE_FRAMES, TRACK_MIN_PURITY, TRACK_BIRTH_CONF,
+                )
+        if WORKERS <= 0:
+            dummy = np.zeros((self._imgsz, self._imgsz, 3), np.uint8)
+            _ = self.detector.detect(dummy)
+
+        if self.pipeline is not None and WORKERS <= 0:
+            # stopVision 후 재시작 → 이전 파이프라인 정리
+            self.pipeline.stop()
+            self.pipeline = None
+        if use_pipe and self.detector.compiled is not None:
+            self.pipeline = VisionPipeline(
+                self.detector.compiled, self._pipe_preprocess, self._pipe_postprocess,
+                jobs=OV_INFER_REQUESTS, qlen=PIPE_QUEUE_LEN, on_drop=lambda item: item[1].release(),
+                metrics=self.metrics,
+            )
+
+        # 보정 출력 버퍼: 추론 중/후처리 대기 + 레인별 이번 batch 이미지 수 + 여유
+        inflight = (self.pipeline.jobs + PIPE_QUEUE_LEN) if self.pipeline is not None else 0
+        self.enhancer = Enhancer(ENHANCE_MODE, ENHANCE_AMOUNT, ENHANCE_TAPS,
+                                 ENHANCE_SKIP_SHARPNESS, buffers=inflight + len(self.lanes) + 1)
 
-        # 로드 완료 → 준비/사용 ON
+        # 로드 완료 → 준비 ON (스캔 중이면 메인 루프가 바로 추론 시작)
         self.yolo_ready   = True
-        self.yolo_enabled = True
-        self.had_detection = False
-        self.last_detect_ts = time.time()
-        print(f"Loading {OV_MODEL_DIR} for OpenVINO inference...", flush=True)
-        print("Using OpenVINO LATENCY mode for batch=1 inference...", flush=True)
-        print(f"[YOLO] ready: {OV_MODEL_DIR}", flush=True)
+        self._wake.set()
+        log.info("Loading %s for OpenVINO inference (%s)...", OV_MODEL_DIR, type(self.detector).__name__)
+        if WORKERS > 0:
+            log.info("Using %d worker processes (shared-memory frame ring)...", self.pipeline.jobs)
+        elif self.pipeline is not None:
+            log.info("Using OpenVINO %s mode with %d async requests...", OV_PERF_HINT, self.pipeline.jobs)
+        elif self.detector.batch > 1:
+            log.info("Using OpenVINO LATENCY mode for batch=%d inference (%d cameras)...", self.detector.batch, len(self.lanes))
+        else:
+            log.info("Using OpenVINO LATENCY mode for batch=1 inference...")
+        log.info("[YOLO] ready: %s imgsz=%s classes=%d", OV_MODEL_DIR, self._imgsz, len(self.detector.names))
+        self._mark_boot_ready("model")
+
+    def _start_workers(self):
+        threads = WORKER_THREADS or max(1, (os.cpu_count() or 4) // WORKERS)
+        cfg = {
+            "backend": DETECTOR_BACKEND,
+            "model_dir": OV_MODEL_DIR,
+            "detector": dict(device=OV_DEVICE, perf_hint="LATENCY", imgsz=self._imgsz, conf=PRIMARY_CONF,
+                             iou=IOU_THRESHOLD, cache_dir=OV_CACHE_DIR,
+                             **({"threads": threads} if DETECTOR_BACKEND == "openvino" else {})),
+            "enhance": dict(mode=ENHANCE_MODE, amount=ENHANCE_AMOUNT, taps=ENHANCE_TAPS,
+                            skip_sharpness=ENHANCE_SKIP_SHARPNESS),
+        }
+        log.info("[WORKER] starting %d worker processes (%d threads each)", WORKERS, threads)
+        return WorkerPool(
+            WORKERS, [lane.frames for lane in self.lanes],
+            task=lambda item: (item[0].index, item[1], item[0].roi),
+            on_result=self._worker_result, cfg=cfg, qlen=PIPE_QUEUE_LEN,
+            on_drop=lambda item: item[1].release(), metrics=self.metrics, log=log,
+        )
 
     def stop_yolo(self):
         # OpenVINO 모델 객체 해제까지는 라이브러리 동작에 따름
         self.yolo_enabled = False
-        # self.model 은 유지(재사용) 하되 ready는 stopVision에서 False로 내림
-
-    # ── YOLO 한 틱
-    def yolo_tick(self, bgr):
+        # self.detector/yolo_ready 는 유지 (다음 스캔에 재사용)
+
+    # ── YOLO 전처리 (동기/파이프라인 공용)
+    def _prepare_image(self, lane, frame):
+        # YUV → letterbox 안쪽 크기 BGR 로 바로 변환 (패딩은 검출기에서)
+        # ROI 가 있으면 그 영역만 (반환 크기 = 원본 기준 크롭 크기, 박스/캡처 복원용)
+        # 보정: luma 모드는 색변환 전 Y 평면에서, 나머지는 변환 후 BGR 에서 (선명하면 생략)
+        enh = self.enhancer
+        t0 = time.perf_counter()
+        do = enh is not None and enh.wants(lane.roi_gray(frame) if enh.skip_sharpness else None)
+        t_enh = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        roi = lane.roi
+        cw, ch = (roi[2], roi[3]) if roi else (frame.w, frame.h)
+        nw, nh = self.detector.fit_size(cw, ch)
+        img = frame.bgr_at(nw, nh, roi, enh.luma if do and enh.mode == "luma" else None)
+        self.metrics.observe("convert", t0)
+        if do and enh.mode != "luma":
+            t0 = time.perf_counter()
+            img = enh.apply(img)
+            t_enh += time.perf_counter() - t0
+        if enh is not None and enh.mode != "off":
+            self.metrics.observe_ms("enhance", t_enh * 1000.0)
+        return img, cw, ch
+
+    def _ready(self):
+        if self.detector is None or not self.yolo_ready:
+            log.debug("[DBG] early return: not ready/detector None")
+            return False
+        return self.yolo_enabled
+
+    # ── YOLO 한 틱 (동기, PIPELINE=0 또는 ultralytics 백엔드)
+    def yolo_tick(self, lane, frame):
         # 0) 준비/정지 가드
-        print(f"[DBG] tick enter en={self.yolo_enabled} ready={self.yolo_ready} model={'ok' if self.model is not None else 'None'}", flush=True)
-        if self.model is None or not self.yolo_ready:
-            print("[DBG] early return: not ready/model None", flush=True)
-            return None
-        if not self.yolo_enabled:
+        log.debug("[DBG] tick enter en=%s ready=%s detector=%s", self.yolo_enabled, self.yolo_ready, self.detector is not None)
+        if not self._ready():
             return None
 
         # 1) 전처리
-        inp = cv2.resize(bgr, (self._imgsz, self._imgsz))
-        if APPLY_LIGHT_ENHANCE:
-            inp = cv2.GaussianBlur(inp, (0, 0), 1.0)
-            inp = cv2.addWeighted(inp, 1.6, inp, -0.6, 0)
+        img, cw, ch = self._prepare_image(lane, frame)
+
+        # 2) 추론 → (cls, conf, xyxy)
+        m = self.metrics
+        if self.detector.compiled is not None and self.detector.batch == 1:
+            t0 = time.perf_counter()
+            x, lb = self.detector.preprocess(img)
+            m.observe("preprocess", t0)
+            t0 = time.perf_counter()
+            out = self.detector.infer(x)
+            m.observe("infer", t0)
+            t0 = time.perf_counter()
+            dets = self.detector.postprocess(out, lb)
+        else:
+            t0 = time.perf_counter()
+            dets = self.detector.detect(img)
+            m.observe("infer", t0)
+            t0 = time.perf_counter()
+
+        # 3) 카운트/최대 conf 집계 → 안정화
+        ev = self._lane_result(lane, dets, img, cw, ch, frame.yuv)
+        m.observe("postprocess", t0)
+        m.observe_ms("frame_age", (time.monotonic() - frame.ts) * 1000.0)   # 프레임 완성 → 결과
+        return ev
 
-        # 2) 추론 (모델 입력 크기에 자동 맞춤)
-        results = None
+    # ── 멀티 카메라: 레인별 새 프레임을 한 batch 로 (모델 한 벌, 추론 1회)
+    def yolo_tick_batch(self, items):
+        if not self._ready():
+            return []
+        m = self.metrics
+        prepared = [(lane, frame) + self._prepare_image(lane, frame) for lane, frame in items]
+        imgs = [p[2] for p in prepared]
+        det = self.detector
+        if det.compiled is not None and det.batch > 1:
+            dets_all = []
+            for i in range(0, len(imgs), det.batch):
+                t0 = time.perf_counter()
+                x, lbs = det.preprocess_batch(imgs[i:i + det.batch])
+                m.observe("preprocess", t0)
+                t0 = time.perf_counter()
+                out = det.infer(x)
+                m.observe("infer", t0)
+                t0 = time.perf_counter()
+                dets_all += [det.postprocess(out[k:k + 1], lb) for k, lb in enumerate(lbs)]
+                m.observe("postprocess", t0)
+        else:
+            t0 = time.perf_counter()
+            dets_all = det.detect_batch(imgs)
+            m.observe("infer", t0)
+        m.count("batch_frames", len(imgs))
+
+        events = []
+        for (lane, frame, img, cw, ch), dets in zip(prepared, dets_all):
+            ev = self._lane_result(lane, dets, img, cw, ch, frame.yuv)
+            m.observe_ms("frame_age", (time.monotonic() - frame.ts) * 1000.0)
+            if ev:
+                events.append(ev)
+        return events
+
+    def _lane_result(self, lane, dets, img, cw, ch, src=None):
+        # src = 원본 I420 프레임 (캡처/ROI 보정용, 호출 동안만 유효)
+        agg = self._aggregate(lane, dets)
+        with lane._tick_lock:
+            return self._finish_tick(lane, agg, cw, ch, img, dets, src)
+
+    # ── 파이프라인 단계 (PIPELINE=1)
+    def _pipe_preprocess(self, item):
+        # 전처리 스레드: 모델 입력만 만들고 링 슬롯은 바로 놓아줌 (캡처/ROI 보정용 원본 I420 은 복사본으로)
+        lane, frame = item
+        with frame:
+            img, w, h = self._prepare_image(lane, frame)
+            ts = frame.ts
+            src = frame.yuv.copy() if self.capture is not None or lane._roi_pending else None
+        t0 = time.perf_counter()
+        x, lb = self.detector.preprocess(img)
+        self.metrics.observe("preprocess", t0)
+        return x, (lane, img, lb, w, h, ts, src)
+
+    def _pipe_postprocess(self, out, meta):
+        # 후처리 스레드: 디코드/NMS → 집계 → 안정화 → 송신
+        if not (self.yolo_enabled and self.yolo_ready):
+            return
+        lane, img, lb, w, h, ts, src = meta
+        if not lane.active:
+            return
+        t0 = time.perf_counter()
+        dets = self.detector.postprocess(out, lb)
+        ev = self._lane_result(lane, dets, img, w, h, src)
+        self.metrics.observe("postprocess", t0)
+        self.metrics.observe_ms("frame_age", (time.monotonic() - ts) * 1000.0)
+        if ev:
+            self.ws_send_json(ev)
+
+    # ── 워커 결과 (WORKERS>0, 후처리 스레드): 박스는 워커가, 집계/안정화/송신은 여기서
+    def _worker_result(self, item, dets, img, cw, ch, ms):
+        lane, frame = item
+        if not (self.yolo_enabled and self.yolo_ready and lane.active):
+            frame.release()
+            return
+        m = self.metrics
+        for k, v in ms.items():
+            if k != "postprocess":
+                m.observe_ms(k, v)
+        t0 = time.perf_counter()
         try:
-            results = self.model(
-                inp, imgsz=self._imgsz, conf=PRIMARY_CONF, iou=IOU_THRESHOLD, verbose=False
-            )
-        except RuntimeError as e:
-            msg = str(e)
-            # 예: shape=[1,3,320,320] ... tensor (shape=(1.3.640.640))
-            m = re.search(r"shape=\[1,3,(\d+),\1\]", msg)
-            if m:
-                new_sz = int(m.group(1))
-                if new_sz != self._imgsz:
-                    print(f"[YOLO] adjust imgsz {self._imgsz} → {new_sz} (from model hint)", flush=True)
-                    self._imgsz = new_sz
-                    inp = cv2.resize(bgr, (self._imgsz, self._imgsz))
-                    results = self.model(
-                        inp, imgsz=self._imgsz, conf=PRIMARY_CONF, iou=IOU_THRESHOLD, verbose=False
-                    )
-            if results is None:
-                raise
-
-        # r / boxes 정의
-        r = results[0]
-        boxes = getattr(r, "boxes", None)
-
-        # 3) 카운트/최대 conf 집계
-        current_counts = collections.defaultdict(int)
-        current_maxconf = collections.defaultdict(float)
-
-        if boxes is not None and hasattr(boxes, "cls") and len(boxes.cls) > 0:
-            for i in range(len(boxes.cls)):
-                try:
-                    conf = float(boxes.conf[i])
-                except Exception:
-                    continue
-                if conf < CONF_THRESHOLD:
-                    continue
-                cid = int(boxes.cls[i])
-                names = getattr(self.model, "names", None)
-                if not names or cid not in names:
-                    continue
-                name = names[cid]
-                current_counts[name] += 1
-                if conf > current_maxconf[name]:
-                    current_maxconf[name] = conf
-
-        if not current_counts:
+            ev = self._lane_result(lane, dets, img, cw, ch, frame.yuv)
+        finally:
+            # img 는 이 프레임 슬롯의 공유 영역 → 집계/캡처(복사) 끝나면 놓아줌
+            frame.release()
+        m.observe_ms("postprocess", ms.get("postprocess", 0.0) + (time.perf_counter() - t0) * 1000.0)
+        m.observe_ms("frame_age", (time.monotonic() - frame.ts) * 1000.0)
+        if ev:
+            self.ws_send_json(ev)
+
+    # ── 검출 → 집계 (추적기 켜져 있으면 확정 트랙 기준 개수)
+    def _aggregate(self, lane, dets):
+        if lane.tracker is None:
+            return self._agg(dets.cls, dets.conf)
+        with lane._tick_lock:
+            lane.tracker.update(dets.cls, dets.conf, dets.xyxy)
+            return self._agg(*lane.tracker.tracks())
+
+    # ── 모션 게이트가 추론을 생략한 프레임: 새 증거가 아니므로 안정 카운터/추적은 그대로, 연속성만 유지
+    def _hold_stability(self, lane):
+        with lane._tick_lock:
+            if lane._last_frame_sig is not None:
+                lane._last_frame_time_ms = int(time.time() * 1000)
+
+    def _gate(self, lane, frame):
+        """True = 추론, False = 추론 생략, None = 이미 본 프레임(할 일 없음)"""
+        if lane.motion is None:
+            return True
+        if frame.seq == lane._last_gate_seq:
+            return None
+        lane._last_gate_seq = frame.seq
+        if lane.motion.check(lane.roi_gray(frame)):
+            return True
+        self.metrics.count("motion_skipped")
+        return False
+
+    # ── 안정화 → 대표 라벨 → 캡처 → 이벤트
+    def _finish_tick(self, lane, agg, base_w, base_h, img, dets, src=None):
+        # ROI auto 대기 중: 전체 프레임에서 아무것도 못 찾은 프레임 = 빈 바구니 → 그 프레임으로 보정
+        if (lane._roi_pending and src is not None and lane.frames.seq >= ROI_CALIB_FRAME
+                and not (dets.conf >= CONF_THRESHOLD).any()):
+            lane.start_calibration(src[:lane.frames.h].copy())
+
+        if agg.empty:
             # 프레임 안정성 상태 리셋
-            self._same_sig_frames = 0
-            self._last_frame_sig = None
+            lane._same_sig_frames = 0
+            lane._last_frame_sig = None
             return None
 
         # 4) 프레임 시그니처 & 안정성(간단)
-        if not hasattr(self, "_last_frame_time_ms"): self._last_frame_time_ms = 0
-        if not hasattr(self, "_same_sig_frames"):    self._same_sig_frames = 0
-        if not hasattr(self, "_last_frame_sig"):     self._last_frame_sig = None
-        if not hasattr(self, "_last_sent_sig"):      self._last_sent_sig = None
-
-        sig = tuple(sorted((k, int(v)) for k, v in current_counts.items()))
+        sig = agg.sig
         now_ms = int(time.time() * 1000)
 
         # 프레임 간 간격이 너무 길면 연속성 초기화
-        if now_ms - self._last_frame_time_ms > 1200:
-            self._same_sig_frames = 0
-            self._last_frame_sig = None
+        if now_ms - lane._last_frame_time_ms > 1200:
+            lane._same_sig_frames = 0
+            lane._last_frame_sig = None
 
-        if sig == self._last_frame_sig:
-            self._same_sig_frames += 1
+        if sig == lane._last_frame_sig:
+            lane._same_sig_frames += 1
         else:
-            self._last_frame_sig = sig
-            self._same_sig_frames = 1
-        self._last_frame_time_ms = now_ms
+            lane._last_frame_sig = sig
+            lane._same_sig_frames = 1
+        lane._last_frame_time_ms = now_ms
 
-        if self._same_sig_frames < DETECTION_THRESHOLD:
+        # 추적기: 추적 개수가 충분히 안정되면 final (Node 가 추가 대기 없이 확정)
+        final = bool(lane.tracker is not None and lane.tracker.stable)
+        if lane._same_sig_frames < DETECTION_THRESHOLD and not final:
             return None
-        if self._last_sent_sig == sig:
+        if lane._last_sent_sig == sig and (lane._last_sent_final or not final):
             return None
 
         # 5) 대표 라벨 선택
-        main_label = max(
-            current_counts.items(),
-            key=lambda kv: (kv[1], current_maxconf.get(kv[0], 0.0))
-        )[0]
-        best_conf = float(current_maxconf.get(main_label, 0.0))
+        main_id = agg.main()
+        main_label = agg.name(main_id)
+        main_cnt = int(agg.counts[main_id])
+        best_conf = float(agg.maxconf[main_id])
 
-        # 6) 캡처 저장(옵션)
+        # 6) 캡처 저장(옵션) — 경로만 정하고 실제 쓰기는 백그라운드
         annotated_path = None
-        if SAVE_IMAGES:
-            try:
-                ann = r.plot()
-                base_h, base_w = bgr.shape[:2]
-                ann_up = cv2.resize(ann, (base_w, base_h))
-                save_dir = ensure_day_dir()
-                fname = make_filename(main_label, current_counts[main_label], best_conf)
-                annotated_path = os.path.join(save_dir, fname)
-                cv2.imwrite(annotated_path, ann_up, [int(cv2.IMWRITE_JPEG_QUALITY), JPEG_QUALITY])
-            except Exception as e:
-                print("[IMG] save failed:", e, flush=True)
+        if self.capture is not None:
+            annotated_path = self.capture.submit(
+                main_label, main_cnt, best_conf, img, dets, self.detector.names, (base_w, base_h),
+                session=lane.sid, counts=agg.counts_dict(), raw=src, roi=lane.roi
+            )
 
         ev = {
             "type": "yoloDetection",
             "class": main_label,
             "conf": round(best_conf, 3),
-            "counts": {k: int(v) for k, v in current_counts.items()},
+            "counts": agg.counts_dict(),
             "imgPath": annotated_path,
             "ts": now_iso()
         }
-        self._last_sent_sig = sig
+        if lane.sid:
+            ev["sessionId"] = lane.sid   # Node 가 해당 세션으로 라우팅
+        if lane.roi:
+            ev["roi"] = list(lane.roi)   # 검출 영역 (원본 좌표). imgPath 는 프레임 전체, 박스도 원본 좌표
+        if lane.tracker is not None:
+            ev["tracked"] = True
+            ev["stability"] = round(lane.tracker.score, 3)
+            ev["final"] = final
+        lane._last_sent_sig = sig
+        lane._last_sent_final = final
         self.last_detect_ts = time.time()
         self.had_detection = True
         return ev
@@ -435,36 +937,94 @@ class Controller:
     # ── 메인 루프 (no-still)
     def start_main_loop(self):
         def _run():
-            print("[MAIN] loop start (waiting)", flush=True)
+            log.info("[MAIN] loop start (waiting)")
             while True:
                 # 하트비트
                 now = time.time()
                 if now - self._hb_last >= HB_PERIOD_S:
                     self._hb_last = now
-                    print(f"[HB] phase={self.phase} qlen={len(self.frame_q)} ready={bool(self.yolo_ready)} hadDet={self.had_detection}", flush=True)
+                    self._log_heartbeat()
+
+                # visionStats (옵션)
+                if VISION_STATS_PERIOD_S > 0 and now - self._stats_last >= VISION_STATS_PERIOD_S:
+                    self._stats_last = now
+                    self.ws_send_json({"type": "visionStats", "stats": self.metrics.snapshot(), "ts": now_iso()})
+
+                # 대기 단계 / 모델 준비 전: 상태 변화(_wake.set)나 하트비트 주기까지 블록
+                # (상태 확인 전에 clear → 확인 뒤에 바뀐 상태의 set() 은 다음 wait 가 바로 반환, 놓치지 않음)
+                self._wake.clear()
+                if self.phase != "scanning" or not (self.yolo_enabled and self.yolo_ready):
+                    self._wake.wait(HB_PERIOD_S)
+                    continue
+
+                # 어느 레인이든 새 프레임이 게시되는 순간 깨어남 (sleep 폴링 없음)
+                # (clear 후에 수집 → 그 사이 게시된 프레임은 다음 wait 가 바로 반환)
+                if not self._new_frame.wait(HB_PERIOD_S):
+                    continue
+                self._new_frame.clear()
 
-                with self.frame_lock:
-                    if not self.frame_q:
-                        time.sleep(LOOP_SLEEP_S)
+                run = []
+                for lane in self.lanes:
+                    if not lane.active:
+                        continue
+                    frame = lane.frames.wait_newer(lane._last_seen_seq, timeout=0)
+                    if frame is None:
+                        continue
+                    # 소비자가 보지 못하고 지나간 프레임 수
+                    lane._last_seen_seq = frame.seq
+                    if frame.skipped:
+                        self.metrics.count("frames_skipped", frame.skipped)
+                    gate = self._gate(lane, frame)
+                    if gate:
+                        run.append((lane, frame))
                         continue
-                    bgr, gray = self.frame_q[-1]
+                    frame.release()
+                    if gate is False:
+                        # 장면 변화 없음 → 추론 생략 (final 은 새 추론 N 번으로만 확정)
+                        self._hold_stability(lane)
+                if not run:
+                    continue
 
-                if self.phase != "scanning":
-                    time.sleep(LOOP_SLEEP_S)
+                # 파이프라인: 새 프레임만 투입 (링 슬롯은 전처리 단계에서 놓아줌)
+                if self.pipeline is not None:
+                    for item in run:
+                        self.pipeline.submit(item)
                     continue
 
-                # 스캔 중이면 YOLO 처리
-                ev = self.yolo_tick(bgr)
-                if ev:
-                    self.ws_send_json(ev)
-                    # 필요 시 추가 로직…
-                time.sleep(LOOP_SLEEP_S)
+                # 스캔 중이면 YOLO 처리 (색변환은 tick 안에서 필요한 만큼만)
+                try:
+                    if len(run) > 1 and self.detector.batch > 1:
+                        events = self.yolo_tick_batch(run)
+                    else:
+                        events = [self.yolo_tick(lane, frame) for lane, frame in run]
+                finally:
+                    for _, frame in run:
+                        frame.release()
+                for ev in events:
+                    if ev:
+                        self.ws_send_json(ev)
+                        # 필요 시 추가 로직…
 
         t = threading.Thread(target=_run, daemon=True)
         t.start()
 
+    def _log_heartbeat(self):
+        lanes = []
+        for lane in self.lanes:
+            gate = ""
+            if lane.motion is not None:
+                skip, refresh = lane.motion.stats()
+                gate = f" skip={skip:.0%} refresh={refresh:.0%} diff={lane.motion.last_diff:.1f}"
+            state = "" if lane.active else " off"
+            lanes.append(f"{lane.tag}seq={lane.frames.seq}{state}{gate}" if lane.sid else f"seq={lane.frames.seq}{gate}")
+        log.info("[HB] phase=%s ready=%s hadDet=%s %s", self.phase, bool(self.yolo_ready), self.had_detection, " ".join(lanes))
+
     # ── 실행
     def run(self):
+        install_dump_signal()   # kill -USR1 → 최근 debug 로그 덤프
+        if BOOT_PARALLEL:
+            # 카메라/WS/모델 컴파일을 동시에 시작 (서로 기다리지 않음)
+            self.start_yolo_async()
         self.start_ws()
         self.start_camera()
         self.start_main_loop()
@@ -473,7 +1033,7 @@ class Controller:
             while True:
                 time.sleep(1.0)
         except KeyboardInterrupt:
-            print("⏹ exit", flush=True)
+            log.info("⏹ exit")
 
 # ─────────────────────────────────────────────
 # 엔트리
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+det_aggregate.py — 검출 결과 집계 (박스 단위 Python 루프 없음)
+- conf 마스크 → 클래스별 개수(bincount) / 최대 conf(maximum.at) 를 NumPy 한 번에
+- 클래스 이름표는 검출기 로드 시 한 번만 배열로 만들어 둠
+- 프레임 서명은 클래스별 개수 벡터의 bytes (같은 클래스 구성/개수면 같은 값)
+"""
+
+import numpy as np
+
+
+class Aggregate:
+    __slots__ = ("counts", "maxconf", "sig", "_agg")
+
+    def __init__(self, agg, counts, maxconf):
+        self._agg = agg
+        self.counts = counts          # int64 (nc,)
+        self.maxconf = maxconf        # float32 (nc,)
+        self.sig = counts.tobytes()   # 프레임 서명 (hashable, 비교 O(nc))
+
+    @property
+    def empty(self):
+        return not self.counts.any()
+
+    def main(self):
+        """대표 클래스 id: 개수 최대, 동률이면 최대 conf 가 큰 쪽"""
+        return int(np.lexsort((self.maxconf, self.counts))[-1])
+
+    def name(self, cid):
+        return self._agg.names[cid]
+
+    def counts_dict(self):
+        """송신용 {name: count} (등장 클래스만, 이름순)"""
+        ids = self._agg.name_order[self.counts[self._agg.name_order] > 0]
+        return dict(zip(self._agg.names[ids].tolist(), self.counts[ids].tolist()))
+
+
+class Aggregator:
+    def __init__(self, names, conf_thr):
+        nc = (max(names) + 1) if names else 0
+        self.nc = nc
+        self.conf_thr = float(conf_thr)
+        self.names = np.array([names.get(i, "") for i in range(nc)], dtype=object)
+        self.valid = np.array([i in names for i in range(nc)], dtype=bool)
+        self.all_valid = bool(self.valid.all())
+        self.name_order = np.argsort(self.names.astype(str), kind="stable")
+
+    def __call__(self, cls, conf):
+        cls = np.asarray(cls, dtype=np.int64)
+        conf = np.asarray(conf, dtype=np.float32)
+        m = conf >= self.conf_thr
+        if not self.all_valid or (cls.size and (cls.min() < 0 or cls.max() >= self.nc)):
+            # 이름표에 없는 클래스 제외 (모델 출력 클래스 수 ≠ 이름표일 때만)
+            m &= (cls >= 0) & (cls < self.nc)
+            m[m] = self.valid[cls[m]]
+        c, s = cls[m], conf[m]
+        counts = np.bincount(c, minlength=self.nc)
+        maxconf = np.zeros(self.nc, dtype=np.float32)
+        np.maximum.at(maxconf, c, s)
+        return Aggregate(self, counts, maxconf)
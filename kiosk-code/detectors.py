@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+"""
+detectors.py — 검출 백엔드 (교체 가능)
+- OpenVinoDetector : export 된 best_openvino_model 을 openvino.Core 로 직접 실행
+                     (torch/ultralytics 불필요, NumPy letterbox + cv2.dnn NMS)
+- UltralyticsDetector : 기존 YOLO(OV_MODEL_DIR) 경로 (옵션 폴백)
+공통 결과는 Detections(cls, conf, xyxy) — 입력 이미지 좌표계의 작은 NumPy 배열
+"""
+
+import abc
+import hashlib
+import json
+import os
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from kiosk_log import get_logger
+
+log = get_logger("detector")
+
+Detections = namedtuple("Detections", ["cls", "conf", "xyxy"])   # int32(N), float32(N), float32(N,4)
+
+EMPTY = Detections(np.empty(0, np.int32), np.empty(0, np.float32), np.empty((0, 4), np.float32))
+
+PAD_VALUE = 114          # ultralytics letterbox 패딩값
+MAX_WH = 4096.0          # 클래스별 NMS 를 한 번에 하기 위한 좌표 오프셋
+MAX_NMS_CANDIDATES = 3000
+MAX_DET = 300
+
+
+# ─────────────────────────────────────────────
+# 모델 메타데이터
+# ─────────────────────────────────────────────
+def find_model_xml(model_dir):
+    """OpenVINO export 폴더에서 .xml 찾기"""
+    if model_dir.endswith(".xml"):
+        return model_dir
+    for fn in sorted(os.listdir(model_dir)):
+        if fn.endswith(".xml"):
+            return os.path.join(model_dir, fn)
+    raise FileNotFoundError(f"no .xml in {model_dir}")
+
+
+def load_metadata(model_dir):
+    """ultralytics export 의 metadata.yaml (없으면 빈 dict)"""
+    base = model_dir if os.path.isdir(model_dir) else os.path.dirname(model_dir)
+    path = os.path.join(base, "metadata.yaml")
+    if not os.path.exists(path):
+        return {}
+    import yaml
+    with open(path, encoding="utf-8") as f:
+        return yaml.safe_load(f) or {}
+
+
+def model_cache_key(xml_path, device, *extra):
+    """컴파일 blob 캐시 키: IR(xml+bin) 경로/크기/수정시각 + 장치 + 컴파일 옵션 (부팅마다 .bin 전체를 읽지 않음)"""
+    h = hashlib.sha1()
+    for path in (xml_path, os.path.splitext(xml_path)[0] + ".bin"):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        h.update(f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}|".encode())
+    h.update("|".join(map(str, (device,) + extra)).encode())
+    return h.hexdigest()[:16]
+
+
+def _load_cached_names(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return {int(k): str(v) for k, v in json.load(f).items()}
+    except (OSError, ValueError):
+        return {}
+
+
+def _names_from_rt_info(ov_model):
+    # ultralytics 는 IR rt_info 에도 라벨을 공백 구분으로 넣어둠
+    try:
+        labels = ov_model.get_rt_info(["model_info", "labels"]).astype(str)
+        return {i: n for i, n in enumerate(labels.split())}
+    except Exception:
+        return {}
+
+
+# ─────────────────────────────────────────────
+# letterbox / NMS
+# ─────────────────────────────────────────────
+def letterbox_fit(w, h, size):
+    """(w, h) 를 size×size 안에 비율 유지로 넣을 때의 크기 (짝수로 맞춤, I420 변환용)"""
+    r = min(size / w, size / h)
+    nw = max(2, int(round(w * r)) & ~1)
+    nh = max(2, int(round(h * r)) & ~1)
+    return nw, nh
+
+
+def nms(boxes, scores, iou_thr, max_det=MAX_DET):
+    """xyxy 박스 NMS (cv2.dnn.NMSBoxes) → 남은 인덱스 (점수 내림차순, 최대 max_det)"""
+    xywh = boxes.astype(np.float64)
+    xywh[:, 2:] -= xywh[:, :2]
+    idx = cv2.dnn.NMSBoxes(xywh, scores.astype(np.float32), 0.0, float(iou_thr))
+    return np.asarray(idx, dtype=np.int64).reshape(-1)[:max_det]
+
+
+def draw_detections(img, dets, names):
+    """박스/라벨을 그린 사본 반환 (r.plot() 대체)"""
+    out = img.copy()
+    for c, s, b in zip(dets.cls.tolist(), dets.conf.tolist(), dets.xyxy.astype(int).tolist()):
+        color = ((c * 67) % 256, (c * 131) % 256, (c * 199) % 256)
+        cv2.rectangle(out, (b[0], b[1]), (b[2], b[3]), color, 2)
+        cv2.putText(out, f"{names.get(c, c)} {s:.2f}", (b[0], max(12, b[1] - 4)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.45, color, 1, cv2.LINE_AA)
+    return out
+
+
+# ─────────────────────────────────────────────
+# 백엔드
+# ─────────────────────────────────────────────
+class Detector(abc.ABC):
+    """
+    공통 인터페이스
+    - names: {cls_id: name}, imgsz: 모델 입력 한 변
+    - fit_size(w, h): 입력 이미지를 미리 줄여둘 크기 (letterbox 안쪽)
+    - detect(img) -> Detections (동기)
+    - compiled / preprocess / postprocess : 비동기 파이프라인용 (지원 백엔드만)
+    - batch: 한 번에 추론하는 이미지 수, detect_batch(imgs) -> [Detections] (기본은 detect 반복)
+    """
+    names = {}
+    imgsz = 640
+    batch = 1
+    compiled = None
+
+    def fit_size(self, w, h):
+        return letterbox_fit(w, h, self.imgsz)
+
+    @abc.abstractmethod
+    def detect(self, img):
+        """img: BGR uint8 → Detections (img 좌표계)"""
+
+    def detect_batch(self, imgs):
+        return [self.detect(img) for img in imgs]
+
+    def draw(self, img, dets):
+        return draw_detections(img, dets, self.names)
+
+
+class OpenVinoDetector(Detector):
+    def __init__(self, model_dir, device="CPU", perf_hint="LATENCY", imgsz=640,
+                 conf=0.25, iou=0.7, cache_dir=None, batch=1, threads=0):
+        import openvino
+        from openvino import Core
+
+        t0 = time.monotonic()
+        self.conf, self.iou = float(conf), float(iou)
+        meta = load_metadata(model_dir)
+        names = {int(k): str(v) for k, v in (meta.get("names") or {}).items()}
+        sz = meta.get("imgsz") or [imgsz]
+        imgsz = int(sz[0] if isinstance(sz, (list, tuple)) else sz)
+
+        core = Core()
+        xml = find_model_xml(model_dir)
+        config = {"PERFORMANCE_HINT": perf_hint}
+        if threads:
+            # 워커 프로세스 여러 개가 코어를 나눠 쓸 때
+            config["INFERENCE_NUM_THREADS"] = int(threads)
+
+        # 1) 디스크 캐시 (키: 모델 해시 + 장치 + 힌트 + 입력 크기 + 배치 + OV 버전)
+        batch = max(1, int(batch))
+        self.cache = "off"
+        blob = None
+        self.compiled = None
+        if cache_dir:
+            key = model_cache_key(xml, device, perf_hint, imgsz, openvino.get_version(),
+                                  *([f"b1-{batch}"] if batch > 1 else []), *([f"t{threads}"] if threads else []))
+            blob = os.path.join(cache_dir, f"{key}_{device}.blob")
+            if os.path.exists(blob):
+                try:
+                    with open(blob, "rb") as f:
+                        self.compiled = core.import_model(f.read(), device, config)
+                    self.cache = "hit"
+                except Exception as e:
+                    log.warn("[YOLO] cache import failed, recompiling: %s", e)
+            if self.compiled is not None and not names:
+                # metadata.yaml 없음 → 캐시 미스 때 IR rt_info 에서 꺼내 blob 옆에 저장해 둔 이름표
+                names = _load_cached_names(blob + ".names.json") or _names_from_rt_info(core.read_model(xml))
+
+        # 2) 캐시 미스 → IR 읽어서 컴파일 후 저장
+        if self.compiled is None:
+            ov_model = core.read_model(xml)
+            if batch > 1:
+                # 멀티 카메라: 레인 프레임을 [n,3,s,s] 한 텐서로 (가중치는 한 벌만 공유)
+                # 배치 축은 1..N 범위 동적 → 이번에 새 프레임이 있는 레인 수만큼만 추론 (빈 칸 패딩 추론 없음)
+                ov_model.reshape(openvino.PartialShape([openvino.Dimension(1, batch), 3, imgsz, imgsz]))
+            elif not ov_model.input(0).get_partial_shape().is_static:
+                ov_model.reshape([1, 3, imgsz, imgsz])
+            names = names or _names_from_rt_info(ov_model)
+            self.compiled = core.compile_model(ov_model, device, config)
+            if blob:
+                self.cache = "miss"
+                try:
+                    os.makedirs(cache_dir, exist_ok=True)
+                    tmp = f"{blob}.{os.getpid()}.tmp"   # 워커 여러 개가 동시에 써도 안전
+                    with open(tmp, "wb") as f:
+                        f.write(self.compiled.export_model())
+                    os.replace(tmp, blob)
+                    with open(tmp, "w", encoding="utf-8") as f:
+                        json.dump(names, f, ensure_ascii=False)
+                    os.replace(tmp, blob + ".names.json")
+                except Exception as e:
+                    log.warn("[YOLO] cache export failed: %s", e)
+
+        # export 때 고정된 입력 크기를 그대로 사용 (imgsz 추측 불필요)
+        shape = self.compiled.input(0).get_partial_shape()
+        self.imgsz = int(shape[2].get_length())
+        self.batch = int(shape[0].get_max_length() if shape[0].is_dynamic else shape[0].get_length())
+        self._xb = None    # batch 입력 텐서 (재사용)
+        self.names = names
+        self._request = self.compiled.create_infer_request()
+        self.load_ms = int((time.monotonic() - t0) * 1000)
+
+    # ── 전처리: letterbox + RGB/CHW/0..1 을 텐서에 한 번에 기록
+    def _letterbox_into(self, img, row):
+        """row: (3, s, s) 텐서 한 칸 (패딩값으로 채워져 있어야 함) → 좌표 복원 정보"""
+        s = self.imgsz
+        h, w = img.shape[:2]
+        nw, nh = self.fit_size(w, h)
+        if (nw, nh) != (w, h):
+            img = cv2.resize(img, (nw, nh))
+        left, top = (s - nw) // 2, (s - nh) // 2
+        np.multiply(img[..., ::-1].transpose(2, 0, 1), np.float32(1.0 / 255.0),
+                    out=row[:, top:top + nh, left:left + nw], casting="unsafe")
+        # 원래 이미지 좌표로 되돌리기 위한 정보
+        return nw / w, left, top, w, h
+
+    def preprocess(self, img):
+        s = self.imgsz
+        x = np.empty((1, 3, s, s), dtype=np.float32)
+        x.fill(PAD_VALUE / 255.0)
+        return x, self._letterbox_into(img, x[0])
+
+    def preprocess_batch(self, imgs):
+        """최대 batch 장 → ((n,3,s,s) 텐서, [lb...]). 버퍼는 batch 칸 재사용, 넘기는 건 앞 n 칸만"""
+        if len(imgs) > self.batch:
+            raise ValueError(f"{len(imgs)} images for batch={self.batch}")
+        s = self.imgsz
+        if self._xb is None:
+            self._xb = np.empty((self.batch, 3, s, s), dtype=np.float32)
+        x = self._xb[:len(imgs)]
+        x.fill(PAD_VALUE / 255.0)
+        return x, [self._letterbox_into(img, x[i]) for i, img in enumerate(imgs)]
+
+    # ── 후처리: 디코드 → conf 마스크 → 클래스별 NMS → 원래 좌표
+    def postprocess(self, out, lb):
+        r, left, top, w, h = lb
+        p = out[0]                               # (4+nc, A)
+        scores = p[4:]
+        cls = scores.argmax(axis=0)
+        conf = np.take_along_axis(scores, cls[None], axis=0)[0]
+        keep = np.flatnonzero(conf >= self.conf)
+        if keep.size == 0:
+            return EMPTY
+        if keep.size > MAX_NMS_CANDIDATES:
+            keep = keep[np.argpartition(-conf[keep], MAX_NMS_CANDIDATES)[:MAX_NMS_CANDIDATES]]
+
+        cx, cy, bw, bh = p[0, keep], p[1, keep], p[2, keep], p[3, keep]
+        cls, conf = cls[keep], conf[keep]
+        xyxy = np.stack([cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2], axis=1)
+
+        idx = nms(xyxy + (cls * MAX_WH)[:, None], conf, self.iou)
+        xyxy = xyxy[idx]
+        xyxy[:, [0, 2]] -= left
+        xyxy[:, [1, 3]] -= top
+        xyxy /= r
+        xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, w)
+        xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, h)
+        return Detections(cls[idx].astype(np.int32), conf[idx].astype(np.float32), xyxy.astype(np.float32))
+
+    def infer(self, x):
+        """동기 추론 → 원시 출력 (다음 infer 전까지만 유효)"""
+        self._request.infer({0: x})
+        return self._request.get_output_tensor(0).data
+
+    def detect(self, img):
+        if self.batch > 1:
+            return self.detect_batch([img])[0]
+        x, lb = self.preprocess(img)
+        return self.postprocess(self.infer(x), lb)
+
+    def detect_batch(self, imgs):
+        if self.batch == 1:
+            return [self.detect(img) for img in imgs]
+        dets = []
+        for i in range(0, len(imgs), self.batch):
+            x, lbs = self.preprocess_batch(imgs[i:i + self.batch])
+            out = self.infer(x)
+            dets += [self.postprocess(out[k:k + 1], lb) for k, lb in enumerate(lbs)]
+        return dets
+
+
+class UltralyticsDetector(Detector):
+    """기존 ultralytics 경로 (torch 필요). 비동기 파이프라인은 지원 안 함."""
+
+    def __init__(self, model_dir, imgsz=640, conf=0.25, iou=0.7):
+        from ultralytics import YOLO
+
+        self.conf, self.iou = float(conf), float(iou)
+        meta = load_metadata(model_dir)
+        sz = meta.get("imgsz") or [imgsz]
+        self.imgsz = int(sz[0] if isinstance(sz, (list, tuple)) else sz)
+        self.model = YOLO(model_dir)  # OpenVINO format path
+        self.names = {int(k): str(v) for k, v in (getattr(self.model, "names", None) or {}).items()}
+
+    def detect(self, img):
+        r = self.model(img, imgsz=self.imgsz, conf=self.conf, iou=self.iou, verbose=False)[0]
+        boxes = getattr(r, "boxes", None)
+        if boxes is None or len(boxes) == 0:
+            return EMPTY
+        return Detections(
+            boxes.cls.cpu().numpy().astype(np.int32),
+            boxes.conf.cpu().numpy().astype(np.float32),
+            boxes.xyxy.cpu().numpy().astype(np.float32),
+        )
+
+
+class StubDetector(Detector):
+    """
+    모델 없이 쓰는 벤치마크용 검출기: 밝은 영역(연결 성분)을 박스로 내고 추론 시간은 infer_ms 만큼 흉내.
+    클래스는 영역 평균 밝기로 정함 → 합성/녹화 영상에서 결정적인 결과.
+    """
+
+    def __init__(self, model_dir=None, imgsz=640, conf=0.25, iou=0.7, infer_ms=None, nc=53, **_):
+        self.imgsz = int(imgsz)
+        self.conf = float(conf)
+        if infer_ms is None:
+            infer_ms = os.environ.get("STUB_INFER_MS", "0")
+        self.infer_ms = float(infer_ms)
+        self.names = {i: f"item{i:02d}" for i in range(int(nc))}
+        self.cache, self.load_ms = "off", 0
+
+    def detect(self, img):
+        t_end = time.perf_counter() + self.infer_ms / 1000.0
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        _, mask = cv2.threshold(gray, 130, 255, cv2.THRESH_BINARY)
+        _, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=4)
+        stats = stats[1:]
+        keep = stats[:, cv2.CC_STAT_AREA] >= 64
+        stats = stats[keep]
+        if len(stats):
+            means = np.array([gray[y:y + h, x:x + w].mean() for x, y, w, h, _ in stats.tolist()])
+            cls = (means.astype(np.int32) // 16) % len(self.names)
+            xyxy = np.column_stack([stats[:, 0], stats[:, 1],
+                                    stats[:, 0] + stats[:, 2], stats[:, 1] + stats[:, 3]]).astype(np.float32)
+            dets = Detections(cls.astype(np.int32), np.full(len(cls), 0.9, np.float32), xyxy)
+        else:
+            dets = EMPTY
+        # 실제 모델 지연 흉내 (CPU 를 점유하도록 busy-wait)
+        while time.perf_counter() < t_end:
+            pass
+        return dets
+
+
+def load_detector(backend, model_dir, **kw):
+    """backend: openvino | ultralytics | stub. openvino 가 없으면 ultralytics 로 폴백."""
+    if backend == "stub":
+        return StubDetector(model_dir, **kw)
+    if backend == "openvino":
+        try:
+            return OpenVinoDetector(model_dir, **kw)
+        except ImportError as e:
+            log.warn("[YOLO] openvino unavailable, fallback to ultralytics: %s", e)
+    # OpenVINO 전용 인자 제거 (batch 는 detect_batch 기본 = 한 장씩 반복)
+    for k in ("device", "perf_hint", "cache_dir", "batch", "threads"):
+        kw.pop(k, None)
+    return UltralyticsDetector(model_dir, **kw)
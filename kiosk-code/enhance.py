@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+enhance.py — 추론 입력 보정 (가벼운 언샤프 마스크)
+- legacy : 기존 코드 그대로 GaussianBlur(σ=1) → addWeighted(blur, 1.6, blur, -0.6)
+           (두 입력이 모두 blur 라서 실제로는 σ=1 블러만 남음, 모델 입력이 기존과 같으므로 컨트롤러 기본값)
+- fused  : (opt-in, 실제 샤픈이라 모델 입력이 달라짐) 출력은 미리 할당한 버퍼 링, 임시 배열 없음
+           taps=3 : 언샤프 I − a·(σ²/2)∇²I 를 5점 십자 커널 하나로 → filter2D 1패스 (기본, 가장 빠름)
+           taps=5 : GaussianBlur 5×5(σ=1) → addWeighted 를 미리 할당한 버퍼로 (정식 언샤프와 거의 동일)
+- luma   : 같은 커널을 색변환 전 작은 I420 의 Y 평면에만 (채널 1/3, 변환 1회에 흡수)
+- 선명도(Laplacian 분산)가 skip_sharpness 이상이면 보정 생략 (이미 선명한 프레임)
+"""
+
+import cv2
+import numpy as np
+
+MODES = ("off", "legacy", "fused", "luma")
+
+
+def unsharp_kernel(amount=0.6):
+    """5점 십자 샤픈 커널 ((1+4c)·중심 − c·상하좌우, c≈a/3 → σ=1 언샤프 근사)"""
+    c = amount / 3.0
+    return np.array([[0, -c, 0], [-c, 1 + 4 * c, -c], [0, -c, 0]], np.float32)
+
+
+def sharpness(gray, step=4):
+    """다운샘플 Y 의 Laplacian 분산 (클수록 선명)"""
+    small = np.ascontiguousarray(gray[::step, ::step])
+    lap = cv2.Laplacian(small, cv2.CV_16S, ksize=1)
+    return float(cv2.meanStdDev(lap)[1][0, 0]) ** 2
+
+
+class Enhancer:
+    """
+    apply(img) → 보정된 BGR (fused: 버퍼 링 중 하나, 다음 buffers 회 호출 전까지 유효)
+    luma(y)    → Y 평면 제자리 보정 (RingFrame.bgr_at 의 luma 훅)
+    """
+
+    def __init__(self, mode="fused", amount=0.6, taps=3, skip_sharpness=0.0, buffers=4):
+        if mode not in MODES:
+            raise ValueError(f"enhance mode must be one of {MODES}: {mode!r}")
+        self.mode = mode
+        self.amount = float(amount)
+        self.taps = 5 if int(taps) >= 5 else 3
+        self.kernel = unsharp_kernel(self.amount)
+        self.skip_sharpness = float(skip_sharpness)
+        self._nbuf = max(1, int(buffers))
+        self._bufs = {}         # shape → [버퍼...]
+        self._next = 0
+        self._blur = {}         # shape → taps=5 블러 임시 버퍼
+        self.last_sharpness = 0.0
+        self.applied = self.skipped = 0
+
+    def wants(self, gray=None):
+        """이번 프레임 보정 여부 (gray 가 있으면 선명도 측정 후 판단)"""
+        if self.mode == "off":
+            return False
+        if self.skip_sharpness > 0 and gray is not None:
+            self.last_sharpness = sharpness(gray)
+            if self.last_sharpness >= self.skip_sharpness:
+                self.skipped += 1
+                return False
+        self.applied += 1
+        return True
+
+    def _out(self, shape):
+        ring = self._bufs.get(shape)
+        if ring is None:
+            ring = self._bufs[shape] = [np.empty(shape, np.uint8) for _ in range(self._nbuf)]
+        self._next = (self._next + 1) % self._nbuf
+        return ring[self._next]
+
+    def _sharpen(self, img, out):
+        if self.taps == 3:
+            return cv2.filter2D(img, -1, self.kernel, dst=out, borderType=cv2.BORDER_REFLECT_101)
+        blur = self._blur.get(img.shape)
+        if blur is None:
+            blur = self._blur[img.shape] = np.empty(img.shape, np.uint8)
+        cv2.GaussianBlur(img, (5, 5), 1.0, dst=blur)
+        return cv2.addWeighted(img, 1.0 + self.amount, blur, -self.amount, 0, dst=out)
+
+    def apply(self, img):
+        if self.mode == "legacy":
+            img = cv2.GaussianBlur(img, (0, 0), 1.0)
+            return cv2.addWeighted(img, 1.6, img, -0.6, 0)
+        if self.mode == "fused":
+            return self._sharpen(img, self._out(img.shape))
+        return img   # off / luma (luma 는 색변환 전에 처리됨)
+
+    def luma(self, y):
+        """Y 평면 제자리 보정 (출력은 같은 크기 임시 버퍼 경유)"""
+        tmp = self._blur.get(("y", y.shape))
+        if tmp is None:
+            tmp = self._blur[("y", y.shape)] = np.empty_like(y)
+        if self.taps == 3:
+            cv2.filter2D(y, -1, self.kernel, dst=tmp, borderType=cv2.BORDER_REFLECT_101)
+            y[:] = tmp
+        else:
+            cv2.GaussianBlur(y, (5, 5), 1.0, dst=tmp)
+            cv2.addWeighted(y, 1.0 + self.amount, tmp, -self.amount, 0, dst=y)
+        return y
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+frame_ring.py — rpicam-vid YUV420(I420) 프레임 링버퍼
+- 프레임 크기 슬롯을 미리 할당해 두고 파이프에서 readinto 로 바로 채움
+  (프레임당 bytearray 생성/슬라이스/앞부분 del 없음 → 해상도가 커져도 비용 일정)
+- 소비자는 읽기전용 NumPy 뷰 + seq/ts 를 받음 (복사 없음)
+- wait_newer(): 새 프레임 게시 시 Condition 으로 바로 깨움 (소비자 쪽 sleep 폴링 없음)
+- 소비자가 잡고 있는 슬롯(pin)은 writer 가 건너뛰므로 읽는 도중 덮어쓰지 않음
+- 색변환은 요청할 때만 (gray=Y 평면 그대로, BGR/모델 입력은 처음 요청 시 1회 변환 후 캐시)
+- shared=True 면 슬롯을 multiprocessing.shared_memory 에 둠 → 워커 프로세스가
+  FrameRing(..., attach=shm_name) 으로 같은 슬롯을 붙여서 frame_at(slot) 으로 읽음 (바이트 복사 없음)
+  (게시/고정은 만든 프로세스에서만, 워커는 넘겨받은 슬롯만 읽음)
+- 붙는 쪽은 resource_tracker 에 등록하지 않음 (붙은 프로세스가 끝날 때 남의 공유 메모리를 지우지 않도록)
+  단 만든 프로세스가 spawn 한 자식은 부모의 tracker 를 같이 쓰므로 등록 해제도 하면 안 됨 (untrack=False)
+  (부모도 붙기만 한 링, 예: 브로커 링이면 자식도 untrack=True → 부모 tracker 가 남의 것을 지우지 않게)
+"""
+
+import atexit
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+def attach_shm(name, untrack=True):
+    """
+    이미 있는 공유 메모리에 붙기 (정리는 만든 프로세스 몫 → 이 프로세스 종료 시 unlink 안 됨)
+    untrack=False : 만든 프로세스의 multiprocessing 자식 (resource_tracker 공유).
+      3.13 미만에서 여기서 unregister 하면 부모의 등록이 지워져 부모 종료 시 KeyError → 등록은 그대로 둠
+      (같은 이름 재등록은 tracker 쪽에서 중복이라 무해)
+    """
+    from multiprocessing import resource_tracker, shared_memory
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)   # 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        if untrack:
+            try:
+                resource_tracker.unregister(shm._name, "shared_memory")
+            except Exception:
+                pass
+        return shm
+
+
+def luma_bgr(img, luma):
+    """BGR 에 Y 평면 보정 적용 (I420 왕복, 홀수 크기는 짝수로 늘렸다가 되돌림)"""
+    h, w = img.shape[:2]
+    ew, eh = (w + 1) & ~1, (h + 1) & ~1
+    src = img if (ew, eh) == (w, h) else cv2.resize(img, (ew, eh))
+    yuv = cv2.cvtColor(src, cv2.COLOR_BGR2YUV_I420)
+    luma(yuv[:eh])
+    out = cv2.cvtColor(yuv, cv2.COLOR_YUV2BGR_I420)
+    return out if (ew, eh) == (w, h) else cv2.resize(out, (w, h))
+
+
+class RingFrame:
+    """
+    링 슬롯 하나에 대한 읽기전용 I420 프레임. release() 전까지 슬롯이 고정됨.
+    변환 결과는 프레임 단위로 캐시되므로 같은 프레임에서 여러 번 불러도 변환은 1회.
+    """
+    __slots__ = ("seq", "ts", "yuv", "w", "h", "skipped", "_ring", "_slot", "_cache")
+
+    def __init__(self, ring, slot, seq, ts, yuv):
+        self._ring = ring
+        self._slot = slot
+        self.seq = seq      # 게시 순번 (1부터 증가, 빠진 번호 = 소비자가 놓친 프레임)
+        self.ts = ts        # 프레임 완성 시각 (time.monotonic)
+        self.yuv = yuv      # (H*3/2, W) uint8, 읽기전용
+        self.skipped = 0    # wait_newer() 기준 이전에 받은 프레임 이후 건너뛴 수
+        self.w, self.h = ring.w, ring.h
+        self._cache = {}
+
+    @property
+    def slot(self):
+        """링 슬롯 번호 (공유 메모리 링이면 워커 프로세스에 넘기는 값)"""
+        return self._slot
+
+    # ── 지연 변환
+    @property
+    def gray(self):
+        """Y 평면 뷰 (변환/복사 없음)"""
+        return self.yuv[:self.h]
+
+    def bgr(self):
+        """원본 해상도 BGR (처음 요청 시에만 변환)"""
+        out = self._cache.get("bgr")
+        if out is None:
+            out = cv2.cvtColor(self.yuv, cv2.COLOR_YUV2BGR_I420)
+            self._cache["bgr"] = out
+        return out
+
+    def bgr_at(self, w, h, roi=None, luma=None):
+        """
+        (w, h) 크기 BGR. 원본 BGR을 만들지 않고 Y/U/V 평면을 각각 목표 크기로
+        줄인 뒤 작은 I420 을 한 번만 BGR 로 변환함.
+        roi=(x, y, rw, rh) 면 그 영역만 잘라서 변환 (짝수 좌표면 평면 슬라이스만, 복사 없음).
+        luma(y) 를 주면 변환 직전 작은 Y 평면에 제자리 적용 (Y 만 보정).
+        w/h 가 홀수면(ROI 비율 letterbox) 짝수로 올려 만든 뒤 1px 줄임, ROI 좌표가 홀수면 원본 BGR 경유
+        (두 경우 모두 luma 적용)
+        """
+        key = ("bgr", w, h, roi, luma is not None)
+        out = self._cache.get(key)
+        if out is not None:
+            return out
+        x0, y0, rw, rh = roi or (0, 0, self.w, self.h)
+        if roi is None and luma is None and (w, h) == (self.w, self.h):
+            out = self.bgr()
+        elif (x0 | y0 | rw | rh) & 1:
+            # 크롭이 U/V 평면 격자에 안 맞음 → 원본 BGR 경유 (luma 는 작은 I420 왕복으로)
+            out = cv2.resize(self.bgr()[y0:y0 + rh, x0:x0 + rw], (w, h))
+            if luma is not None:
+                out = luma_bgr(out, luma)
+        else:
+            ew, eh = (w + 1) & ~1, (h + 1) & ~1   # 작은 I420 은 짝수 크기만
+            W, H = self.w, self.h
+            q = (H // 2) * (W // 2)
+            flat = self.yuv.reshape(-1)
+            u = flat[W * H:W * H + q].reshape(H // 2, W // 2)
+            v = flat[W * H + q:W * H + 2 * q].reshape(H // 2, W // 2)
+            cy, cx = slice(y0 // 2, (y0 + rh) // 2), slice(x0 // 2, (x0 + rw) // 2)
+
+            small = np.empty((eh * 3 // 2, ew), dtype=np.uint8)
+            sflat = small.reshape(-1)
+            sq = (eh // 2) * (ew // 2)
+            cv2.resize(self.gray[y0:y0 + rh, x0:x0 + rw], (ew, eh), dst=small[:eh])
+            sflat[ew * eh:ew * eh + sq] = cv2.resize(u[cy, cx], (ew // 2, eh // 2)).reshape(-1)
+            sflat[ew * eh + sq:] = cv2.resize(v[cy, cx], (ew // 2, eh // 2)).reshape(-1)
+            if luma is not None:
+                luma(small[:eh])
+            out = cv2.cvtColor(small, cv2.COLOR_YUV2BGR_I420)
+            if (ew, eh) != (w, h):
+                out = cv2.resize(out, (w, h))
+        self._cache[key] = out
+        return out
+
+    def release(self):
+        if self._ring is not None:
+            self._ring._unpin(self._slot)
+            self._ring = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class FrameRing:
+    def __init__(self, w, h, slots=4, on_publish=None, shared=False, attach=None, untrack=True):
+        if slots < 3:
+            raise ValueError("FrameRing needs at least 3 slots")
+        self.w, self.h = int(w), int(h)
+        self.frame_size = self.w * self.h * 3 // 2   # YUV420(I420)
+        self.slots = int(slots)
+
+        # 슬롯 버퍼 (한 번만 할당, 공유 메모리면 다른 프로세스도 같은 바이트를 봄)
+        shape = (self.slots, self.h * 3 // 2, self.w)
+        self.shm = None
+        self._owner = attach is None
+        if shared or attach:
+            from multiprocessing import shared_memory
+            if attach:
+                self.shm = attach_shm(attach, untrack)
+            else:
+                self.shm = shared_memory.SharedMemory(create=True, size=self.slots * self.frame_size)
+                atexit.register(self.close)
+            self._buf = np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf)
+        else:
+            self._buf = np.empty(shape, dtype=np.uint8)
+        self._mv = [memoryview(self._buf[i]).cast("B") for i in range(self.slots)]
+        # 소비자용 읽기전용 뷰
+        self._views = []
+        for i in range(self.slots):
+            v = self._buf[i].view()
+            v.flags.writeable = False
+            self._views.append(v)
+
+        self._seq = np.zeros(self.slots, dtype=np.int64)
+        self._ts = np.zeros(self.slots, dtype=np.float64)
+        self._pins = [0] * self.slots
+
+        self._lock = threading.Lock()
+        self._new_frame = threading.Condition(self._lock)   # 게시 알림 (latest-frame mailbox)
+        self._latest = -1      # 가장 최근 게시된 슬롯
+        self._next_seq = 1
+        self._wpos = 0
+        self._on_publish = on_publish   # 게시마다 호출 (여러 링을 한 이벤트로 기다릴 때)
+
+    @property
+    def seq(self):
+        """마지막으로 게시된 프레임의 seq (없으면 0)"""
+        return self._next_seq - 1
+
+    # ── writer 쪽
+    def _pick_write_slot(self):
+        with self._lock:
+            for k in range(self.slots):
+                i = (self._wpos + k) % self.slots
+                if i != self._latest and self._pins[i] == 0:
+                    self._wpos = (i + 1) % self.slots
+                    return i
+        return -1
+
+    def fill_from(self, stream):
+        """
+        stream(버퍼 없는 raw 파이프)에서 한 프레임을 빈 슬롯에 직접 읽어 게시 → True.
+        EOF/중간 끊김이면 False (부분 프레임은 버림).
+        모든 슬롯이 잡혀 있으면 None (게시 없음, 스트림도 안 읽음 → 호출 쪽은 프레임 도착으로 치지 않음)
+        """
+        i = self._pick_write_slot()
+        if i < 0:
+            # 모든 슬롯이 잡혀있음 → 소비자가 놓아줄 때까지 잠깐 대기
+            time.sleep(0.001)
+            return None
+        mv = self._mv[i]
+        got = 0
+        while got < self.frame_size:
+            n = stream.readinto(mv[got:])
+            if not n:
+                return False
+            got += n
+        self._publish(i)
+        return True
+
+    def _publish(self, i):
+        with self._lock:
+            self._seq[i] = self._next_seq
+            self._ts[i] = time.monotonic()
+            self._next_seq += 1
+            self._latest = i
+            self._new_frame.notify_all()
+        if self._on_publish is not None:
+            self._on_publish()
+
+    # ── consumer 쪽
+    def latest(self):
+        """가장 최근 프레임을 고정해서 반환 (없으면 None). 다 쓰면 release()"""
+        with self._lock:
+            i = self._latest
+            if i < 0:
+                return None
+            self._pins[i] += 1
+            return RingFrame(self, i, int(self._seq[i]), float(self._ts[i]), self._views[i])
+
+    def wait_newer(self, after_seq, timeout=None):
+        """
+        seq > after_seq 인 최신 프레임이 게시될 때까지 블록 (폴링/슬립 없음).
+        고정된 프레임 반환, frame.skipped = 그 사이 놓친 프레임 수. 시간 초과면 None.
+        """
+        with self._lock:
+            if not self._new_frame.wait_for(lambda: self._next_seq - 1 > after_seq, timeout):
+                return None
+            i = self._latest
+            self._pins[i] += 1
+            f = RingFrame(self, i, int(self._seq[i]), float(self._ts[i]), self._views[i])
+        if after_seq:
+            f.skipped = f.seq - after_seq - 1
+        return f
+
+    def frame_at(self, slot, seq, ts):
+        """(워커 프로세스) 넘겨받은 슬롯 번호로 프레임 뷰 (고정은 게시한 쪽이 하고 있음)"""
+        f = RingFrame(self, slot, seq, ts, self._views[slot])
+        f._ring = None      # 고정 해제는 게시한 프로세스 몫
+        return f
+
+    def _unpin(self, i):
+        with self._lock:
+            self._pins[i] -= 1
+
+    def close(self):
+        """공유 메모리 해제 (만든 프로세스면 이름도 삭제)"""
+        if self.shm is None:
+            return
+        self._views = self._mv = self._buf = None
+        if self._owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+        try:
+            self.shm.close()
+        except BufferError:
+            pass   # 아직 뷰를 잡은 프레임이 있음 → 프로세스 종료 시 해제
+        self.shm = None
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+frame_source.py — 프레임 소스 (FrameRing.fill_from 에 넣을 raw I420 스트림)
+- rpicam[:N]          : rpicam-vid --codec yuv420 파이프 (실기기, N = --camera 번호)
+- replay:/path.i420   : 녹화한 raw I420 파일 재생 (실시간 fps 또는 최대 속도, 반복 옵션)
+- synthetic           : 카메라 없이 쓰는 합성 장면 (물체가 들어와서 움직이다 멈춤)
+- record=PATH 를 주면 어떤 소스든 읽은 바이트를 그대로 파일에 덤프 (다시 replay 가능)
+
+모든 소스는 .stream.readinto(mv) 만 제공하면 되고, 끝나면 done=True.
+"""
+
+import os
+import subprocess
+import time
+
+import numpy as np
+
+
+class _Paced:
+    """프레임 경계마다 fps 에 맞춰 쉬는 readinto 래퍼 (fps<=0 이면 최대 속도)"""
+
+    def __init__(self, frame_size, fps):
+        self.frame_size = frame_size
+        self.period = 1.0 / fps if fps > 0 else 0.0
+        self._pos = 0          # 현재 프레임 안에서 읽은 바이트
+        self._next = None      # 다음 프레임 시작 시각
+
+    def _pace(self):
+        if self._pos or not self.period:
+            return
+        now = time.monotonic()
+        if self._next is None or now - self._next > 1.0:
+            self._next = now   # 처음이거나 소비자가 한참 늦었으면 기준 재설정
+        elif self._next > now:
+            time.sleep(self._next - now)
+        self._next += self.period
+
+    def _advance(self, n):
+        self._pos = (self._pos + n) % self.frame_size
+
+
+class RpicamSource:
+    def __init__(self, w, h, fps, shutter=20000, gain=1.0, denoise="off", camera=None):
+        self.cmd = [
+            "rpicam-vid",
+            "-t", "0",
+            *(["--camera", str(camera)] if camera is not None else []),
+            "--width", str(w),
+            "--height", str(h),
+            "--framerate", str(fps),
+            "--codec", "yuv420",
+            "--shutter", str(shutter),
+            "--gain", str(gain),
+            "--denoise", str(denoise),
+            "-o", "-"
+        ]
+        self.proc = subprocess.Popen(self.cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=0)
+        self.stream = self.proc.stdout
+
+    @property
+    def done(self):
+        return self.proc.poll() is not None
+
+    def close(self):
+        try:
+            self.proc.terminate()
+            self.proc.wait(timeout=1)
+        except Exception:
+            try:
+                self.proc.kill()
+            except Exception:
+                pass
+
+    def __str__(self):
+        return f"rpicam-vid PID={self.proc.pid}"
+
+
+class ReplaySource(_Paced):
+    """녹화 파일 재생. realtime=False 면 소비자가 받는 만큼 최대 속도"""
+
+    def __init__(self, path, w, h, fps, realtime=True, loop=False):
+        super().__init__(w * h * 3 // 2, fps if realtime else 0)
+        self.path = path
+        self.loop = loop
+        self._f = open(path, "rb", buffering=0)
+        self.stream = self
+        self.done = False
+        self.frames = os.path.getsize(path) // self.frame_size
+        if self.frames == 0:
+            raise ValueError(f"{path}: shorter than one {w}x{h} I420 frame")
+        self._end = self.frames * self.frame_size   # 끝의 잘린 프레임은 읽지 않음
+        self._off = 0
+
+    def readinto(self, mv):
+        if self._off >= self._end:
+            if not self.loop:
+                self.done = True
+                return 0
+            self._f.seek(0)
+            self._off = 0
+        self._pace()
+        n = self._f.readinto(mv[:self.frame_size - self._pos])
+        if not n:
+            self.done = True
+            return 0
+        self._off += n
+        self._advance(n)
+        return n
+
+    def close(self):
+        self._f.close()
+
+    def __str__(self):
+        return f"replay {self.path} ({self.frames} frames{', loop' if self.loop else ''})"
+
+
+class SyntheticSource(_Paced):
+    """
+    합성 I420 장면: 노이즈 낀 회색 바구니 위로 사각형 물체들이 move_frames 동안 움직이고
+    이후 제자리에 멈춤 (모션 게이트 / 안정화 경로를 카메라 없이 재현).
+    frames>0 이면 그만큼 내보내고 끝.
+    """
+
+    def __init__(self, w, h, fps, realtime=True, frames=0, objects=3, move_frames=30, noise=2, seed=0):
+        super().__init__(w * h * 3 // 2, fps if realtime else 0)
+        self.w, self.h = w, h
+        self.frames = int(frames)
+        self.move_frames = int(move_frames)
+        self.noise = int(noise)
+        self.stream = self
+        self.done = False
+        self._rng = np.random.default_rng(seed)
+        self._n = 0
+        self._buf = np.empty(self.frame_size, np.uint8)
+
+        self._base = np.full((h * 3 // 2, w), 128, np.uint8)   # 회색, U/V 중립
+        self._base[:h] = 90
+        self._objs = []
+        for k in range(int(objects)):
+            ow, oh = w // 6, h // 5
+            x1 = int(self._rng.integers(0, w - ow))
+            y1 = int(self._rng.integers(0, h - oh))
+            self._objs.append((x1, y1, ow, oh, 160 + 30 * (k % 3)))
+        self._noise = self._rng.integers(0, self.noise + 1, (8, h, w), dtype=np.uint8) if self.noise else None
+
+    def _render(self):
+        f = self._base.copy()
+        shift = max(0, self.move_frames - self._n)           # 움직이는 동안 오른쪽에서 들어옴
+        for x1, y1, ow, oh, luma in self._objs:
+            x = min(self.w - ow, x1 + shift * 4)
+            f[y1:y1 + oh, x:x + ow] = luma
+        if self._noise is not None:
+            f[:self.h] += self._noise[self._n % len(self._noise)]
+        self._buf[:] = f.reshape(-1)
+
+    def readinto(self, mv):
+        if self.frames and self._n >= self.frames:
+            self.done = True
+            return 0
+        self._pace()
+        if self._pos == 0:
+            self._render()
+        n = min(len(mv), self.frame_size - self._pos)
+        mv[:n] = self._buf[self._pos:self._pos + n]
+        self._advance(n)
+        if self._pos == 0:
+            self._n += 1
+        return n
+
+    def close(self):
+        pass
+
+    def __str__(self):
+        return f"synthetic {self.w}x{self.h} objects={len(self._objs)}"
+
+
+class RecordingTap:
+    """
+    다른 소스의 stream 을 감싸 읽은 바이트를 그대로 파일에 기록 (raw I420 녹화)
+    열 때마다 새로 씀: 이어 쓰면 이전 녹화의 잘린 마지막 프레임 때문에 이후 프레임 경계가 어긋남
+    """
+
+    def __init__(self, source, path):
+        self.source = source
+        self.path = path
+        self._f = open(path, "wb")
+        self.stream = self
+
+    @property
+    def done(self):
+        return self.source.done
+
+    def readinto(self, mv):
+        n = self.source.stream.readinto(mv)
+        if n:
+            self._f.write(mv[:n])
+        return n
+
+    def close(self):
+        self.source.close()
+        self._f.close()
+
+    def __str__(self):
+        return f"{self.source} → record {self.path}"
+
+
+def open_source(spec, w, h, fps, realtime=True, loop=False, record=None, **cam):
+    """
+    spec: "rpicam[:cam]" | "replay:/path.i420" | "synthetic[:N]" (N 프레임 후 종료)
+    cam : rpicam 옵션 (shutter, gain, denoise)
+    """
+    kind, _, arg = (spec or "rpicam").partition(":")
+    if kind == "rpicam":
+        src = RpicamSource(w, h, fps, camera=int(arg) if arg else None, **cam)
+    elif kind == "replay":
+        src = ReplaySource(arg, w, h, fps, realtime=realtime, loop=loop)
+    elif kind == "synthetic":
+        src = SyntheticSource(w, h, fps, realtime=realtime, frames=int(arg or 0))
+    else:
+        raise ValueError(f"unknown frame source: {spec}")
+    if record:
+        src = RecordingTap(src, record)
+    return src
@@ -0,0 +1,595 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+kiosk_bench.py — 키오스크 비전 코드 벤치마크
+  python3 kiosk_bench.py agg [--classes 53] [--iters 2000]
+  python3 kiosk_bench.py enhance [--iters 300]                     (입력 보정: 기존 vs fused/luma)
+  python3 kiosk_bench.py still [--iters 500]                        (정지 감지: 기존 float 경로 vs StillnessDetector)
+  python3 kiosk_bench.py still-latency [--runs 3]                   (정지 → basketStable 지연: 블로킹 read vs reader 스레드)
+  python3 kiosk_bench.py lidar [--hz 100] [--seconds 3]              (TF-Luna: 샘플 나이 기존 vs 일괄 read + 접근 예측 선행 시간)
+  python3 kiosk_bench.py record clip.i420 [--seconds 10]          (카메라 → raw I420 녹화)
+  python3 kiosk_bench.py run [--source replay:clip.i420|synthetic:300] [--max-speed]
+                             [--backend stub|openvino] [--stub-ms 40] [--seconds 0] [--cameras 1]
+                             [--workers 0]
+"""
+
+import argparse
+import collections
+import os
+import resource
+import threading
+import time
+
+import numpy as np
+
+
+def _timeit(fn, iters):
+    fn()  # 워밍업
+    t0 = time.perf_counter()
+    for _ in range(iters):
+        fn()
+    return (time.perf_counter() - t0) / iters * 1e6   # us/회
+
+
+# ─────────────────────────────────────────────
+# agg: 박스 집계 (기존 Python 루프 vs det_aggregate)
+# ─────────────────────────────────────────────
+def _legacy_aggregate(cls, confs, names, conf_thr):
+    """
+    기존 yolo_tick 3~5단계 (박스마다 float()/int() + dict).
+    실제로는 torch 텐서 원소 접근이라 여기 NumPy 입력보다 박스당 비용이 더 큼.
+    """
+    current_counts = collections.defaultdict(int)
+    current_maxconf = collections.defaultdict(float)
+    for i in range(len(cls)):
+        conf = float(confs[i])
+        if conf < conf_thr:
+            continue
+        cid = int(cls[i])
+        if not names or cid not in names:
+            continue
+        name = names[cid]
+        current_counts[name] += 1
+        if conf > current_maxconf[name]:
+            current_maxconf[name] = conf
+    if not current_counts:
+        return None
+    sig = tuple(sorted((k, int(v)) for k, v in current_counts.items()))
+    main = max(current_counts.items(), key=lambda kv: (kv[1], current_maxconf.get(kv[0], 0.0)))[0]
+    return sig, main
+
+
+def bench_agg(args):
+    from det_aggregate import Aggregator
+
+    rng = np.random.default_rng(0)
+    names = {i: f"item{i:02d}" for i in range(args.classes)}
+    agg = Aggregator(names, args.conf)
+
+    def vectorized(cls, conf):
+        a = agg(cls, conf)
+        if a.empty:
+            return None
+        return a.sig, a.name(a.main())
+
+    print(f"{'boxes':>6} {'legacy us':>10} {'vector us':>10} {'speedup':>8}")
+    for n in (0, 1, 5, 10, 20, 50, 100, 300):
+        cls = rng.integers(0, args.classes, n).astype(np.int32)
+        conf = rng.uniform(0.05, 1.0, n).astype(np.float32)
+        t_old = _timeit(lambda: _legacy_aggregate(cls, conf, names, args.conf), args.iters)
+        t_new = _timeit(lambda: vectorized(cls, conf), args.iters)
+        print(f"{n:>6} {t_old:>10.1f} {t_new:>10.1f} {t_old / t_new:>7.1f}x")
+
+
+# ─────────────────────────────────────────────
+# enhance: 추론 입력 보정 (기존 2패스 vs fused filter2D vs Y 평면만)
+# ─────────────────────────────────────────────
+def bench_enhance(args):
+    import io
+
+    import cv2
+
+    from enhance import Enhancer, sharpness
+    from frame_ring import FrameRing
+
+    if args.threads:
+        cv2.setNumThreads(args.threads)
+    rng = np.random.default_rng(0)
+    W, H = args.width, args.height
+    src = cv2.GaussianBlur(rng.integers(0, 255, (H, W, 3), dtype=np.uint8), (0, 0), 3)
+    ring = FrameRing(W, H)
+    ring.fill_from(io.BytesIO(cv2.cvtColor(src, cv2.COLOR_BGR2YUV_I420).tobytes()))
+    frame = ring.latest()
+
+    legacy = Enhancer("legacy")
+    fused3, fused5 = Enhancer("fused", taps=3), Enhancer("fused", taps=5)
+    luma = Enhancer("luma")
+
+    print(f"{'size':>9} {'convert':>8} {'legacy':>8} {'fused3':>8} {'fused5':>8} {'luma3':>8} "
+          f"{'sharp':>7} {'|f3-usm|':>9} {'|f5-usm|':>9}  (us, |diff| = 평균 절대차 vs 정식 언샤프)")
+    for s in args.sizes:
+        w, h = (s, s * H // W) if W >= H else (s * W // H, s)
+        w, h = w & ~1, h & ~1
+
+        def conv():
+            frame._cache.clear()
+            return frame.bgr_at(w, h)
+        img = conv()
+        t_conv = _timeit(conv, args.iters)
+        t_leg = _timeit(lambda: legacy.apply(img), args.iters)
+        t_f3 = _timeit(lambda: fused3.apply(img), args.iters)
+        t_f5 = _timeit(lambda: fused5.apply(img), args.iters)
+
+        def conv_luma():
+            frame._cache.clear()
+            return frame.bgr_at(w, h, None, luma.luma)
+        t_luma = _timeit(conv_luma, args.iters) - t_conv
+        t_sharp = _timeit(lambda: sharpness(frame.gray), args.iters)
+
+        blur = cv2.GaussianBlur(img, (0, 0), 1.0)
+        usm = cv2.addWeighted(img, 1.6, blur, -0.6, 0)
+        e3 = float(np.abs(fused3.apply(img).astype(np.int16) - usm).mean())
+        e5 = float(np.abs(fused5.apply(img).astype(np.int16) - usm).mean())
+        print(f"{w:>4}x{h:<4} {t_conv:>8.0f} {t_leg:>8.0f} {t_f3:>8.0f} {t_f5:>8.0f} {t_luma:>8.0f} "
+              f"{t_sharp:>7.0f} {e3:>9.2f} {e5:>9.2f}")
+    frame.release()
+
+
+# ─────────────────────────────────────────────
+# still: pi_still_monitor 정지 감지 프레임당 비용
+# ─────────────────────────────────────────────
+def _legacy_still_gray(buf, W, H, d=2, roi=0.6):
+    """기존 yuv420_to_gray_down (Y 전체 float32 변환 → 다운샘플 → ROI → sliding_window 3x3 평균)"""
+    from numpy.lib.stride_tricks import sliding_window_view
+    gray = np.frombuffer(buf, dtype=np.uint8, count=W * H).reshape((H, W)).astype(np.float32)
+    gray = gray[::d, ::d]
+    h, w = gray.shape
+    rx, ry = int(w * (1.0 - roi) / 2), int(h * (1.0 - roi) / 2)
+    gray = gray[ry:h - ry, rx:w - rx]
+    k = np.ones((3, 3), np.float32) / 9.0
+    return (sliding_window_view(gray, (3, 3)) * k).sum(axis=(-1, -2))
+
+
+def bench_still(args):
+    import tracemalloc
+
+    import cv2
+
+    from motion import StillnessDetector
+
+    rng = np.random.default_rng(0)
+    print(f"{'size':>9} {'legacy':>8} {'new':>8} {'alloc(B)':>9} {'|Δmean|':>8} "
+          f"{'local: mean':>12} {'block_max':>9}  (us/프레임, alloc = new 경로 프레임당 할당)")
+    for W, H in args.sizes:
+        base = cv2.GaussianBlur(rng.integers(0, 255, (H * 3 // 2, W), dtype=np.uint8), (0, 0), 2)
+        frames = [np.clip(base.astype(np.int16) + rng.integers(-3, 4, base.shape), 0, 255).astype(np.uint8).tobytes()
+                  for _ in range(4)]
+        ys = [np.frombuffer(f, np.uint8, count=W * H).reshape(H, W) for f in frames]
+
+        state = {"i": 0, "prev": None}
+
+        def legacy():
+            i = state["i"] = (state["i"] + 1) % len(frames)
+            g = _legacy_still_gray(frames[i], W, H, args.downscale)
+            if state["prev"] is not None:
+                float(np.mean(np.abs(g - state["prev"])))
+            state["prev"] = g
+
+        det = StillnessDetector(W, H, downscale=args.downscale, blocks=(4, 3))
+
+        def new():
+            i = state["i"] = (state["i"] + 1) % len(frames)
+            det.update(ys[i])
+
+        t_leg = _timeit(legacy, args.iters)
+        t_new = _timeit(new, args.iters)
+        tracemalloc.start()
+        new()
+        snap0 = tracemalloc.take_snapshot()
+        for _ in range(50):
+            new()
+        grown = sum(st.size_diff for st in tracemalloc.take_snapshot().compare_to(snap0, "filename"))
+        tracemalloc.stop()
+
+        # 같은 두 프레임의 평균 차 (기존 float vs uint8 경로)
+        a, b = _legacy_still_gray(frames[0], W, H, args.downscale), _legacy_still_gray(frames[1], W, H, args.downscale)
+        det.reset()
+        det.update(ys[0])
+        err = abs(det.update(ys[1]) - float(np.mean(np.abs(a - b))))
+
+        # ROI 한쪽 구석만 움직임 (손 하나) → 전체 평균은 작고 블록 최대는 큼
+        moved = base.copy()
+        sh, sw = det.shape
+        y0, x0 = H // 2 - sh * args.downscale // 2, W // 2 - sw * args.downscale // 2
+        moved[y0:y0 + H // 10, x0:x0 + W // 10] = 255
+        det.reset()
+        det.update(base[:H])
+        det.update(moved[:H])
+        print(f"{W:>4}x{H:<4} {t_leg:>8.0f} {t_new:>8.0f} {grown / 50:>9.0f} {err:>8.2f} "
+              f"{det.diff:>12.1f} {det.block_max:>9.0f}")
+
+
+def bench_still_latency(args):
+    """
+    합성 장면(움직이다 멈춤)으로 pi_still_monitor 정지 감지 루프를 돌려
+    '멈춘 프레임 촬영 시각 → basketStable' 지연과 이벤트 루프 최대 지연(WS ping/수신이 밀리는 시간)을 비교.
+    legacy   = 기존처럼 루프 안에서 블로킹 read (카메라 fps 보다 느리게 소비 → 파이프에 밀린 옛 프레임 처리)
+    reader   = reader 스레드 + 최신 프레임, 고정 임계값/STABLE_MS
+    adaptive = reader + 노이즈 모델 (모델이 준비될 때까지의 세션은 고정값 감지 + 학습, 이후 세션만 집계)
+    """
+    import asyncio
+
+    os.environ.update({"W": str(args.width), "H": str(args.height), "FPS": str(args.fps),
+                       "DIFF_THRESHOLD": str(args.threshold),
+                       "BLOCK_THRESHOLD": str(args.threshold * 2), "DEBUG": "0", "NOISE_FILE": ""})
+    import pi_still_monitor as m
+    from frame_source import SyntheticSource
+
+    class StampedSynthetic(SyntheticSource):
+        still_at = None
+
+        def _render(self):
+            super()._render()
+            if self.still_at is None and self._n >= self.move_frames:
+                # 이 프레임의 '촬영' 시각 = 페이스 기준 (소비자가 늦으면 실제로 읽히는 건 더 나중)
+                self.still_at = self._next - self.period
+
+    async def legacy_loop(ws_send, src):
+        det = m.make_detector()
+        buf = bytearray(src.frame_size)
+        mv = memoryview(buf)
+        y = np.frombuffer(buf, np.uint8, count=args.width * args.height).reshape(args.height, args.width)
+        frames, entered, stable_start = 0, time.time() * 1000.0, None
+        while True:
+            got = 0
+            while got < len(mv):
+                got += src.stream.readinto(mv[got:])
+            diff = det.update(y)
+            if frames < m.WARMUP_FRAMES or diff is None:
+                frames += 1
+                await asyncio.sleep(m.SAMPLE_INTERVAL)
+                continue
+            now = time.time() * 1000.0
+            if now - entered >= m.ENTER_GRACE_MS and det.still():
+                if stable_start is None:
+                    stable_start = now
+                elif now - stable_start >= m.STABLE_MS:
+                    await ws_send({"type": "basketStable"})
+                    return
+            else:
+                stable_start = None
+            frames += 1
+            await asyncio.sleep(m.SAMPLE_INTERVAL)
+
+    async def one(mode):
+        src = StampedSynthetic(args.width, args.height, args.fps, move_frames=args.move_frames)
+        lag = [0.0]
+        emitted = []
+
+        async def ticker():
+            while True:
+                t0 = time.monotonic()
+                await asyncio.sleep(0.005)
+                lag[0] = max(lag[0], time.monotonic() - t0 - 0.005)
+
+        async def ws_send(obj):
+            emitted.append(time.monotonic())
+
+        tick = asyncio.create_task(ticker())
+        m.ADAPTIVE_STILL = mode == "adaptive"
+        if mode == "legacy":
+            await legacy_loop(ws_send, src)
+        else:
+            await m.stillness_detect_and_signal(ws_send, make_source=lambda: src)
+        tick.cancel()
+        if src.still_at is None or emitted[0] < src.still_at:
+            return None, lag[0] * 1000.0     # 움직이는 중에 basketStable = 오검출
+        return (emitted[0] - src.still_at) * 1000.0, lag[0] * 1000.0
+
+    print(f"W={args.width} H={args.height} FPS={args.fps} SAMPLE_INTERVAL={m.SAMPLE_INTERVAL}s "
+          f"STABLE_MS={m.STABLE_MS} (지연 - STABLE_MS = 감지 경로 오버헤드)")
+    print(f"{'mode':>8} {'still→emit':>11} {'overhead':>9} {'max':>7} {'loop lag':>9} {'false':>6}  (ms)")
+    for mode in ("legacy", "reader", "adaptive"):
+        m._noise = None
+        for _ in range(10 if mode == "adaptive" else 0):
+            if m._noise is not None and m._noise.ready:
+                break
+            asyncio.run(one(mode))   # 학습용 세션
+        res = [asyncio.run(one(mode)) for _ in range(args.runs)]
+        lat = np.array([r[0] for r in res if r[0] is not None] or [np.nan])
+        print(f"{mode:>8} {lat.mean():>11.0f} {lat.mean() - m.STABLE_MS:>9.0f} {lat.max():>7.0f} "
+              f"{max(r[1] for r in res):>9.0f} {sum(r[0] is None for r in res):>6}")
+    if m._noise is not None:
+        print(f"{m._noise}  confirm={m._noise.confirm_ms(m.STABLE_MS, m.MIN_CONFIRM_MS):.0f}ms")
+
+
+# ─────────────────────────────────────────────
+# record / run: 녹화 클립으로 컨트롤러 검출 경로 전체 측정
+# ─────────────────────────────────────────────
+def _tfluna_frame(dist, strength=800, temp=(40 + 256) * 8):
+    from tfluna import checksum
+    f = bytearray(b"\x59\x59" + int(dist).to_bytes(2, "little") + int(strength).to_bytes(2, "little")
+                  + int(temp).to_bytes(2, "little") + b"\x00")
+    f[8] = checksum(f)
+    return bytes(f)
+
+
+class _FakeLuna:
+    """시간에 맞춰 프레임이 쌓이는 pyserial 흉내. 거리 필드 = 프레임 번호 (→ 샘플 나이 계산)"""
+
+    def __init__(self, hz, corrupt_every=0, timeout=0.1):
+        self.hz, self.timeout = hz, timeout
+        self.corrupt_every = corrupt_every
+        self.t0 = time.monotonic()
+        self.sent = 0
+        self._buf = bytearray()
+
+    def _fill(self):
+        due = int((time.monotonic() - self.t0) * self.hz)
+        while self.sent < due:
+            f = bytearray(_tfluna_frame(self.sent % 65536))
+            if self.corrupt_every and self.sent % self.corrupt_every == 0:
+                f[4] ^= 0x10
+            self._buf += f
+            self.sent += 1
+
+    @property
+    def in_waiting(self):
+        self._fill()
+        return len(self._buf)
+
+    def read(self, n=1):
+        t_end = time.monotonic() + self.timeout
+        while True:
+            self._fill()
+            if self._buf or time.monotonic() >= t_end:
+                break
+            time.sleep(0.5 / self.hz)
+        out = bytes(self._buf[:n])
+        del self._buf[:n]
+        return out
+
+    def age_ms(self, dist):
+        self._fill()
+        return ((self.sent - 1 - dist) % 65536) / self.hz * 1000.0
+
+
+def _legacy_parse_tfluna(ser):
+    """기존 parse_tfluna_frame (1바이트씩, 체크섬 무시)"""
+    if ser.read(1) != b'\x59':
+        return None
+    if ser.read(1) != b'\x59':
+        return None
+    rest = ser.read(7)
+    if len(rest) < 7:
+        return None
+    return rest[0] + rest[1] * 256
+
+
+def bench_lidar(args):
+    from tfluna import TFLunaParser, TFLunaReader
+
+    # 파서 정확성: 쓰레기 바이트/가짜 헤더/체크섬 오류/조각난 프레임
+    p = TFLunaParser()
+    good = [_tfluna_frame(d) for d in (120, 45, 300)]
+    bad = bytearray(_tfluna_frame(77))
+    bad[3] ^= 1
+    stream = b"\x00\x59\x13" + good[0] + bytes(bad) + b"\x59" + good[1] + good[2][:5]
+    s1 = p.feed(stream)
+    s2 = p.feed(good[2][5:])
+    print(f"parser: {s1.dist}cm → {s2.dist}cm {s2.temp:.0f}°C  ({p})")
+
+    print(f"{'mode':>8} {'samples':>8} {'age p50':>8} {'age p95':>8} {'age max':>8}  "
+          f"(TF-Luna {args.hz}Hz, 1/{args.corrupt_every} 프레임 손상, 판단에 쓴 샘플의 나이 ms)")
+    for mode in ("legacy", "reader"):
+        ser = _FakeLuna(args.hz, args.corrupt_every)
+        reader = TFLunaReader(ser)
+        ages = []
+        t_end = time.monotonic() + args.seconds
+        while time.monotonic() < t_end:
+            if mode == "legacy":
+                d = _legacy_parse_tfluna(ser)
+                if d is None:
+                    continue
+                ages.append(ser.age_ms(d))
+                time.sleep(0.02)
+            else:
+                s = reader.poll()
+                if s is None or not s.ok:
+                    continue
+                ages.append(ser.age_ms(s.dist))
+        a = np.array(ages)
+        print(f"{mode:>8} {len(a):>8} {np.percentile(a, 50):>8.0f} {np.percentile(a, 95):>8.0f} {a.max():>8.0f}"
+              + (f"  {reader}" if mode == "reader" else ""))
+
+    # 접근 예측: 걸어와 멈춤 / 앞에 서서 흔들림 / 멀리서 지나감 → prewarm 이 임계 도달보다 얼마나 먼저인가
+    from tfluna import ApproachTrend, Sample
+    rng = np.random.default_rng(0)
+    print(f"\n{'scenario':>16} {'prewarm@cm':>10} {'lead ms':>8}  (임계 {args.threshold}cm, horizon {args.horizon}s, "
+          f"최소 {args.min_speed:.0f}cm/s, 노이즈 ±{args.noise}cm)")
+    dt = 1.0 / args.hz
+    walks = [(f"walk {v:.1f}m/s", lambda t, v=v: max(30.0, 300.0 - v * 100 * t)) for v in (0.5, 1.0, 1.5)]
+    walks += [("stand 150cm", lambda t: 150.0 + 5 * np.sin(t * 3)),
+              ("pass 250cm", lambda t: 250.0 - 40 * np.exp(-((t - 2) / 0.4) ** 2))]
+    for name, dist in walks:
+        trend = ApproachTrend(args.trend)
+        pre = cross = None
+        for i in range(int(5.0 * args.hz)):
+            t = i * dt
+            d = int(round(dist(t) + rng.normal(0, args.noise)))
+            trend.update(Sample(d, 800, 40.0, t, True))
+            if cross is None and d <= args.threshold:
+                cross = t
+            if pre is None and d > args.threshold:
+                eta = trend.eta(args.threshold, args.min_speed)
+                if eta is not None and eta <= args.horizon:
+                    pre = (t, d)
+        lead = f"{(cross - pre[0]) * 1000:>8.0f}" if pre and cross is not None else f"{'-':>8}"
+        print(f"{name:>16} {pre[1] if pre else '-':>10} {lead}")
+
+
+def bench_record(args):
+    from frame_ring import FrameRing
+    from frame_source import open_source
+
+    src = open_source(args.source, args.width, args.height, args.fps, record=args.out)
+    ring = FrameRing(args.width, args.height)
+    t_end = time.monotonic() + args.seconds
+    while time.monotonic() < t_end and ring.fill_from(src.stream) is not False:
+        pass
+    src.close()
+    print(f"recorded {ring.seq} frames {args.width}x{args.height} → {args.out}")
+
+
+def _rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024.0
+    return 0.0
+
+
+def bench_run(args):
+    # 컨트롤러 설정은 import 시 env 에서 읽으므로 먼저 채움
+    os.environ.update({
+        "CAM_SOURCE": args.source,
+        "WORKERS": str(args.workers),
+        "CAMERAS": ",".join(f"cam{i}={args.source}" for i in range(args.cameras)) if args.cameras > 1 else "",
+        "CAM_W": str(args.width), "CAM_H": str(args.height), "CAM_FPS": str(args.fps),
+        "CAM_REPLAY_REALTIME": "0" if args.max_speed else "1",
+        "CAM_REPLAY_LOOP": "1" if args.seconds > 0 else "0",
+        "DETECTOR_BACKEND": args.backend,
+        "STUB_INFER_MS": str(args.stub_ms),
+        "SAVE_IMAGES": os.environ.get("SAVE_IMAGES", "0"),
+        "METRICS_ADDR": "",
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "warn"),
+    })
+    if args.model:
+        os.environ["OV_MODEL_DIR"] = args.model
+    import controller_ws3
+
+    c = controller_ws3.Controller()
+    events = []
+    first_stable = [None]
+
+    def on_event(obj):
+        if obj.get("type") != "yoloDetection":
+            return
+        events.append(obj)
+        if first_stable[0] is None and (c.lanes[0].tracker is None or obj.get("final")):
+            first_stable[0] = time.monotonic()
+    c.ws_send_json = on_event
+
+    c.start_yolo()
+    c.enable_vision()
+    ru0 = resource.getrusage(resource.RUSAGE_SELF)
+    t0 = time.monotonic()
+    c.start_camera()
+    c.start_main_loop()
+
+    while True:
+        time.sleep(0.1)
+        if args.seconds > 0 and time.monotonic() - t0 >= args.seconds:
+            break
+        if args.seconds <= 0 and not any(l.cam_thread.is_alive() for l in c.lanes):
+            time.sleep(0.5)   # 마지막 프레임 처리 대기
+            break
+    wall = time.monotonic() - t0
+    ru1 = resource.getrusage(resource.RUSAGE_SELF)
+    snap = c.metrics.snapshot()
+
+    stages = snap["stagesMs"]
+    done = stages.get("frame_age", {}).get("n", 0)
+    cpu = (ru1.ru_utime - ru0.ru_utime) + (ru1.ru_stime - ru0.ru_stime)
+    frames_in = sum(l.frames.seq for l in c.lanes)
+    print(f"source   : {c.lanes[0].cam_source}" + (f"  × {len(c.lanes)} cameras" if len(c.lanes) > 1 else ""))
+    print(f"detector : {type(c.detector).__name__} imgsz={c.detector.imgsz} batch={c.detector.batch} "
+          f"pipeline={type(c.pipeline).__name__ if c.pipeline else None}")
+    print(f"wall     : {wall:.2f}s  frames in={frames_in} ({frames_in / wall:.1f}/s)  "
+          f"inferred={done} ({done / wall:.1f}/s)")
+    print(f"counters : {snap['counters']}  gauges={snap['gauges']}")
+    print(f"cpu      : {cpu / wall * 100:.0f}% of one core  rss={_rss_mb():.0f}MB  "
+          f"peak={ru1.ru_maxrss / 1024:.0f}MB")
+    tts = f"{(first_stable[0] - t0) * 1000:.0f}ms" if first_stable[0] else "never"
+    print(f"stable   : first stable signature after {tts}  events={len(events)}")
+    print(f"{'stage':>12} {'n':>6} {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8}  (ms)")
+    for k in ("frame_wait", "convert", "enhance", "preprocess", "infer", "postprocess", "frame_age"):
+        v = stages.get(k)
+        if v and "p50" in v:
+            print(f"{k:>12} {v['n']:>6} {v['mean']:>8.2f} {v['p50']:>8.2f} {v['p95']:>8.2f} {v['p99']:>8.2f}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("agg", help="검출 집계 비용 vs 박스 수")
+    p.add_argument("--classes", type=int, default=53)
+    p.add_argument("--conf", type=float, default=0.15)
+    p.add_argument("--iters", type=int, default=2000)
+    p.set_defaults(fn=bench_agg)
+
+    p = sub.add_parser("enhance", help="입력 보정 비용 (기존 vs fused vs luma)")
+    p.add_argument("--width", type=int, default=640)
+    p.add_argument("--height", type=int, default=480)
+    p.add_argument("--sizes", type=int, nargs="+", default=[640, 416, 320])
+    p.add_argument("--threads", type=int, default=0, help="cv2.setNumThreads (0=기본)")
+    p.add_argument("--iters", type=int, default=300)
+    p.set_defaults(fn=bench_enhance)
+
+    p = sub.add_parser("still", help="정지 감지 프레임당 비용 (기존 vs StillnessDetector)")
+    p.add_argument("--sizes", type=lambda s: tuple(int(v) for v in s.split("x")), nargs="+",
+                   default=[(320, 240), (640, 480)], help="WxH ...")
+    p.add_argument("--downscale", type=int, default=2)
+    p.add_argument("--iters", type=int, default=500)
+    p.set_defaults(fn=bench_still)
+
+    p = sub.add_parser("still-latency", help="정지 → basketStable 지연 + 이벤트 루프 지연 (기존 vs reader)")
+    p.add_argument("--width", type=int, default=320)
+    p.add_argument("--height", type=int, default=240)
+    p.add_argument("--fps", type=int, default=15)
+    p.add_argument("--threshold", type=float, default=0.5, help="DIFF_THRESHOLD (합성 장면은 노이즈가 작아 낮게)")
+    p.add_argument("--move-frames", type=int, default=45)
+    p.add_argument("--runs", type=int, default=3)
+    p.set_defaults(fn=bench_still_latency)
+
+    p = sub.add_parser("lidar", help="TF-Luna 샘플 나이 (기존 vs 일괄 read) + prewarm 선행 시간")
+    p.add_argument("--hz", type=int, default=100)
+    p.add_argument("--seconds", type=float, default=3.0)
+    p.add_argument("--corrupt-every", type=int, default=50, help="N 프레임마다 하나 손상 (0=없음)")
+    p.add_argument("--threshold", type=int, default=50, help="LIDAR_THRESH_CM")
+    p.add_argument("--horizon", type=float, default=1.5, help="LIDAR_PREWARM_SEC")
+    p.add_argument("--min-speed", type=float, default=20.0, help="LIDAR_PREWARM_MIN_SPEED")
+    p.add_argument("--trend", type=float, default=0.5, help="LIDAR_TREND_SEC")
+    p.add_argument("--noise", type=float, default=2.0, help="거리 노이즈 σ (cm)")
+    p.set_defaults(fn=bench_lidar)
+
+    p = sub.add_parser("record", help="프레임 소스(기본 카메라) → raw I420 파일")
+    p.add_argument("out")
+    p.add_argument("--source", default="rpicam")
+    p.add_argument("--seconds", type=float, default=10.0)
+    p.add_argument("--width", type=int, default=640)
+    p.add_argument("--height", type=int, default=480)
+    p.add_argument("--fps", type=int, default=25)
+    p.set_defaults(fn=bench_record)
+
+    p = sub.add_parser("run", help="컨트롤러 검출 경로 전체 (fps / 지연 / CPU / RSS / 안정화 시간)")
+    p.add_argument("--source", default="synthetic:300", help="replay:/path.i420 | synthetic[:N] | rpicam | broker[:이름]")
+    p.add_argument("--max-speed", action="store_true", help="녹화 fps 무시하고 최대 속도 재생")
+    p.add_argument("--seconds", type=float, default=0, help=">0 이면 소스를 반복하며 이 시간만큼 측정")
+    p.add_argument("--backend", default="stub", help="stub | openvino | ultralytics")
+    p.add_argument("--model", default=None, help="OV_MODEL_DIR (기본 env)")
+    p.add_argument("--stub-ms", type=float, default=40.0, help="stub 추론 시간 흉내 (ms)")
+    p.add_argument("--width", type=int, default=640)
+    p.add_argument("--height", type=int, default=480)
+    p.add_argument("--fps", type=int, default=25)
+    p.add_argument("--cameras", type=int, default=1, help=">1 이면 같은 소스를 레인 N 개로 (CAMERAS, batch 추론)")
+    p.add_argument("--workers", type=int, default=0, help=">0 이면 추론 워커 프로세스 N 개 (공유 메모리 링)")
+    p.set_defaults(fn=bench_run)
+
+    args = ap.parse_args()
+    args.fn(args)
+
+
+if __name__ == "__main__":
+    main()
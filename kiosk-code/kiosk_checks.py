@@ -0,0 +1,708 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+kiosk_checks.py — 하드웨어/모델 없이 돌리는 동작 확인 (assert 기반, 카메라/시리얼/모델 불필요)
+  python3 kiosk_checks.py             전체
+  python3 kiosk_checks.py gate final  이름에 해당 문자열이 들어간 것만
+- 모션 게이트: 안 바뀐 장면은 추론 생략, refresh_every 마다 강제 추론
+- final: 게이트가 생략한 프레임은 안정 카운트에 안 들어감 (새 추론 N 번으로만 확정)
+- 집계: conf 임계/이름표 밖 클래스 제외, 같은 구성 = 같은 서명
+- 추적기: min_hits 전엔 개수 제외, 한 프레임 빠져도 유지, birth_conf
+- ROI: 비율/픽셀, 짝수 정렬, 프레임 밖 자르기, 잘못된 설정
+- CAMERAS: sid=source 목록, 중복/형식 오류 / 검출기 폴백이 OpenVINO 전용 인자(batch/threads)를 버리는지
+- NoiseFloor: ready/quiet/accept, 확인 구간, 부트스트랩 학습이 손 움직임 프레임을 버리는지
+- TF-Luna: 조각난 프레임/재동기/체크섬/신호세기/최신 샘플만
+- 프레임 링: 잡힌/최신 슬롯 보호, skipped, 빈 슬롯 없을 때 None, 끊긴 스트림
+- 카메라 브로커: 클라이언트가 잡은 슬롯 보호, 빈 슬롯 없을 때 None, 해지 시 pin 정리,
+  워커 풀에 브로커 링을 넘긴 프로세스가 끝나도 브로커 공유 메모리 유지
+- 워커 풀: 슬롯 수가 다른 공유 링, 죽은 워커 재시작 + 프레임 release, on_result 예외에도 release
+- 입력 보정: 홀수 크기/홀수 ROI 에서도 luma 적용, 캐시 분리
+- INT8 양자화 입력: 캡처 ROI 크롭 + letterbox 크기 + luma 보정
+- 캡처 인덱스: 샤드 압축 후 read_path, 인덱스 이전 파일 등록, 재압축/purge
+"""
+
+import os
+import sys
+import traceback
+from types import SimpleNamespace
+
+import numpy as np
+
+os.environ.setdefault("LOG_LEVEL", "warn")
+os.environ.setdefault("METRICS_ADDR", "")
+os.environ.setdefault("SAVE_IMAGES", "0")
+
+CHECKS = []
+
+
+def check(fn):
+    CHECKS.append(fn)
+    return fn
+
+
+NAMES = {0: "apple", 1: "banana", 2: "cola"}
+
+
+def _boxes(n, jitter=0.0):
+    return np.array([[10 + 60 * i + jitter, 10, 50 + 60 * i + jitter, 50] for i in range(n)], np.float32)
+
+
+# ─────────────────────────────────────────────
+# 모션 게이트 / final
+# ─────────────────────────────────────────────
+@check
+def check_motion_gate():
+    from motion import MotionGate
+    g = MotionGate(160, 120, downscale=8, threshold=3.0, refresh_every=5)
+    scene = np.full((120, 160), 60, np.uint8)
+    assert g.check(scene)                       # 첫 프레임은 기준이 없으니 추론
+    assert [g.check(scene) for _ in range(5)] == [False] * 4 + [True]   # 5번째는 강제 갱신
+    moved = scene.copy()
+    moved[40:80, 40:80] = 200
+    assert g.check(moved)                       # 장면 변화 → 추론
+    assert not g.check(moved)                   # 기준 = 마지막으로 추론한 프레임
+    skip, refresh = g.stats()
+    assert 0 < skip < 1 and 0 < refresh < 1 and g.checked == 0
+    g.reset()
+    assert g.check(moved)
+
+
+def _controller_lane():
+    import controller_ws3 as cw
+    from det_aggregate import Aggregator
+    from tracker import Tracker
+    c = cw.Controller.__new__(cw.Controller)
+    c.capture = None
+    c.detector = SimpleNamespace(names=NAMES)
+    c._agg = Aggregator(NAMES, cw.CONF_THRESHOLD)
+    lane = cw.Lane(0, None, "synthetic:50", 4)
+    lane._roi_pending = False
+    lane.roi = None
+    lane.tracker = Tracker(len(NAMES), min_hits=2, stable_frames=4)
+    return c, lane
+
+
+def _infer_until_final(gated_between):
+    """final 이 나올 때까지 새 추론 횟수 (추론 사이마다 게이트 생략 프레임 gated_between 개)"""
+    from detectors import Detections
+    c, lane = _controller_lane()
+    dets = Detections(np.array([0, 1], np.int32), np.array([0.9, 0.8], np.float32), _boxes(2))
+    for n in range(1, 50):
+        ev = c._lane_result(lane, dets, None, 640, 480)
+        if ev and ev.get("final"):
+            return n
+        for _ in range(gated_between):
+            c._hold_stability(lane)
+    raise AssertionError("never final")
+
+
+@check
+def check_final_needs_real_inferences():
+    n = _infer_until_final(0)
+    assert n > 1
+    # 게이트가 추론을 생략한 프레임을 아무리 끼워 넣어도 필요한 새 추론 수는 같음
+    assert _infer_until_final(10) == n
+
+
+# ─────────────────────────────────────────────
+# 검출 집계
+# ─────────────────────────────────────────────
+@check
+def check_aggregate():
+    from det_aggregate import Aggregator
+    agg = Aggregator(NAMES, 0.25)
+    a = agg([0, 0, 1, 2, 7, -1], [0.9, 0.3, 0.2, 0.5, 0.99, 0.99])
+    assert a.counts.tolist() == [2, 0, 1]       # conf 미달/이름표 밖 클래스 제외
+    assert a.counts_dict() == {"apple": 2, "cola": 1}
+    assert a.main() == 0 and a.name(a.main()) == "apple"
+    assert abs(float(a.maxconf[0]) - 0.9) < 1e-6
+    assert agg([0, 2], [0.9, 0.5]).sig == agg([2, 0], [0.6, 0.3]).sig   # 같은 구성 = 같은 서명
+    assert agg([], []).empty
+
+
+# ─────────────────────────────────────────────
+# 추적기 확정
+# ─────────────────────────────────────────────
+@check
+def check_tracker_confirm():
+    from tracker import Tracker
+    t = Tracker(3, min_hits=2, stable_frames=4)
+    cls, conf = np.array([0, 1]), np.array([0.9, 0.8], np.float32)
+    t.update(cls, conf, _boxes(2))
+    assert len(t.tracks()[0]) == 0 and not t.stable     # min_hits 전에는 개수에 안 들어감
+    for i in range(4):
+        t.update(cls, conf, _boxes(2, jitter=i))
+    assert sorted(t.tracks()[0].tolist()) == [0, 1] and t.stable
+
+    # 한 프레임 박스가 빠져도 (max_age 이내) 개수 유지
+    t.update(cls[:1], conf[:1], _boxes(1))
+    assert sorted(t.tracks()[0].tolist()) == [0, 1] and t.stable
+
+    t.reset()
+    assert len(t.boxes) == 0 and not t.stable
+
+
+@check
+def check_tracker_birth_conf():
+    from tracker import Tracker
+    # high_conf 미만이지만 birth_conf 이상인 검출도 새 트랙 (추적기 없이 세던 개수와 같게)
+    t = Tracker(3, high_conf=0.4, min_hits=1, birth_conf=0.25)
+    t.update([0], [0.3], _boxes(1))
+    assert t.tracks()[0].tolist() == [0]
+    # birth_conf 미만은 새 트랙을 만들지 않음
+    t = Tracker(3, high_conf=0.4, min_hits=1, birth_conf=0.25)
+    t.update([0], [0.2], _boxes(1))
+    assert len(t.tracks()[0]) == 0
+    # birth_conf 는 high_conf 로 잘림
+    assert Tracker(3, high_conf=0.4, birth_conf=0.9).birth_conf == 0.4
+
+
+# ─────────────────────────────────────────────
+# 바구니 ROI
+# ─────────────────────────────────────────────
+@check
+def check_roi_parse():
+    from basket_roi import parse_roi
+    assert parse_roi("", 640, 480) is None
+    assert parse_roi("0.25,0.25,0.5,0.5", 640, 480) == (160, 120, 320, 240)
+    # 픽셀 + 홀수 → 짝수 정렬 (I420 U/V 평면 자르기)
+    x, y, w, h = parse_roi("101,51,201,101", 640, 480)
+    assert (x, y) == (100, 50) and w % 2 == 0 and h % 2 == 0
+    assert x + w <= 302 and y + h <= 152
+    # 프레임 밖은 잘림
+    x, y, w, h = parse_roi("600,400,200,200", 640, 480)
+    assert x + w <= 640 and y + h <= 480 and w >= 2 and h >= 2
+    for spec in ("1,2,3", "a,b,c,d"):
+        try:
+            parse_roi(spec, 640, 480)
+        except ValueError:
+            continue
+        raise AssertionError(f"parse_roi({spec!r}) should fail")
+
+
+# ─────────────────────────────────────────────
+# 멀티 카메라 설정
+# ─────────────────────────────────────────────
+@check
+def check_camera_spec():
+    import controller_ws3 as cw
+    assert cw.parse_cameras("") == [(None, cw.CAM_SOURCE)]
+    assert cw.parse_cameras(" a=cam:0 , b=broker:left ") == [("a", "cam:0"), ("b", "broker:left")]
+    # source 안의 '=' 는 그대로
+    assert cw.parse_cameras("a=replay:x=1.i420") == [("a", "replay:x=1.i420")]
+    for spec in ("cam:0", "=cam:0", "a=cam:0,a=cam:1"):
+        try:
+            cw.parse_cameras(spec)
+        except ValueError:
+            continue
+        raise AssertionError(f"parse_cameras({spec!r}) should fail")
+
+
+@check
+def check_detector_fallback_kwargs():
+    """openvino 가 없거나 다른 백엔드일 때 batch/threads 등 OpenVINO 전용 인자로 죽지 않음"""
+    import detectors
+    seen = []
+    orig = detectors.UltralyticsDetector
+    detectors.UltralyticsDetector = lambda model_dir, **kw: seen.append(sorted(kw))
+    try:
+        detectors.load_detector("ultralytics", "x", imgsz=640, conf=0.25, batch=2)
+        if "openvino" not in sys.modules:
+            try:
+                import openvino  # noqa: F401
+            except ImportError:
+                detectors.load_detector("openvino", "x", device="CPU", perf_hint="LATENCY", imgsz=640,
+                                        cache_dir=None, batch=2, threads=2)
+    finally:
+        detectors.UltralyticsDetector = orig
+    ov_only = {"device", "perf_hint", "cache_dir", "batch", "threads"}
+    assert seen and not ov_only & {k for kw in seen for k in kw}, seen
+
+
+# ─────────────────────────────────────────────
+# 정지 감지 노이즈 모델
+# ─────────────────────────────────────────────
+@check
+def check_noise_floor():
+    from motion import NoiseFloor
+    rng = np.random.default_rng(0)
+    nf = NoiseFloor((3, 4), z=4.0, min_samples=30)
+    assert not nf.ready and nf.accept(np.full((3, 4), 99.0))     # 준비 전 accept 는 판단 안 함
+    for _ in range(40):
+        nf.update(np.abs(rng.normal(3.0, 0.5, (3, 4))))
+    assert nf.ready
+    assert nf.quiet(np.full((3, 4), 3.0))
+    hand = np.full((3, 4), 3.0)
+    hand[1, 2] = 40.0
+    assert not nf.quiet(hand) and not nf.accept(hand)
+
+    # 확인 구간: 관측이 적으면 중간값, 많으면 p95×1.25 를 [min, default] 로
+    assert nf.confirm_ms(1000, 300) == 650
+    for _ in range(20):
+        nf.record_run(200)
+    assert nf.confirm_ms(1000, 300) == 300
+    for _ in range(20):
+        nf.record_run(600)
+    assert nf.confirm_ms(1000, 300) == 750
+
+
+@check
+def check_noise_bootstrap():
+    from motion import NoiseFloor
+    rng = np.random.default_rng(1)
+    quiet = [np.abs(rng.normal(3.0, 0.5, (3, 4))) for _ in range(20)]
+    hand = np.full((3, 4), 3.0)
+    hand[0, 0] = 40.0     # 고정 임계값(80/160)은 통과하는 정도의 손 움직임
+
+    nf = NoiseFloor((3, 4))
+    assert nf.learn(quiet + [hand] * 5) == 20        # 구간 중앙값 기준으로 손 프레임 제외
+    assert nf.mean.max() < 5.0
+
+    # 구간 전체가 움직임이면 (중앙값이 커도) boot_max 위는 학습 안 함
+    nf = NoiseFloor((3, 4))
+    assert nf.learn([np.full((3, 4), 30.0)] * 10, boot_max=12.0) == 0 and nf.n == 0
+    assert nf.learn([]) == 0
+
+
+# ─────────────────────────────────────────────
+# TF-Luna
+# ─────────────────────────────────────────────
+def _luna(dist, strength=800, temp=(40 + 256) * 8):
+    from tfluna import checksum
+    f = bytearray(b"\x59\x59" + int(dist).to_bytes(2, "little") + int(strength).to_bytes(2, "little")
+                  + int(temp).to_bytes(2, "little") + b"\x00")
+    f[8] = checksum(f)
+    return bytes(f)
+
+
+@check
+def check_tfluna_parse():
+    from tfluna import TFLunaParser
+    p = TFLunaParser(min_strength=100)
+    s = p.feed(_luna(123), ts=1.0)
+    assert s is not None and s.dist == 123 and s.strength == 800 and s.ok and s.ts == 1.0
+    assert abs(s.temp - 40.0) < 1e-6
+
+    # 프레임이 두 조각으로 나뉘어 와도 합쳐서 한 번
+    f = _luna(77)
+    assert p.feed(f[:4]) is None
+    s = p.feed(f[4:])
+    assert s.dist == 77 and p.frames == 2
+
+
+@check
+def check_tfluna_resync():
+    from tfluna import TFLunaParser
+    p = TFLunaParser()
+    # 앞쪽 쓰레기 바이트 → 건너뛰고 재동기
+    s = p.feed(b"\x01\x02\x59\x03" + _luna(50))
+    assert s.dist == 50 and p.skipped == 4
+
+    # 체크섬 틀린 프레임은 버리고 다음 정상 프레임
+    bad = bytearray(_luna(10))
+    bad[8] ^= 0xFF
+    s = p.feed(bytes(bad) + _luna(60))
+    assert s.dist == 60 and p.corrupt == 1
+
+    # 한 번에 여러 프레임 → 마지막 것만, 나머지는 dropped
+    dropped = p.dropped
+    s = p.feed(_luna(1) + _luna(2) + _luna(3))
+    assert s.dist == 3 and p.dropped == dropped + 2
+
+    # 마지막 바이트가 헤더 앞부분(0x59)이면 남겨 두었다가 이어 붙임
+    f = _luna(99)
+    assert p.feed(b"\x00\x00" + f[:1]) is None
+    assert p.feed(f[1:]).dist == 99
+
+
+@check
+def check_tfluna_strength():
+    from tfluna import TFLunaParser
+    p = TFLunaParser(min_strength=100)
+    assert not p.feed(_luna(30, strength=50)).ok       # 약함
+    assert not p.feed(_luna(30, strength=65535)).ok    # 포화
+    assert p.feed(_luna(30, strength=100)).ok
+    assert p.weak == 2
+
+
+# ─────────────────────────────────────────────
+# 프레임 링
+# ─────────────────────────────────────────────
+def _i420(w, h, value):
+    """Y = value, U/V = 128 (무채색 → BGR 도 value)"""
+    f = np.full(w * h * 3 // 2, 128, np.uint8)
+    f[:w * h] = value
+    return f.tobytes()
+
+
+@check
+def check_frame_ring_pins():
+    import io
+    from frame_ring import FrameRing
+    ring = FrameRing(8, 6, slots=3)
+    assert ring.latest() is None and ring.seq == 0
+    assert ring.fill_from(io.BytesIO(_i420(8, 6, 1))) is True
+    held = ring.latest()
+    assert held.seq == 1 and int(held.yuv[0, 0]) == 1
+    # 잡힌 슬롯/최신 슬롯은 덮어쓰지 않음
+    for v in range(2, 8):
+        assert ring.fill_from(io.BytesIO(_i420(8, 6, v))) is True
+        assert int(held.yuv[0, 0]) == 1
+    f = ring.wait_newer(2, timeout=0)
+    assert f.seq == 7 and f.skipped == 4 and int(f.yuv[0, 0]) == 7
+    assert ring.fill_from(io.BytesIO(_i420(8, 6, 8))) is True
+    # 잡힌 두 슬롯 + 최신 슬롯 → 빈 슬롯 없음: None, 게시 없음, 스트림도 안 읽음
+    stream = io.BytesIO(_i420(8, 6, 9))
+    assert ring.fill_from(stream) is None and ring.seq == 8 and stream.tell() == 0
+    held.release()
+    assert ring.fill_from(stream) is True and ring.seq == 9
+    f.release()
+    assert ring.wait_newer(9, timeout=0.01) is None
+    # 끊긴 스트림 → False, 부분 프레임은 게시 안 함
+    assert ring.fill_from(io.BytesIO(_i420(8, 6, 3)[:10])) is False and ring.seq == 9
+
+
+# ─────────────────────────────────────────────
+# 카메라 브로커
+# ─────────────────────────────────────────────
+def _broker(w=8, h=6, slots=4):
+    """제어 스레드만 띄운 브로커 (프레임은 fill_from 으로 직접) → (broker, 이름)"""
+    import threading
+    from camera_broker import CameraBroker
+    name = f"kchk{os.getpid()}"
+    b = CameraBroker("synthetic", w, h, 25, slots=slots, name=name)
+    threading.Thread(target=b._control_loop, daemon=True).start()
+    return b, name
+
+
+def _close_broker(b):
+    b.close()
+    try:
+        os.unlink(b._xlock.path)
+    except FileNotFoundError:
+        pass
+
+
+def _retrack(b):
+    """브로커와 클라이언트가 한 프로세스일 때만: 클라이언트 attach 가 지운 브로커 등록을 되돌림 (3.13 미만)"""
+    from multiprocessing import resource_tracker
+    if sys.version_info < (3, 13):
+        resource_tracker.register(b.shm._name, "shared_memory")
+
+
+def _shm_exists(name):
+    return os.path.exists(f"/dev/shm/{name}")
+
+
+@check
+def check_broker_pins():
+    import io
+    from camera_broker import BrokerClient
+    b, name = _broker()
+    try:
+        c = BrokerClient(name)
+        _retrack(b)
+        assert b.fill_from(io.BytesIO(_i420(8, 6, 1))) is True
+        assert c.pump(1.0) and c.seq == 1
+        held = c.wait_newer(0, timeout=0)
+        assert held.seq == 1 and int(held.yuv[0, 0]) == 1
+        # 클라이언트가 잡은 슬롯/최신 슬롯은 덮어쓰지 않음
+        for v in range(2, 10):
+            assert b.fill_from(io.BytesIO(_i420(8, 6, v))) is True
+            assert int(held.yuv[0, 0]) == 1
+        c.pump(1.0)
+        f = c.wait_newer(1, timeout=0)
+        assert f.seq == 9 and int(f.yuv[0, 0]) == 9 and f.skipped == 7
+        # 슬롯 4개 = 잡힌 3 + 최신 1 → 빈 슬롯 없음: None, 게시 없음
+        assert b.fill_from(io.BytesIO(_i420(8, 6, 10))) is True
+        c.pump(1.0)
+        g = c.latest()
+        assert g.seq == 10
+        assert b.fill_from(io.BytesIO(_i420(8, 6, 11))) is True
+        assert b.fill_from(io.BytesIO(_i420(8, 6, 12))) is None and b.dropped_full == 1
+        assert int(b.mem.hdr[6]) == 11 and [int(fr.yuv[0, 0]) for fr in (held, f, g)] == [1, 9, 10]
+        for fr in (held, f, g):
+            fr.release()
+        assert not b.mem.pins.any()
+        assert b.fill_from(io.BytesIO(_i420(8, 6, 12))) is True
+        # 클라이언트 정리 → pin 행 비움 (잡은 채로 끝나도 슬롯이 풀림)
+        c.pump(1.0)
+        c.latest()
+        row = c.row
+        c.close()
+        for _ in range(50):
+            if row not in b._subs:
+                break
+            import time
+            time.sleep(0.02)
+        assert row not in b._subs and not b.mem.pins[row].any()
+    finally:
+        _close_broker(b)
+    assert not _shm_exists(name)
+
+
+_WORKER_CLIENT = """
+import sys, threading, time
+from camera_broker import BrokerClient
+from vision_workers import WorkerPool
+if __name__ == "__main__":
+    c = BrokerClient(sys.argv[1])
+    threading.Thread(target=lambda: [c.pump(0.2) for _ in iter(int, 1)], daemon=True).start()
+    done = threading.Event()
+    cfg = {"backend": "stub", "model_dir": None, "detector": {"imgsz": 32}, "enhance": {"mode": "off"}}
+    pool = WorkerPool(1, [c], task=lambda f: (0, f, None), on_result=lambda *a: done.set(), cfg=cfg,
+                      on_drop=lambda f: f.release())
+    pool.submit(c.wait_newer(0, timeout=5.0))
+    ok = done.wait(30.0)
+    pool.stop()
+    c.close()
+    sys.exit(0 if ok else 3)
+"""
+
+
+@check
+def check_broker_survives_worker_client():
+    """브로커 링을 워커 풀에 넘긴 클라이언트 프로세스가 끝나도 브로커 공유 메모리는 남아야 함"""
+    import io
+    import subprocess
+    b, name = _broker(16, 16)
+    try:
+        b.fill_from(io.BytesIO(_i420(16, 16, 200)))
+        here = os.path.dirname(os.path.abspath(__file__))
+        r = subprocess.run([sys.executable, "-c", _WORKER_CLIENT, name], cwd=here, timeout=120,
+                           capture_output=True, text=True, env=dict(os.environ, PYTHONPATH=here))
+        assert r.returncode == 0, r.stderr[-2000:]
+        assert "leaked shared_memory" not in r.stderr, r.stderr[-2000:]
+        assert _shm_exists(name)
+    finally:
+        _close_broker(b)
+
+
+# ─────────────────────────────────────────────
+# 추론 워커 프로세스
+# ─────────────────────────────────────────────
+def _pool(rings, on_result, infer_ms=0):
+    from vision_workers import WorkerPool
+    cfg = {"backend": "stub", "model_dir": None, "detector": {"imgsz": 32, "infer_ms": infer_ms},
+           "enhance": {"mode": "off"}}
+    return WorkerPool(1, rings, task=lambda item: (item[0], item[1], None), on_result=on_result,
+                      cfg=cfg, on_drop=lambda item: item[1].release())
+
+
+def _fill_to_slot(ring, slot, value):
+    """slot 에 value 프레임이 게시될 때까지 채우고 그 프레임을 고정해서 반환"""
+    import io
+    for _ in range(ring.slots * 2):
+        ring.fill_from(io.BytesIO(_i420(ring.w, ring.h, value)))
+        if ring._latest == slot:
+            return ring.latest()
+    raise AssertionError(f"slot {slot} never written")
+
+
+@check
+def check_worker_rings():
+    """슬롯 수가 다른 공유 링 두 개: 큰 링의 마지막 슬롯도 워커 출력 칸에 맞게 들어감, 끝나면 고정/공유 메모리 정리"""
+    import threading
+    from frame_ring import FrameRing
+    small = FrameRing(16, 16, slots=3, shared=True)
+    big = FrameRing(16, 16, slots=6, shared=True)
+    got, done = {}, threading.Event()
+
+    def on_result(item, dets, img, cw, ch, ms):
+        got[item[0]] = (int(img.mean()), cw, ch)
+        if len(got) == 2:
+            done.set()
+
+    pool = _pool([small, big], on_result)
+    try:
+        pool.submit((1, _fill_to_slot(big, 5, 200)))
+        pool.submit((0, _fill_to_slot(small, 2, 90)))
+        assert done.wait(30.0), got
+    finally:
+        pool.stop()
+    import cv2
+
+    def bgr_mean(v):
+        return int(cv2.cvtColor(np.frombuffer(_i420(16, 16, v), np.uint8).reshape(24, 16),
+                                cv2.COLOR_YUV2BGR_I420).mean())
+    assert abs(got[1][0] - bgr_mean(200)) <= 2 and abs(got[0][0] - bgr_mean(90)) <= 2, got
+    assert got[1][1:] == (16, 16), got
+    assert not any(small._pins) and not any(big._pins)
+    names = [small.shm.name, big.shm.name]
+    small.close()
+    big.close()
+    assert not any(_shm_exists(n) for n in names)
+
+
+@check
+def check_worker_restart_release():
+    """처리 중 워커가 죽으면 그 프레임을 놓아주고 다시 띄움 / on_result 예외에도 프레임은 release"""
+    import threading
+    import time
+    from frame_ring import FrameRing
+    ring = FrameRing(16, 16, slots=4, shared=True)
+    calls, done = [], threading.Event()
+
+    def on_result(item, dets, img, cw, ch, ms):
+        calls.append(item[1].seq)
+        done.set()
+        raise RuntimeError("on_result failure must not leak the pin")
+
+    pool = _pool([ring], on_result, infer_ms=1500)
+    try:
+        pool.submit((0, _fill_to_slot(ring, 0, 50)))
+        t_end = time.monotonic() + 10.0
+        while not pool._busy and time.monotonic() < t_end:
+            time.sleep(0.01)
+        time.sleep(0.3)   # 워커가 작업을 받아 추론 중
+        pool._procs[0].kill()
+        while (pool.restarts == 0 or any(ring._pins)) and time.monotonic() < t_end:
+            time.sleep(0.05)
+        assert pool.restarts == 1 and not any(ring._pins) and not calls
+
+        pool.submit((0, _fill_to_slot(ring, 1, 60)))
+        assert done.wait(30.0)
+        t_end = time.monotonic() + 2.0
+        while any(ring._pins) and time.monotonic() < t_end:
+            time.sleep(0.01)
+        assert len(calls) == 1 and not any(ring._pins)
+    finally:
+        pool.stop()
+        ring.close()
+
+
+# ─────────────────────────────────────────────
+# 입력 보정 (luma 훅)
+# ─────────────────────────────────────────────
+@check
+def check_bgr_at_luma():
+    """홀수 letterbox 크기/홀수 ROI 에서도 luma 가 적용되고, 적용 여부별로 캐시가 갈림"""
+    import io
+    import cv2
+    from frame_ring import FrameRing
+    ring = FrameRing(64, 48, slots=3)
+    ring.fill_from(io.BytesIO(_i420(64, 48, 100)))
+    f = ring.latest()
+
+    def brighten(y):
+        cv2.add(y, 40, dst=y)
+
+    for w, h, roi in ((32, 24, None), (31, 23, None), (33, 17, (8, 6, 40, 30)), (20, 15, (7, 5, 41, 31))):
+        plain = f.bgr_at(w, h, roi)
+        lit = f.bgr_at(w, h, roi, brighten)
+        assert plain.shape == lit.shape == (h, w, 3), (w, h, roi, plain.shape)
+        assert lit.mean() > plain.mean() + 30, (w, h, roi, plain.mean(), lit.mean())
+        assert f.bgr_at(w, h, roi) is plain and f.bgr_at(w, h, roi, brighten) is lit
+    f.release()
+
+
+# ─────────────────────────────────────────────
+# INT8 양자화 입력
+# ─────────────────────────────────────────────
+@check
+def check_quant_input_prep():
+    """보정/검증 입력이 컨트롤러처럼 캡처 ROI 로 크롭되고 letterbox 안쪽 크기로 맞춰짐"""
+    import json
+    import tempfile
+    import cv2
+    import numpy as np
+    from detectors import letterbox_fit
+    from enhance import Enhancer
+    from quantize_model import Capture, InputPrep
+
+    class _Fit:
+        imgsz = 320
+
+        def fit_size(self, w, h):
+            return letterbox_fit(w, h, self.imgsz)
+
+    with tempfile.TemporaryDirectory() as d:
+        img = np.zeros((480, 640, 3), np.uint8)
+        img[100:300, 200:500] = 200
+        full = os.path.join(d, "120000_000_apple_cnt1_conf0.90.jpg")
+        cv2.imwrite(full, img)
+        with open(full[:-4] + ".json", "w") as f:
+            json.dump({"imgSize": [640, 480], "inputSize": [320, 214], "roi": [200, 100, 300, 200]}, f)
+        crop = os.path.join(d, "120001_000_apple_cnt1_conf0.90.jpg")
+        cv2.imwrite(crop, img[:214, :320])
+        with open(crop[:-4] + ".json", "w") as f:
+            json.dump({"imgSize": [320, 214], "inputSize": [320, 214], "roi": [200, 100, 300, 200]}, f)
+
+        prep = InputPrep(_Fit())
+        prep.enh = Enhancer("off")
+        a = Capture(full, "apple", 1, True)
+        x = prep(a, a.load())
+        assert x.shape[1::-1] == letterbox_fit(300, 200, 320), x.shape
+        assert x.mean() > 190, x.mean()              # ROI 안쪽만 (바깥 검은 영역 없음)
+        b = Capture(crop, "apple", 1, True)
+        assert prep(b, b.load()).shape[1::-1] == letterbox_fit(320, 214, 320)   # 이미 크롭된 저장본은 그대로
+
+        prep.enh = Enhancer("luma", amount=1.0)
+        y = prep(a, a.load())
+        assert y.shape == x.shape and not np.array_equal(x, y)
+
+
+# ─────────────────────────────────────────────
+# 캡처 인덱스 / 샤드 압축
+# ─────────────────────────────────────────────
+@check
+def check_capture_index_compact():
+    """압축 후에도 imgPath 로 같은 바이트, 인덱스 이전 파일/사이드카 등록, 재압축은 새 샤드, purge 는 샤드까지"""
+    import tempfile
+    from datetime import datetime
+    from capture_index import CaptureIndex
+
+    with tempfile.TemporaryDirectory() as root:
+        idx = CaptureIndex(os.path.join(root, "index.sqlite"), root=root)
+        day = "20250101"
+        ddir = os.path.join(root, day)
+        os.makedirs(ddir)
+        ts = datetime.strptime(day + "120000", "%Y%m%d%H%M%S").timestamp()
+        a = os.path.join(ddir, "120000_000_cola_cnt1_conf0.90.jpg")
+        old = os.path.join(ddir, "110000_500_apple_cnt2_conf0.70.jpg")
+        blobs = {a: b"\xff\xd8A" * 50, old: b"\xff\xd8B" * 70}
+        for p, data in blobs.items():
+            with open(p, "wb") as f:
+                f.write(data)
+        with open(old[:-4] + ".json", "w") as f:
+            f.write('{"roi": null, "boxes": []}')
+        idx.add(ts, "cola", 1, 0.9, a, mode="annotated")
+        idx.flush()
+
+        assert idx.compact_day(day) == 2 and not os.path.exists(ddir)
+        for p, data in blobs.items():
+            assert idx.read_path(p) == data, p
+        rows = {r["path"]: r for r in idx.query(limit=0)}
+        assert rows[old]["label"] == "apple" and rows[old]["cnt"] == 2 and rows[old]["mode"] == "raw"
+        assert rows[old]["boxes"] and rows[a]["mode"] == "annotated" and rows[a]["shard"] == day + ".shard"
+
+        # 같은 날짜 폴더가 다시 생기면 (늦게 도착한 캡처) 새 샤드, 이전 샤드 읽기는 그대로
+        os.makedirs(ddir)
+        late = os.path.join(ddir, "235959_000_cola_cnt1_conf0.80.jpg")
+        with open(late, "wb") as f:
+            f.write(b"\xff\xd8C" * 30)
+        assert idx.compact_day(day) == 1
+        assert idx.read_path(late) == b"\xff\xd8C" * 30 and idx.read_path(a) == blobs[a]
+        assert {r["shard"] for r in idx.query(limit=0)} == {day + ".shard", day + "-1.shard"}
+
+        assert idx.purge_before("20250102") == 2
+        assert idx.query(limit=0) == [] and not [n for n in os.listdir(root) if ".shard" in n]
+
+
+def main(argv):
+    sel = [fn for fn in CHECKS if not argv or any(a in fn.__name__ for a in argv)]
+    failed = 0
+    for fn in sel:
+        try:
+            fn()
+            print(f"ok   {fn.__name__}")
+        except Exception:
+            failed += 1
+            print(f"FAIL {fn.__name__}")
+            traceback.print_exc()
+    print(f"{len(sel) - failed}/{len(sel)} passed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+kiosk_log.py — 핫루프용 비차단 로그 (컨트롤러 / 정지 감지 / TF-Luna 공용)
+- 호출 스레드는 (시각, 레벨, 이름, fmt, args) 튜플을 링버퍼에 넣고 바로 반환
+  포맷팅/콘솔 쓰기/flush 는 백그라운드 writer 스레드가 모아서 한 번에
+- 레벨 필터: LOG_LEVEL=debug|info|warn|error (스크립트별 기본값 지정 가능)
+- 키별 속도 제한: key="diff" 처럼 주면 LOG_RATE_S 초에 한 번만 출력, 생략 수는 다음 줄에 (+N) (스레드 안전)
+- debug 레코드는 레벨과 무관하게 별도 링(LOG_DEBUG_KEEP 개)에 포맷 없이 보관
+  → SIGUSR1 (또는 dump()) 로 최근 N개를 출력 (현장 문제 재현용)
+"""
+
+import atexit
+import os
+import signal
+import sys
+import threading
+import time
+from collections import deque
+
+DEBUG, INFO, WARN, ERROR = 10, 20, 30, 40
+_LEVELS = {"debug": DEBUG, "info": INFO, "warn": WARN, "warning": WARN, "error": ERROR}
+_NAMES = {DEBUG: "D", INFO: "I", WARN: "W", ERROR: "E"}
+
+LOG_RING = int(os.environ.get("LOG_RING", "2048"))            # writer 대기 링 크기 (넘치면 오래된 것 버림)
+LOG_RATE_S = float(os.environ.get("LOG_RATE_S", "1.0"))       # key 지정 메시지의 기본 최소 간격
+LOG_DEBUG_KEEP = int(os.environ.get("LOG_DEBUG_KEEP", "500"))  # 덤프용 debug 레코드 보관 수
+
+
+def _format(rec):
+    ts, lvl, name, fmt, args = rec
+    try:
+        return (fmt % args) if args else str(fmt)
+    except Exception:
+        return f"{fmt} {args!r}"
+
+
+class _Writer:
+    """모든 로거가 공유하는 링버퍼 + writer 스레드 (프로세스당 하나)"""
+
+    def __init__(self, ring=LOG_RING, stream=None):
+        self._q = deque(maxlen=max(16, int(ring)))
+        self._cv = threading.Condition(threading.Lock())
+        self._stream = stream or sys.stdout
+        self.dropped = 0
+        threading.Thread(target=self._run, name="kiosk-log", daemon=True).start()
+        atexit.register(self.flush)
+
+    def put(self, line_or_rec):
+        with self._cv:
+            if len(self._q) == self._q.maxlen:
+                self.dropped += 1
+            self._q.append(line_or_rec)
+            self._cv.notify()
+
+    def _run(self):
+        while True:
+            with self._cv:
+                while not self._q:
+                    self._cv.wait()
+            self.flush()
+
+    def flush(self):
+        with self._cv:
+            batch = list(self._q)
+            self._q.clear()
+            dropped, self.dropped = self.dropped, 0
+        if not batch and not dropped:
+            return
+        out = []
+        if dropped:
+            out.append(f"[LOG] ring full, dropped {dropped} records")
+        for item in batch:
+            out.append(item if isinstance(item, str) else _format(item))
+        try:
+            self._stream.write("\n".join(out) + "\n")
+            self._stream.flush()
+        except Exception:
+            pass
+
+
+_writer = None
+_writer_lock = threading.Lock()
+_debug_ring = deque(maxlen=max(1, LOG_DEBUG_KEEP))
+
+
+def _get_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = _Writer()
+    return _writer
+
+
+class KioskLog:
+    def __init__(self, name, default_level="info"):
+        self.name = name
+        self.level = _LEVELS.get(os.environ.get("LOG_LEVEL", default_level).lower(), INFO)
+        self._last = {}        # key → 마지막 출력 시각
+        self._suppressed = {}  # key → 생략 수
+        self._rate_lock = threading.Lock()   # 같은 로거를 여러 스레드가 씀 (key 지정 호출만 잡음)
+        self._w = _get_writer()
+
+    def enabled(self, lvl):
+        return lvl >= self.level
+
+    def log(self, lvl, fmt, *args, key=None, every=None):
+        now = time.time()
+        rec = (now, lvl, self.name, fmt, args)
+        if lvl == DEBUG:
+            _debug_ring.append(rec)
+        if lvl < self.level:
+            return
+        if key is not None:
+            gap = LOG_RATE_S if every is None else every
+            with self._rate_lock:
+                last = self._last.get(key)
+                if last is not None and now - last < gap:
+                    self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                    return
+                self._last[key] = now
+                n = self._suppressed.pop(key, 0)
+            if n:
+                rec = (now, lvl, self.name, "%s (+%d suppressed)", (_format(rec), n))
+        self._w.put(rec)
+
+    def debug(self, fmt, *args, **kw):
+        self.log(DEBUG, fmt, *args, **kw)
+
+    def info(self, fmt, *args, **kw):
+        self.log(INFO, fmt, *args, **kw)
+
+    def warn(self, fmt, *args, **kw):
+        self.log(WARN, fmt, *args, **kw)
+
+    def error(self, fmt, *args, **kw):
+        self.log(ERROR, fmt, *args, **kw)
+
+
+def get_logger(name, default_level="info"):
+    return KioskLog(name, default_level)
+
+
+def dump(n=None):
+    """최근 debug 레코드 n 개(기본 전부)를 writer 로 출력하고 줄 목록 반환"""
+    recs = list(_debug_ring)
+    if n is not None:
+        recs = recs[-int(n):]
+    lines = [f"{time.strftime('%H:%M:%S', time.localtime(r[0]))}.{int(r[0] * 1000) % 1000:03d} "
+             f"{_NAMES.get(r[1], '?')} {r[2]}: {_format(r)}" for r in recs]
+    w = _get_writer()
+    w.put(f"[LOG] ---- last {len(lines)} debug records ----")
+    for line in lines:
+        w.put(line)
+    w.put("[LOG] ---- end ----")
+    return lines
+
+
+def install_dump_signal(sig=getattr(signal, "SIGUSR1", None)):
+    """kill -USR1 <pid> → 최근 debug 레코드 덤프 (메인 스레드에서 호출)"""
+    if sig is None:
+        return
+    try:
+        # 핸들러 안에서 락을 잡지 않도록 별도 스레드에서 덤프
+        signal.signal(sig, lambda *_: threading.Thread(target=dump, daemon=True).start())
+    except ValueError:
+        pass   # 메인 스레드가 아님
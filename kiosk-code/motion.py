@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+motion.py — Y 평면 기반 저비용 변화 감지
+- MotionGate : 컨트롤러용. 마지막 추론 프레임 대비 장면 변화가 없으면 추론 생략
+               (pi_still_monitor 의 mean-abs-diff 와 같은 방식, 다운스케일 Y 평면)
+- StillnessDetector : pi_still_monitor 용. 연속 프레임 간 ROI 평균 차 + 블록별 최대 차
+               (전체 평균에 묻히는 ROI 한쪽의 손 움직임도 잡힘), 프레임마다 할당 없음
+- NoiseFloor : 블록별 노이즈 차의 평균/분산 (Welford, 이후 지수 가중) → 블록 임계값 = 평균 + z·σ
+               확인 구간도 '움직이다 잠깐 멈췄던' 구간 길이 분포에서 자동으로 (매장마다 다른 노이즈/동작 습관)
+"""
+
+import json
+import os
+
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """
+    check(gray) → True 면 이번 프레임 추론, False 면 추론 생략 (직전 결과 유지).
+    - 비교 기준은 '마지막으로 추론한 프레임' (조금씩 변하는 장면도 누적되어 잡힘)
+    - refresh_every 프레임 연속 생략되면 강제 추론
+    """
+
+    def __init__(self, w, h, downscale=8, threshold=3.0, refresh_every=10):
+        self.size = (max(1, w // downscale), max(1, h // downscale))
+        self.threshold = float(threshold)
+        self.refresh_every = max(1, int(refresh_every))
+
+        # 미리 할당한 버퍼 (프레임마다 할당 없음)
+        self._cur = np.empty((self.size[1], self.size[0]), np.uint8)
+        self._ref = np.empty_like(self._cur)
+        self._diff = np.empty_like(self._cur)
+        self._has_ref = False
+        self._since = 0
+        self.last_diff = 0.0
+
+        # 하트비트용 카운터
+        self.checked = self.skipped = self.refreshed = 0
+
+    def reset(self):
+        self._has_ref = False
+        self._since = 0
+
+    def check(self, gray):
+        self.checked += 1
+        # INTER_AREA = 블록 평균 → 센서 노이즈도 같이 줄어듦
+        cv2.resize(gray, self.size, dst=self._cur, interpolation=cv2.INTER_AREA)
+        if not self._has_ref:
+            return self._take()
+
+        cv2.absdiff(self._cur, self._ref, dst=self._diff)
+        self.last_diff = float(cv2.mean(self._diff)[0])
+        if self.last_diff > self.threshold:
+            return self._take()
+
+        self._since += 1
+        if self._since >= self.refresh_every:
+            self.refreshed += 1
+            return self._take()
+        self.skipped += 1
+        return False
+
+    def _take(self):
+        self._ref, self._cur = self._cur, self._ref
+        self._has_ref = True
+        self._since = 0
+        return True
+
+    def stats(self):
+        """(생략 비율, 강제 갱신 비율) 반환 후 카운터 리셋"""
+        n = max(1, self.checked)
+        out = (self.skipped / n, self.refreshed / n)
+        self.checked = self.skipped = self.refreshed = 0
+        return out
+
+
+class StillnessDetector:
+    """
+    update(y) → 직전 프레임 대비 평균 절대차 (첫 프레임은 None), block_max 에 블록별 최대값.
+    still() → 평균 ≤ threshold 이고 블록 최대 ≤ block_threshold (0 이면 블록 검사 안 함)
+    - 다운샘플은 형변환 전에 stride 로 (ROI 도 원본 좌표 slice 하나로), 3x3 평균은 cv2.blur
+    - 버퍼는 생성 때 한 번만 할당 (uint8)
+    """
+
+    def __init__(self, w, h, downscale=2, roi_ratio=0.6, use_roi=True, blur=True,
+                 threshold=80.0, blocks=(4, 3), block_threshold=0.0):
+        d = max(1, int(downscale))
+        sw, sh = -(-w // d), -(-h // d)          # y[::d, ::d] 크기
+        rx = int(sw * (1.0 - roi_ratio) / 2) if use_roi else 0
+        ry = int(sh * (1.0 - roi_ratio) / 2) if use_roi else 0
+        # y[::d, ::d][ry:sh-ry, rx:sw-rx] 와 같은 원소를 slice 한 번으로
+        self._rows = slice(ry * d, (sh - ry) * d, d)
+        self._cols = slice(rx * d, (sw - rx) * d, d)
+        shape = (sh - 2 * ry, sw - 2 * rx)
+        self.blur = bool(blur) and min(shape) >= 3
+        self.threshold = float(threshold)
+        self.block_threshold = float(block_threshold)
+        bx, by = blocks
+        self._bsize = (max(1, min(int(bx), shape[1])), max(1, min(int(by), shape[0])))
+
+        self._small = np.empty(shape, np.uint8) if self.blur else None
+        self._cur = np.empty(shape, np.uint8)
+        self._prev = np.empty_like(self._cur)
+        self._diff = np.empty_like(self._cur)
+        self._diff_f = np.empty(shape, np.float32)
+        self.blocks = np.zeros((self._bsize[1], self._bsize[0]), np.float32)   # 블록별 평균 차 (마지막 update)
+        self._has_prev = False
+        self.diff = self.block_max = 0.0
+        self.noise = None       # NoiseFloor 가 준비되면 still() 이 고정 임계값 대신 사용
+
+    @property
+    def shape(self):
+        return self._cur.shape
+
+    def reset(self):
+        self._has_prev = False
+        self.diff = self.block_max = 0.0
+
+    def update(self, y):
+        """y: (H, W) uint8 Y 평면 (YUV420 프레임 앞부분 뷰)"""
+        src = y[self._rows, self._cols]
+        if self.blur:
+            np.copyto(self._small, src)
+            cv2.blur(self._small, (3, 3), dst=self._cur)
+        else:
+            np.copyto(self._cur, src)
+        if not self._has_prev:
+            self._prev, self._cur = self._cur, self._prev
+            self._has_prev = True
+            return None
+
+        cv2.absdiff(self._cur, self._prev, dst=self._diff)
+        self.diff = cv2.mean(self._diff)[0]
+        # INTER_AREA = 블록 평균 → 블록 중 가장 많이 변한 곳 (노이즈 통계용으로 float)
+        np.copyto(self._diff_f, self._diff)
+        cv2.resize(self._diff_f, self._bsize, dst=self.blocks, interpolation=cv2.INTER_AREA)
+        self.block_max = float(self.blocks.max())
+        self._prev, self._cur = self._cur, self._prev
+        return self.diff
+
+    @property
+    def config(self):
+        """노이즈 모델 저장 키 (ROI/다운샘플/블록 배치가 바뀌면 예전 통계는 무효)"""
+        return f"{self._rows.start}:{self._rows.stop}:{self._rows.step}/{self._cols.start}:{self._cols.stop}" \
+               f"/{int(self.blur)}/{self._bsize[0]}x{self._bsize[1]}"
+
+    def still_fixed(self):
+        if self.diff > self.threshold:
+            return False
+        return self.block_threshold <= 0 or self.block_max <= self.block_threshold
+
+    def still(self):
+        if self.noise is not None and self.noise.ready:
+            return self.noise.quiet(self.blocks)
+        return self.still_fixed()
+
+
+class NoiseFloor:
+    """
+    블록별 '정지 장면 프레임 간 차' 의 평균/분산.
+    - update(blocks): 처음 window 개는 Welford, 이후 1/window 지수 가중 (조명 변화 따라감)
+    - quiet(blocks): 모든 블록이 평균 + z·σ 이내 (σ 는 sigma_min 이상 → 양자화로 σ≈0 인 블록 보호)
+    - accept(blocks): 학습에 써도 되는 프레임인지 (z_learn 밖이면 손/물체 → 제외)
+    - learn(run): 확정된 정지 구간의 프레임들로 갱신 (통계가 없을 때는 구간 중앙값 기준 보수적 부트스트랩)
+    - record_run(ms): 세션 중 '조용했다가 다시 움직인' 구간 길이 → confirm_ms() 가 그 p95 보다 길게
+    """
+
+    def __init__(self, shape, z=4.0, window=600, min_samples=30, sigma_min=0.5, z_learn=6.0, runs=200, config=""):
+        self.shape = tuple(shape)
+        self.config = config    # StillnessDetector.config (저장된 통계가 같은 설정에서 나왔는지)
+        self.z = float(z)
+        self.z_learn = float(z_learn)
+        self.window = max(2, int(window))
+        self.min_samples = max(2, int(min_samples))
+        self.sigma_min = float(sigma_min)
+        self.n = 0
+        self.mean = np.zeros(self.shape, np.float64)
+        self.var = np.zeros(self.shape, np.float64)
+        self._m2 = np.zeros(self.shape, np.float64)
+        self.thr = np.full(self.shape, np.inf, np.float32)
+        self.runs = []
+        self._max_runs = int(runs)
+
+    @property
+    def ready(self):
+        return self.n >= self.min_samples
+
+    def sigma(self):
+        return np.sqrt(np.maximum(self.var, self.sigma_min ** 2))
+
+    def update(self, x):
+        d = x - self.mean
+        if self.n < self.window:
+            self.n += 1
+            self.mean += d / self.n
+            self._m2 += d * (x - self.mean)
+            self.var = self._m2 / max(1, self.n - 1)
+        else:
+            a = 1.0 / self.window
+            self.mean += a * d
+            self.var = (1.0 - a) * (self.var + a * d * d)
+        self.thr[:] = self.mean + self.z * self.sigma()
+
+    def quiet(self, x):
+        return bool((x <= self.thr).all())
+
+    def accept(self, x):
+        if not self.ready:
+            return True
+        return bool((x <= self.mean + self.z_learn * self.sigma()).all())
+
+    def learn(self, run, boot_max=12.0):
+        """run: 정지 확정 구간의 블록 차 (프레임, by, bx) → 학습에 쓴 프레임 수.
+        통계가 없으면 고정 임계값(DIFF/BLOCK_THRESHOLD)은 손 움직임도 통과시키므로,
+        구간 전체 블록 중앙값의 3배와 boot_max 중 작은 값을 넘는 블록이 있는 프레임은 제외"""
+        run = np.asarray(run, np.float64).reshape((-1,) + self.shape)
+        if not len(run):
+            return 0
+        cap = min(float(boot_max), 3.0 * max(float(np.median(run)), self.sigma_min))
+        n = 0
+        for x in run:
+            if self.accept(x) if self.ready else float(x.max()) <= cap:
+                self.update(x)
+                n += 1
+        return n
+
+    def record_run(self, ms):
+        self.runs.append(float(ms))
+        if len(self.runs) > self._max_runs:
+            del self.runs[0]
+
+    def confirm_ms(self, default_ms, min_ms, min_runs=10):
+        """확인 구간: 끊긴 조용한 구간 p95 × 1.25 (관측이 적으면 min/default 중간), [min_ms, default_ms]"""
+        if len(self.runs) < min_runs:
+            return (min_ms + default_ms) / 2.0
+        return float(np.clip(np.percentile(self.runs, 95) * 1.25, min_ms, default_ms))
+
+    def __str__(self):
+        if not self.n:
+            return "noise: empty"
+        return (f"noise n={self.n} floor={self.mean.mean():.2f}±{self.sigma().mean():.2f} "
+                f"thr≤{float(self.thr.max()):.1f} runs={len(self.runs)}")
+
+    # ── 저장/복원 (재시작해도 매장 노이즈 통계 유지)
+    def save(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"config": self.config, "shape": list(self.shape), "n": self.n, "mean": self.mean.tolist(),
+                       "var": self.var.tolist(), "m2": self._m2.tolist(), "runs": self.runs}, f)
+        os.replace(tmp, path)
+
+    def load(self, path):
+        """같은 설정으로 저장된 통계면 불러와서 True"""
+        try:
+            with open(path, encoding="utf-8") as f:
+                d = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if d.get("config") != self.config or tuple(d.get("shape", ())) != self.shape:
+            return False
+        self.n = int(d["n"])
+        self.mean[:] = d["mean"]
+        self.var[:] = d["var"]
+        self._m2[:] = d["m2"]
+        self.runs = [float(v) for v in d.get("runs", [])][-self._max_runs:]
+        self.thr[:] = self.mean + self.z * self.sigma()
+        return True
@@ -1,12 +1,22 @@
 #!/usr/bin/env python3
-import asyncio, json, time, os, shutil, subprocess
+import asyncio, json, time, os, shutil, threading
 from datetime import datetime
-import numpy as np
 import websockets
 
+from camera_broker import BROKER_NAME, BrokerClient
+from frame_ring import FrameRing
+from frame_source import open_source
+from kiosk_log import get_logger, install_dump_signal
+from motion import NoiseFloor, StillnessDetector
+
 # ===== 설정 =====
 WS_URL          = os.environ.get("KIOSK_WS", "ws://localhost:3000")
 
+# 프레임 소스: rpicam[:N] | replay:/path.i420 | synthetic (frame_source.open_source)
+#   broker[:이름] = camera_broker 공유 메모리 링에 Y 평면만 FPS 로 구독 (컨트롤러와 카메라 하나를 같이 씀)
+STILL_SOURCE    = os.environ.get("STILL_SOURCE", "rpicam")
+CAM_STALL_SEC   = float(os.environ.get("CAM_STALL_SEC", "3"))      # 이 시간 동안 새 프레임이 없으면 카메라 재시작
+
 # 캡처 파라미터 (rpicam-vid 출력 해상도/FPS와 동일해야 함)
 W               = int(os.environ.get("W", "320"))
 H               = int(os.environ.get("H", "240"))
@@ -28,189 +38,290 @@ DIFF_THRESHOLD  = float(os.environ.get("DIFF_THRESHOLD", "80.0"))  # 초기엔 
 USE_ROI         = os.environ.get("USE_ROI", "1") == "1"
 ROI_RATIO       = float(os.environ.get("ROI_RATIO", "0.6"))        # 중앙 60% 기본
 USE_BLUR        = os.environ.get("USE_BLUR", "1") == "1"
+BLOCKS          = os.environ.get("BLOCKS", "4x3")                  # ROI 를 가로x세로 블록으로 나눠 국소 움직임 검사
+BLOCK_THRESHOLD = float(os.environ.get("BLOCK_THRESHOLD", str(DIFF_THRESHOLD * 2)))  # 블록 하나 평균 차 한도 (0=끔)
+
+# 적응형 정지 판정: 블록별 노이즈 바닥(평균/분산)을 학습해 임계값/확인 구간을 자동으로
+# (통계가 모이기 전, 첫 세션들은 위 고정 DIFF/BLOCK_THRESHOLD + STABLE_MS 로 동작)
+ADAPTIVE_STILL  = os.environ.get("ADAPTIVE_STILL", "1") == "1"
+NOISE_Z         = float(os.environ.get("NOISE_Z", "4.0"))          # 블록 임계값 = 노이즈 평균 + z·σ
+NOISE_BOOT_MAX  = float(os.environ.get("NOISE_BOOT_MAX", "12"))   # 통계가 없을 때 학습에 쓸 프레임의 블록 차 상한 (손 움직임 배제)
+MIN_CONFIRM_MS  = int(os.environ.get("MIN_CONFIRM_MS", "300"))     # 자동 확인 구간 하한 (상한 = STABLE_MS)
+NOISE_FILE      = os.environ.get("NOISE_FILE", os.path.expanduser("~/.kiosk_still_noise.json"))  # "" = 저장 안 함
 
 AUTO_START      = os.environ.get("AUTO_START", "1") == "1"
 FALLBACK_SEC    = float(os.environ.get("FALLBACK_SEC", "3"))
 DEBUG           = os.environ.get("DEBUG", "1") == "1"
 PRINT_EVERY     = int(os.environ.get("PRINT_EVERY", "5"))
 
-# ===== rpicam-vid (YUV420 raw) 서브프로세스 =====
-def start_yuv_pipe():
-    if shutil.which("rpicam-vid") is None:
-        print("❌ rpicam-vid 미설치/경로 오류")
-    cmd = [
-        "rpicam-vid",
-        "-t", "0",
-        "--width", str(W),
-        "--height", str(H),
-        "--framerate", str(FPS),
-        "--codec", "yuv420",           # YUV420 원시 프레임
-        # "--inline",                   # ❌ H.264 전용, 제거
-        # "--awb", "off",               # ❌ 현재 rpicam-vid에서 invalid, 제거
-        # "--awbgains", AWBGAINS,       # (AWB auto면 의미 없음, 필요 시 수동 모드에서만)
-        "--shutter", SHUTTER_US,
-        "--gain", GAIN,
-        "--denoise", "off",
-        "-o", "-"                      # stdout
-    ]
-    print("▶️ rpicam-vid (raw YUV420) 시작:", " ".join(cmd))
-    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    print(f"✅ rpicam-vid PID={proc.pid}")
-    return proc
-
-def stop_yuv_pipe(proc):
-    print("⏹ rpicam-vid 종료 시도")
-    try:
-        proc.terminate()
-        proc.wait(timeout=1)
-    except Exception:
-        try: proc.kill()
-        except Exception: pass
-    print("✅ 파이프 종료")
-
-# YUV420p 한 프레임 크기 (Y:W*H, U:W*H/4, V:W*H/4)
-FRAME_BYTES = int(W * H * 3 / 2)
-
-def read_exact(pipe, nbytes):
-    """stdout에서 정확히 nbytes 읽어오기 (부족하면 None)"""
-    buf = b""
-    while len(buf) < nbytes:
-        chunk = pipe.read(nbytes - len(buf))
-        if not chunk:
-            return None
-        buf += chunk
-    return buf
-
-def yuv420_to_gray_down(buf):
+log = get_logger("still", default_level="debug" if DEBUG else "info")
+
+# ===== 카메라 reader (이벤트 루프 밖 스레드, 최신 프레임만 유지) =====
+def open_camera():
+    if STILL_SOURCE.startswith("rpicam") and shutil.which("rpicam-vid") is None:
+        log.error("❌ rpicam-vid 미설치/경로 오류")
+    return open_source(STILL_SOURCE, W, H, FPS, shutter=SHUTTER_US, gain=GAIN, denoise="off")
+
+class CameraReader:
     """
-    rpicam-vid --codec yuv420 가 내보낸 한 프레임(buf)에서
-    Y 평면만 뽑아 다운샘플링하여 float32(gray)로 반환
+    reader 스레드가 파이프를 FrameRing 슬롯에 readinto (블로킹 read 는 이벤트 루프 밖에서만).
+    소비자는 await next(seq) 로 항상 가장 최근 프레임을 받음 → 그 사이 프레임은 버려짐 (latest-frame-wins)
+    파이프가 끊기면 reader 가 소스를 다시 열고, restart() 로 강제 재시작 가능.
     """
-    # Y plane: 앞쪽 W*H 바이트
-    y_plane = np.frombuffer(buf, dtype=np.uint8, count=W*H, offset=0).reshape((H, W))
-    gray = y_plane.astype(np.float32)
-    if DOWNSCALE > 1:
-        gray = gray[::DOWNSCALE, ::DOWNSCALE]
-    # ROI
-    if USE_ROI:
-        h, w = gray.shape
-        rx = int(w * (1.0 - ROI_RATIO) / 2)
-        ry = int(h * (1.0 - ROI_RATIO) / 2)
-        gray = gray[ry:h-ry, rx:w-rx]
-    # Blur
-    if USE_BLUR:
-        # 간단한 3x3 평균(가우시안 없이)로 노이즈만 소폭 억제
-        k = np.array([[1,1,1],[1,1,1],[1,1,1]], dtype=np.float32) / 9.0
-        # 패딩 후 컨볼루션 (가벼운 구현)
-        from numpy.lib.stride_tricks import sliding_window_view
-        if gray.shape[0] >= 3 and gray.shape[1] >= 3:
-            win = sliding_window_view(gray, (3,3))
-            gray = (win * k).sum(axis=(-1,-2))
-    return gray
+
+    def __init__(self, make_source=open_camera):
+        self._make_source = make_source
+        self._loop = asyncio.get_running_loop()
+        self._new = asyncio.Event()
+        self.frames = FrameRing(W, H, slots=3, on_publish=self._on_publish)
+        self.source = None
+        self._running = False
+        self._thread = None
+
+    def _on_publish(self):
+        try:
+            self._loop.call_soon_threadsafe(self._new.set)
+        except RuntimeError:
+            pass   # 루프 종료 후
+
+    async def start(self):
+        self._running = True
+        self._open()
+        self._thread = threading.Thread(target=self._reader, name="still-cam", daemon=True)
+        self._thread.start()
+
+    def _open(self):
+        self.source = self._make_source()
+        log.info("▶️ camera source: %s", self.source)
+
+    def _reader(self):
+        while self._running:
+            try:
+                if self.frames.fill_from(self.source.stream) is not False:
+                    continue   # 게시했거나 빈 슬롯 없음(None) → 계속 읽기
+            except Exception as e:
+                log.warn("camera read error: %s", e, key="cam_read")
+            if not self._running:
+                break
+            if getattr(self.source, "proc", None) is None and self.source.done:
+                log.info("⏹ camera source finished: %s", self.source)
+                return
+            log.warn("♻️ 카메라 파이프 끊김 → 재시작", key="cam_restart")
+            self.source.close()
+            time.sleep(0.5)
+            if self._running:
+                self._open()
+        self.source.close()   # stop() 과 재시작이 겹쳤을 때 새로 연 소스 정리
+
+    async def next(self, after_seq, timeout):
+        """seq > after_seq 인 최신 프레임 (고정됨, 다 쓰면 release). timeout 동안 없으면 None"""
+        while True:
+            f = self.frames.latest()
+            if f is not None:
+                if f.seq > after_seq:
+                    if after_seq:
+                        f.skipped = f.seq - after_seq - 1
+                    return f
+                f.release()
+            # 게시 콜백은 루프에서 실행되므로 clear 와 set 사이 경쟁 없음
+            self._new.clear()
+            try:
+                await asyncio.wait_for(self._new.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+
+    def restart(self):
+        """멈춘 카메라 강제 재시작 (파이프를 닫으면 reader 스레드가 다시 엶)"""
+        if self.source is not None:
+            self.source.close()
+
+    def stop(self):
+        log.info("⏹ 카메라 종료")
+        self._running = False
+        if self.source is not None:
+            self.source.close()
+
+class BrokerCameraReader(CameraReader):
+    """카메라를 직접 열지 않고 브로커 링에 붙음 (reader 스레드는 새 프레임 알림만 받음)"""
+
+    def __init__(self, name=BROKER_NAME):
+        super().__init__(None)
+        self.name = name
+
+    async def start(self):
+        self._running = True
+        # 구독은 브로커 응답을 기다리므로 루프 밖에서
+        self.frames = await asyncio.to_thread(BrokerClient, self.name, fps=FPS, gray_only=True,
+                                              on_publish=self._on_publish)
+        log.info("▶️ camera source: %s", self.frames)
+        self._thread = threading.Thread(target=self._reader, name="still-broker", daemon=True)
+        self._thread.start()
+
+    def _reader(self):
+        idle = 0.0
+        while self._running:
+            try:
+                if self.frames.pump(1.0):
+                    idle = 0.0
+                    continue
+                idle += 1.0
+                if idle >= CAM_STALL_SEC:
+                    log.warn("♻️ 브로커 알림 없음(%.0fs) → 재구독", idle, key="broker_idle")
+                    self.frames.resubscribe(timeout=2.0)
+                    idle = 0.0
+            except Exception as e:
+                log.warn("broker: %s", e, key="broker_err")
+                time.sleep(1.0)
+        self.frames.close()
+
+    def restart(self):
+        pass   # 카메라는 브로커 몫 (알림이 끊기면 reader 가 재구독)
+
+    def stop(self):
+        log.info("⏹ 브로커 구독 종료")
+        self._running = False
+
+def make_detector(w=W, h=H):
+    """env 설정 그대로 StillnessDetector 생성 (BLOCKS="4x3").
+    프레임이 W 보다 크면(브로커 해상도) 다운샘플 간격을 늘려 같은 유효 해상도로"""
+    bx, by = (int(v) for v in BLOCKS.lower().split("x"))
+    return StillnessDetector(w, h, downscale=DOWNSCALE * max(1, round(w / W)), roi_ratio=ROI_RATIO, use_roi=USE_ROI, blur=USE_BLUR,
+                             threshold=DIFF_THRESHOLD, blocks=(bx, by), block_threshold=BLOCK_THRESHOLD)
+
+_noise = None       # 세션 간 유지되는 노이즈 모델
+
+def noise_model(det):
+    """detector 설정에 맞는 NoiseFloor (설정이 같으면 세션/재시작 간 재사용)"""
+    global _noise
+    if _noise is None or _noise.config != det.config:
+        _noise = NoiseFloor(det.blocks.shape, z=NOISE_Z, config=det.config)
+        if NOISE_FILE and _noise.load(NOISE_FILE):
+            log.info("📈 noise model loaded: %s", _noise)
+    return _noise
+
+def learn_noise(noise, run):
+    """basketStable 로 확정된 정지 구간 프레임으로 블록 노이즈 통계 갱신 (카메라는 더 잡지 않음)"""
+    learned = noise.learn(run, NOISE_BOOT_MAX)
+    log.info("📈 noise learned %d/%d frames → %s (confirm %.0fms)",
+             learned, len(run), noise, noise.confirm_ms(STABLE_MS, MIN_CONFIRM_MS))
+    if learned and NOISE_FILE:
+        try:
+            noise.save(NOISE_FILE)
+        except OSError as e:
+            log.warn("noise model save failed: %s", e, key="noise_save")
 
 # ===== 정지 감지 루프 =====
-async def stillness_detect_and_signal(ws_send):
-    proc = start_yuv_pipe()
-    miss = 0
+async def stillness_detect_and_signal(ws_send, make_source=open_camera):
+    if make_source is open_camera and STILL_SOURCE.startswith("broker"):
+        cam = BrokerCameraReader(STILL_SOURCE.partition(":")[2] or BROKER_NAME)
+    else:
+        cam = CameraReader(make_source)
+    await cam.start()
+    det = make_detector(cam.frames.w, cam.frames.h)
+    noise = noise_model(det) if ADAPTIVE_STILL else None
+    det.noise = noise
     try:
-        prev = None
+        seq = 0
+        skipped = 0
         frames = 0
         entered_ms = time.time() * 1000.0
         stable_start_ms = None
+        run = []    # 현재 정지 후보 구간의 블록 차 (basketStable 로 확정되면 노이즈 학습에 사용)
 
         while True:
-            buf = read_exact(proc.stdout, FRAME_BYTES)
-            if buf is None:
-                miss += 1
-                if miss % 5 == 0:
-                    # stderr 한 줄만 비워서 에러 힌트 보기
-                    try:
-                        line = proc.stderr.readline().decode(errors="ignore").strip()
-                        if line:
-                            print("rpicam-vid:", line)
-                    except Exception:
-                        pass
-                if miss >= 20:
-                    print("♻️ rpicam-vid 재시작")
-                    stop_yuv_pipe(proc)
-                    proc = start_yuv_pipe()
-                    miss = 0
-                await asyncio.sleep(0.02)
+            frame = await cam.next(seq, CAM_STALL_SEC)
+            if frame is None:
+                log.warn("♻️ %.0fs 동안 새 프레임 없음 → 카메라 재시작", CAM_STALL_SEC, key="cam_stall")
+                cam.restart()
                 continue
-            miss = 0
-
-            gray = yuv420_to_gray_down(buf)
+            try:
+                seq = frame.seq
+                skipped += frame.skipped
+                diff = det.update(frame.gray)  # 0..255 (첫 프레임은 None)
+                age_ms = (time.monotonic() - frame.ts) * 1000.0
+            finally:
+                frame.release()
 
             # 워밍업
             if frames < WARMUP_FRAMES:
-                prev = gray; frames += 1
-                if DEBUG:
-                    print(f"[warmup] {frames}/{WARMUP_FRAMES}")
+                frames += 1
+                log.debug("[warmup] %d/%d", frames, WARMUP_FRAMES)
                 await asyncio.sleep(SAMPLE_INTERVAL); continue
 
-            if prev is None:
-                prev = gray
+            if diff is None:
                 await asyncio.sleep(SAMPLE_INTERVAL); continue
 
-            diff = float(np.mean(np.abs(gray - prev)))  # 0..255
-            prev = gray
-
             now_ms = time.time() * 1000.0
             in_grace = (now_ms - entered_ms) < ENTER_GRACE_MS
 
+            # 노이즈 모델이 준비됐으면 임계값(블록별 평균+zσ)/확인 구간 자동, 아니면 고정값
+            adaptive = noise is not None and noise.ready
+            need_ms = noise.confirm_ms(STABLE_MS, MIN_CONFIRM_MS) if adaptive else STABLE_MS
+
             if DEBUG and (frames % PRINT_EVERY == 0):
                 sfor = 0 if not stable_start_ms else int(now_ms - stable_start_ms)
-                print(f"[diff] {diff:.1f} grace={in_grace} stable_for={sfor}ms thr={DIFF_THRESHOLD}")
+                thr = f"{float(noise.thr.max()):.1f}(auto)" if adaptive else f"{DIFF_THRESHOLD}/{BLOCK_THRESHOLD}"
+                log.debug("[diff] %.1f block_max=%.1f grace=%s stable_for=%d/%.0fms thr=%s age=%.0fms skipped=%d",
+                          diff, det.block_max, in_grace, sfor, need_ms, thr, age_ms, skipped)
 
-            if not in_grace and diff <= DIFF_THRESHOLD:
+            if not in_grace and det.still():
+                if noise is not None:
+                    run.append(det.blocks.copy())
                 if stable_start_ms is None:
                     stable_start_ms = now_ms
-                    if DEBUG: print("… 정지 후보 시작")
-                elif (now_ms - stable_start_ms) >= STABLE_MS:
-                    print("✅ STILL: basketStable emit")
+                    log.debug("… 정지 후보 시작")
+                elif (now_ms - stable_start_ms) >= need_ms:
+                    log.info("✅ STILL: basketStable emit (frame age %.0fms, skipped %d, confirm %.0fms%s)",
+                             age_ms, skipped, need_ms, " auto" if adaptive else "")
                     await ws_send({"type":"basketStable","ts":datetime.utcnow().isoformat()})
+                    if noise is not None:
+                        learn_noise(noise, run)
                     break
             else:
-                if stable_start_ms is not None and DEBUG:
-                    print("↩️ 정지 후보 리셋")
+                if stable_start_ms is not None:
+                    log.debug("↩️ 정지 후보 리셋")
+                    if adaptive and not in_grace:
+                        # 조용했다가 다시 움직인 구간 → 확인 구간은 이런 멈칫보다 길어야 함
+                        noise.record_run(now_ms - stable_start_ms)
                 stable_start_ms = None
+                run.clear()
 
             frames += 1
             await asyncio.sleep(SAMPLE_INTERVAL)
     finally:
-        stop_yuv_pipe(proc)
+        cam.stop()
 
 # ===== WebSocket =====
 async def ws_client():
     async with websockets.connect(WS_URL, ping_interval=20, ping_timeout=20) as ws:
-        print("✅ Stillness WS connected:", WS_URL)
+        log.info("✅ Stillness WS connected: %s", WS_URL)
         cam_task = None
 
         async def ws_send(obj):
             await ws.send(json.dumps(obj))
 
         if AUTO_START and ((not cam_task) or cam_task.done()):
-            print("🟢 AUTO_START=1 → 정지 감지 즉시 시작")
+            log.info("🟢 AUTO_START=1 → 정지 감지 즉시 시작")
             cam_task = asyncio.create_task(stillness_detect_and_signal(ws_send))
 
         async def fallback():
             await asyncio.sleep(FALLBACK_SEC)
             if (not cam_task) or cam_task.done():
-                print(f"⏱ sessionStarted 미수신({FALLBACK_SEC:.0f}s) → 폴백 자동 시작")
+                log.info("⏱ sessionStarted 미수신(%.0fs) → 폴백 자동 시작", FALLBACK_SEC)
                 return asyncio.create_task(stillness_detect_and_signal(ws_send))
         fallback_task = asyncio.create_task(fallback())
 
         async for raw in ws:
-            if DEBUG: print("📩 WS recv raw:", raw)
+            log.debug("📩 WS recv raw: %s", raw)
             try:
                 msg = json.loads(raw)
             except Exception:
                 continue
             kind = msg.get("action") or msg.get("type")
-            if DEBUG: print("➡️ kind:", kind)
+            log.debug("➡️ kind: %s", kind)
 
             if kind == "sessionStarted":
-                print("🟢 sessionStarted 수신 → 정지 감지 시작")
+                log.info("🟢 sessionStarted 수신 → 정지 감지 시작")
                 if (not cam_task) or cam_task.done():
                     cam_task = asyncio.create_task(stillness_detect_and_signal(ws_send))
                 if not fallback_task.done():
@@ -218,7 +329,7 @@ async def ws_client():
                 continue
 
             if kind == "sessionEnded":
-                print("🔴 sessionEnded 수신 → 다음 세션 대기")
+                log.info("🔴 sessionEnded 수신 → 다음 세션 대기")
                 if not fallback_task.done():
                     fallback_task.cancel()
                 fallback_task = asyncio.create_task(fallback())
@@ -226,11 +337,12 @@ async def ws_client():
 
 # ===== main =====
 async def main():
+    install_dump_signal()   # kill -USR1 → 최근 debug 로그 덤프
     while True:
         try:
             await ws_client()
         except Exception as e:
-            print("WS reconnect in 2s due to:", e)
+            log.warn("WS reconnect in 2s due to: %s", e)
             await asyncio.sleep(2)
 
 if __name__ == "__main__":
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+quantize_model.py — 캡처 아카이브로 INT8 PTQ (OpenVINO + NNCF, CPU)
+- /home/pi/kiosk_captures/<YYYYMMDD>/HHMMSS_ms_<label>_cnt<N>_conf<C>.jpg 를 모아
+  파일명 해시로 보정용 / 검증용(held-out) 을 나눔 (라벨별로 골고루, 같은 파일은 항상 같은 쪽)
+  CAPTURE_INDEX(SQLite) 가 있으면 인덱스로 조회 (압축된 샤드 포함), 인덱스에 없는 낱개 파일만 폴더 스캔
+- raw 캡처(박스 JSON 동반, 박스 없는 원본) 를 우선 사용, annotated(박스 그려진) 는 --include-annotated 일 때만
+- 보정/검증 입력은 컨트롤러와 같게: 레인 ROI 크롭(raw 캡처 메타의 roi, 없으면 BASKET_ROI[_<sid>])
+  → letterbox 안쪽 크기 → ENHANCE_MODE 보정 → letterbox
+- nncf.quantize(MIXED) — YOLOv8 Detect 헤드(박스 디코드/DFL/Sigmoid) 는 FP 유지
+- FP vs INT8: 추론 지연(LATENCY, 1장) + held-out 에서 클래스별 개수 일치율 비교
+- 일치율이 --min-agree 이상이면 FP 폴더와 같은 구조(xml/bin + metadata.yaml)로 --out 에 저장
+  → OV_MODEL_DIR=<out> 으로 바로 교체 (컴파일 캐시 키가 IR(xml+bin) 경로/크기/mtime 이라 새 폴더면 재컴파일도 자동)
+
+  python3 quantize_model.py --out /home/pi/Desktop/detect/finetune_my53/weights/best_int8_openvino_model
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+from basket_roi import calibrate_roi, load_reference, parse_roi
+from capture_index import CAPTURE_INDEX, CAPTURE_ROOT, CaptureIndex
+from det_aggregate import Aggregator
+from detectors import OpenVinoDetector, find_model_xml
+from enhance import Enhancer
+from frame_ring import luma_bgr
+
+OV_MODEL_DIR = os.environ.get("OV_MODEL_DIR", "/home/pi/Desktop/detect/finetune_my53/weights/best_openvino_model")
+PRIMARY_CONF = float(os.environ.get("PRIMARY_CONF", "0.12"))      # 컨트롤러와 같은 검출/집계 임계값
+IOU_THRESHOLD = float(os.environ.get("IOU_THRESHOLD", "0.6"))
+CONF_THRESHOLD = float(os.environ.get("CONF_THRESHOLD", "0.15"))
+# 컨트롤러와 같은 입력 보정/ROI (controller_ws3 와 같은 환경변수)
+APPLY_LIGHT_ENHANCE = os.environ.get("APPLY_LIGHT_ENHANCE", "1") == "1"
+ENHANCE_MODE = os.environ.get("ENHANCE_MODE", "legacy" if APPLY_LIGHT_ENHANCE else "off")
+ENHANCE_AMOUNT = float(os.environ.get("ENHANCE_AMOUNT", "0.6"))
+ENHANCE_TAPS = int(os.environ.get("ENHANCE_TAPS", "3"))
+ENHANCE_SKIP_SHARPNESS = float(os.environ.get("ENHANCE_SKIP_SHARPNESS", "0"))
+BASKET_ROI = os.environ.get("BASKET_ROI", "")
+BASKET_ROI_REF = os.environ.get("BASKET_ROI_REF", "/home/pi/kiosk_basket_ref.png")
+BASKET_ROI_MARGIN = float(os.environ.get("BASKET_ROI_MARGIN", "0.04"))
+
+# make_filename() 형식 (라벨에 '_' 가 들어갈 수 있어 뒤에서부터 맞춤, 멀티 카메라면 '<sid>_' 접두)
+_NAME_RE = re.compile(r"^\d{6}_\d{3}_(?P<label>.+)_cnt(?P<cnt>\d+)_conf(?P<conf>[\d.]+)\.jpg$")
+
+
+class Capture:
+    __slots__ = ("path", "label", "cnt", "raw", "row", "index", "session")
+
+    def __init__(self, path, label, cnt, raw, row=None, index=None, session=None):
+        self.path, self.label, self.cnt, self.raw = path, label, cnt, raw
+        self.row, self.index, self.session = row, index, session
+
+    def load(self):
+        """BGR 이미지 (인덱스 행이면 샤드/낱개 파일에서 바이트로), 실패 시 None"""
+        if self.index is None:
+            return cv2.imread(self.path, cv2.IMREAD_COLOR)
+        try:
+            data = self.index.read(self.row)
+        except OSError:
+            return None
+        return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+    def meta(self):
+        """raw 캡처 메타 (imgSize/inputSize/roi/boxes), 없거나 못 읽으면 None"""
+        try:
+            if self.index is not None:
+                return json.loads(self.row["boxes"]) if self.row["boxes"] else None
+            if self.raw:
+                with open(self.path[:-4] + ".json", encoding="utf-8") as f:
+                    return json.load(f)
+        except (OSError, ValueError):
+            pass
+        return None
+
+
+def index_captures(idx, include_annotated=False, days=None):
+    """인덱스 행 → [Capture] (raw = 박스 JSON 이 있는 원본 캡처)"""
+    out = []
+    for r in idx.query(limit=0, newest_first=False):
+        if days and r["day"] not in days:
+            continue
+        raw = r["mode"] == "raw" or bool(r["boxes"])
+        if raw or include_annotated:
+            out.append(Capture(r["path"], r["label"], r["cnt"] or 0, raw, row=r, index=idx, session=r["session"]))
+    return out
+
+
+def scan_captures(root, include_annotated=False, days=None):
+    """날짜 폴더를 돌며 파일명 파싱 → [Capture] (raw = 박스 JSON 동반)"""
+    out = []
+    for day in sorted(os.listdir(root)):
+        ddir = os.path.join(root, day)
+        if not (day.isdigit() and len(day) == 8 and os.path.isdir(ddir)):
+            continue
+        if days and day not in days:
+            continue
+        names = set(os.listdir(ddir))
+        for fn in sorted(names):
+            m = _NAME_RE.match(fn)
+            if not m:
+                continue
+            raw = fn[:-4] + ".json" in names
+            if raw or include_annotated:
+                out.append(Capture(os.path.join(ddir, fn), m["label"], int(m["cnt"]), raw))
+    return out
+
+
+def split_captures(caps, holdout=0.2, calib=300, seed=0):
+    """파일명 해시로 held-out 분리 (재실행해도 같은 분할), 보정 세트는 라벨별 라운드로빈으로 calib 장"""
+    def h(c):
+        return int(hashlib.sha1(f"{seed}:{os.path.basename(c.path)}".encode()).hexdigest()[:8], 16) / 0xFFFFFFFF
+
+    test = [c for c in caps if h(c) < holdout]
+    by_label = defaultdict(list)
+    for c in caps:
+        if h(c) >= holdout:
+            by_label[c.label].append(c)
+    for v in by_label.values():
+        v.sort(key=h)
+    train = []
+    while len(train) < calib and any(by_label.values()):
+        for label in sorted(by_label):
+            if by_label[label] and len(train) < calib:
+                train.append(by_label[label].pop())
+    return train, test
+
+
+class InputPrep:
+    """캡처 BGR → 컨트롤러 _prepare_image 와 같은 모델 입력 (ROI 크롭 → letterbox 안쪽 크기 → 보정)"""
+
+    def __init__(self, det):
+        self.det = det
+        self.enh = Enhancer(ENHANCE_MODE, ENHANCE_AMOUNT, ENHANCE_TAPS, ENHANCE_SKIP_SHARPNESS, buffers=2)
+        self._auto = {}         # (session, 크기) → auto ROI
+
+    def roi(self, cap, fw, fh):
+        """캡처 당시 ROI (raw 메타에 기록된 값 우선), 없으면 레인 BASKET_ROI. 이미 크롭된 저장본이면 None"""
+        meta = cap.meta()
+        if meta and "roi" in meta:
+            full = meta.get("imgSize") == [fw, fh] and meta.get("imgSize") != meta.get("inputSize")
+            return tuple(meta["roi"]) if meta["roi"] and full else None
+        sid = cap.session
+        spec = os.environ.get(f"BASKET_ROI_{sid}", BASKET_ROI) if sid else BASKET_ROI
+        if spec != "auto":
+            return parse_roi(spec, fw, fh)
+        key = (sid, fw, fh)
+        if key not in self._auto:
+            root, ext = os.path.splitext(BASKET_ROI_REF)
+            ref = load_reference(f"{root}_{sid}{ext}" if sid else BASKET_ROI_REF)
+            self._auto[key] = calibrate_roi(ref, BASKET_ROI_MARGIN) if ref is not None and ref.shape == (fh, fw) else None
+        return self._auto[key]
+
+    def __call__(self, cap, img):
+        h, w = img.shape[:2]
+        roi = self.roi(cap, w, h)
+        if roi:
+            x, y, rw, rh = roi
+            img = img[y:y + rh, x:x + rw]
+        enh = self.enh
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if enh.skip_sharpness else None
+        do = enh.wants(gray)
+        img = cv2.resize(img, self.det.fit_size(img.shape[1], img.shape[0]))
+        if do:
+            img = luma_bgr(img, enh.luma) if enh.mode == "luma" else enh.apply(img)
+        return img
+
+
+def _load_ov_model(model_dir):
+    from openvino import Core
+    return Core().read_model(find_model_xml(model_dir))
+
+
+def _head_ignored_scope(ov_model):
+    """YOLOv8 Detect 헤드(model.<마지막>) 의 디코드 연산은 양자화 제외 (ultralytics export 와 같은 범위)"""
+    import nncf
+
+    idx = [int(m) for op in ov_model.get_ops() for m in re.findall(r"model\.(\d+)", op.get_friendly_name())]
+    if not idx:
+        return nncf.IgnoredScope(types=["Sigmoid"], validate=False)
+    head = re.escape(f"model.{max(idx)}")
+    return nncf.IgnoredScope(
+        patterns=[f".*{head}/.*/Add", f".*{head}/.*/Sub*", f".*{head}/.*/Mul*",
+                  f".*{head}/.*/Div*", f".*{head}\\.dfl.*"],
+        types=["Sigmoid"], validate=False,
+    )
+
+
+def quantize(fp_dir, ref, prep, calib_caps, subset, preset="mixed", fast_bias=True):
+    """ref: FP OpenVinoDetector, prep: InputPrep (보정 입력을 컨트롤러와 똑같은 ROI/보정/letterbox 로 만들기 위함)"""
+    import nncf
+
+    def transform(item):
+        return ref.preprocess(prep(*item))[0]
+
+    # 읽을 수 없는 캡처(압축/회전으로 지워진 파일, 깨진 JPEG)는 빼고, nncf 가 여러 번 돌 수 있게 매번 다시 읽음
+    readable = [c for c in calib_caps if c.load() is not None]
+    if len(readable) < len(calib_caps):
+        print(f"calib: skip {len(calib_caps) - len(readable)} unreadable captures")
+    if not readable:
+        raise SystemExit("no readable calibration captures")
+
+    class _Images:
+        def __iter__(self):
+            return ((c, img) for c, img in ((c, c.load()) for c in readable) if img is not None)
+
+        def __len__(self):
+            return len(readable)
+
+    ov_model = _load_ov_model(fp_dir)
+    if not ov_model.input(0).get_partial_shape().is_static:
+        ov_model.reshape([1, 3, ref.imgsz, ref.imgsz])
+    presets = {"mixed": nncf.QuantizationPreset.MIXED, "performance": nncf.QuantizationPreset.PERFORMANCE}
+    return nncf.quantize(
+        ov_model, nncf.Dataset(_Images(), transform),
+        preset=presets[preset], subset_size=min(subset, len(readable)),
+        fast_bias_correction=fast_bias, ignored_scope=_head_ignored_scope(ov_model),
+    )
+
+
+def save_model_dir(q_model, fp_dir, out_dir):
+    """FP export 폴더와 같은 구조로 저장 (xml 이름 동일 + metadata.yaml 복사)"""
+    import openvino
+
+    xml_name = os.path.basename(find_model_xml(fp_dir))
+    tmp = out_dir.rstrip("/") + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    openvino.save_model(q_model, os.path.join(tmp, xml_name), compress_to_fp16=False)
+    meta = os.path.join(fp_dir if os.path.isdir(fp_dir) else os.path.dirname(fp_dir), "metadata.yaml")
+    if os.path.exists(meta):
+        shutil.copy2(meta, tmp)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp, out_dir)
+
+
+def bench_latency(det, imgs, iters):
+    xs = [det.preprocess(img)[0] for img in imgs[:8]]
+    det.infer(xs[0])   # 워밍업
+    ts = []
+    for i in range(iters):
+        t0 = time.perf_counter()
+        det.infer(xs[i % len(xs)])
+        ts.append((time.perf_counter() - t0) * 1000.0)
+    a = np.array(ts)
+    return {"mean": float(a.mean()), "p50": float(np.percentile(a, 50)), "p95": float(np.percentile(a, 95)),
+            "fps": float(1000.0 / a.mean())}
+
+
+def compare_counts(fp, q, prep, caps):
+    """held-out 캡처마다 FP/INT8 개수 집계 비교 → (요약, 클래스별 표)"""
+    agg = Aggregator(fp.names, CONF_THRESHOLD)
+    per = defaultdict(lambda: {"images": 0, "fp": 0, "int8": 0, "diff_images": 0})
+    same = label_fp = label_q = n = 0
+    for c in caps:
+        img = c.load()
+        if img is None:
+            continue
+        img = prep(c, img)
+        a = agg(*fp.detect(img)[:2])
+        b = agg(*q.detect(img)[:2])
+        ca, cb = a.counts_dict(), b.counts_dict()
+        n += 1
+        same += ca == cb
+        # 캡처 당시 컨트롤러가 낸 대표 라벨/개수와의 일치 (멀티 카메라 접두는 떼고)
+        label = c.label.split("_", 1)[1] if c.label not in fp.names.values() and "_" in c.label else c.label
+        label_fp += ca.get(label) == c.cnt
+        label_q += cb.get(label) == c.cnt
+        for k in set(ca) | set(cb):
+            p = per[k]
+            p["images"] += 1
+            p["fp"] += ca.get(k, 0)
+            p["int8"] += cb.get(k, 0)
+            p["diff_images"] += ca.get(k, 0) != cb.get(k, 0)
+    summary = {
+        "images": n,
+        "countsAgree": same / n if n else 0.0,
+        "labelAccFp": label_fp / n if n else 0.0,
+        "labelAccInt8": label_q / n if n else 0.0,
+    }
+    return summary, dict(per)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="캡처 아카이브로 INT8 양자화 + FP 대비 검증")
+    ap.add_argument("--fp", default=OV_MODEL_DIR, help="FP OpenVINO 모델 폴더 (기본 OV_MODEL_DIR)")
+    ap.add_argument("--captures", default=CAPTURE_ROOT)
+    ap.add_argument("--index", default=CAPTURE_INDEX, help="캡처 인덱스 (없으면 폴더 스캔만)")
+    ap.add_argument("--out", default=None, help="INT8 모델 폴더 (기본 <fp>_int8)")
+    ap.add_argument("--days", nargs="*", help="이 날짜(YYYYMMDD) 폴더만 사용")
+    ap.add_argument("--include-annotated", action="store_true", help="박스가 그려진 캡처도 사용")
+    ap.add_argument("--calib", type=int, default=300, help="보정 이미지 수 (라벨별 균등)")
+    ap.add_argument("--holdout", type=float, default=0.2, help="검증용 비율 (파일명 해시로 고정 분할)")
+    ap.add_argument("--max-test", type=int, default=500, help="비교에 쓸 held-out 최대 수")
+    ap.add_argument("--preset", choices=("mixed", "performance"), default="mixed")
+    ap.add_argument("--accurate-bias", action="store_true", help="느리지만 정확한 bias correction")
+    ap.add_argument("--bench-iters", type=int, default=100)
+    ap.add_argument("--min-agree", type=float, default=0.95, help="개수 일치율이 이 이상일 때만 저장")
+    ap.add_argument("--force", action="store_true", help="일치율과 무관하게 저장")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+    out_dir = args.out or args.fp.rstrip("/") + "_int8"
+
+    days = set(args.days or ())
+    caps = []
+    if args.index and os.path.exists(args.index):
+        caps = index_captures(CaptureIndex(args.index, root=args.captures), args.include_annotated, days)
+    known = {c.path for c in caps}
+    caps += [c for c in scan_captures(args.captures, args.include_annotated, days) if c.path not in known]
+    if not caps:
+        raise SystemExit(f"no usable captures under {args.captures} "
+                         f"(raw captures need CAPTURE_MODE=raw, or pass --include-annotated)")
+    calib, test = split_captures(caps, args.holdout, args.calib, args.seed)
+    test = test[:args.max_test]
+    labels = len({c.label for c in calib})
+    print(f"captures: {len(caps)} ({sum(c.raw for c in caps)} raw)  calib={len(calib)} ({labels} labels)  "
+          f"held-out={len(test)}")
+    if not calib or not test:
+        raise SystemExit("not enough captures for calibration + held-out comparison")
+
+    fp = OpenVinoDetector(args.fp, perf_hint="LATENCY", conf=PRIMARY_CONF, iou=IOU_THRESHOLD)
+    t0 = time.monotonic()
+    prep = InputPrep(fp)
+    q_model = quantize(args.fp, fp, prep, calib, args.calib, args.preset, fast_bias=not args.accurate_bias)
+    print(f"quantized in {time.monotonic() - t0:.0f}s")
+
+    # 비교는 임시 폴더의 INT8 로 (통과하면 그대로 out 으로 이동)
+    tmp_out = out_dir.rstrip("/") + ".candidate"
+    save_model_dir(q_model, args.fp, tmp_out)
+    q = OpenVinoDetector(tmp_out, perf_hint="LATENCY", conf=PRIMARY_CONF, iou=IOU_THRESHOLD)
+
+    # 지연 측정용 8장: 읽을 수 있는 held-out 만 (앞쪽이 지워졌어도 비지 않게)
+    imgs = []
+    for c in test:
+        img = c.load()
+        if img is not None:
+            imgs.append(prep(c, img).copy())
+            if len(imgs) == 8:
+                break
+    if not imgs:
+        raise SystemExit("no readable held-out captures")
+    lat_fp = bench_latency(fp, imgs, args.bench_iters)
+    lat_q = bench_latency(q, imgs, args.bench_iters)
+    summary, per = compare_counts(fp, q, prep, test)
+
+    print(f"{'':>6} {'mean':>8} {'p50':>8} {'p95':>8} {'fps':>7}  (ms, batch=1 LATENCY)")
+    for name, v in (("fp", lat_fp), ("int8", lat_q)):
+        print(f"{name:>6} {v['mean']:>8.2f} {v['p50']:>8.2f} {v['p95']:>8.2f} {v['fps']:>7.1f}")
+    print(f"speedup x{lat_fp['mean'] / lat_q['mean']:.2f}")
+    print(f"held-out {summary['images']}: counts agree {summary['countsAgree']:.1%}  "
+          f"label/cnt acc fp={summary['labelAccFp']:.1%} int8={summary['labelAccInt8']:.1%}")
+    print(f"{'class':>20} {'images':>7} {'fp':>6} {'int8':>6} {'diff':>6}")
+    for k, v in sorted(per.items(), key=lambda kv: -kv[1]["diff_images"]):
+        print(f"{k:>20} {v['images']:>7} {v['fp']:>6} {v['int8']:>6} {v['diff_images']:>6}")
+
+    report = {"fp": args.fp, "calib": len(calib), "heldOut": len(test), "preset": args.preset,
+              "latencyMs": {"fp": lat_fp, "int8": lat_q}, "summary": summary, "perClass": per}
+    with open(os.path.join(tmp_out, "quant_report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+
+    if summary["countsAgree"] < args.min_agree and not args.force:
+        print(f"counts agree {summary['countsAgree']:.1%} < {args.min_agree:.0%} → not installed "
+              f"(candidate kept in {tmp_out}, --force to install)")
+        raise SystemExit(1)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_out, out_dir)
+    print(f"INT8 model → {out_dir}   (OV_MODEL_DIR={out_dir})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+tfluna.py — TF-Luna 시리얼 프레임 파서 (serial/websocket 없이 import 가능 → 벤치/테스트 공용)
+- 프레임 9바이트: 0x59 0x59 | 거리 L H | 신호세기 L H | 온도 L H | 체크섬(앞 8바이트 합 하위 1바이트)
+- 읽을 수 있는 바이트를 한 번에 읽어 버퍼에 붙이고, 헤더(0x59 0x59)로 재동기 + 체크섬 검증
+- 한 번에 여러 프레임이 들어오면 마지막 것만 남김 (나머지는 dropped 로 집계) → 항상 최신 거리로 판단
+- 신호세기 < min_strength 또는 65535(포화) 이면 거리를 믿을 수 없음 → Sample.ok = False
+- ApproachTrend: 최근 window_s 초 거리에 직선 맞춤 → 접근 속도(cm/s) / 임계 도달 예상 시간
+  reader = TFLunaReader(ser); s = reader.poll()  # 새 샘플 없으면 None
+"""
+
+import struct
+import time
+from collections import deque
+from typing import NamedTuple
+
+HEADER = b"\x59\x59"
+FRAME_LEN = 9
+_PAYLOAD = struct.Struct("<HHH")   # 거리(cm), 신호세기, 온도 raw
+STRENGTH_SAT = 65535
+
+
+class Sample(NamedTuple):
+    dist: int          # cm
+    strength: int
+    temp: float        # °C (raw / 8 - 256)
+    ts: float          # time.monotonic() (읽은 시각)
+    ok: bool           # 신호세기가 유효 범위인가
+
+
+def checksum(frame):
+    return sum(frame[:FRAME_LEN - 1]) & 0xFF
+
+
+class TFLunaParser:
+    """바이트 조각 → 프레임. 불완전한 꼬리는 다음 feed 까지 보관"""
+
+    def __init__(self, min_strength=100):
+        self.min_strength = min_strength
+        self._buf = bytearray()
+        self.latest = None
+        self.frames = 0       # 체크섬 통과한 프레임
+        self.dropped = 0      # 읽었지만 더 새 프레임에 밀려 버린 것
+        self.corrupt = 0      # 헤더는 맞는데 체크섬 불일치
+        self.skipped = 0      # 재동기 중 버린 바이트
+        self.weak = 0         # 신호세기 범위 밖 (ok=False)
+
+    def feed(self, data, ts=None):
+        """이번 조각에서 나온 가장 새 샘플 (없으면 None)"""
+        buf = self._buf
+        buf += data
+        n, i, last = len(buf), 0, None
+        good = 0
+        while True:
+            j = buf.find(HEADER, i)
+            if j < 0:
+                # 헤더 없음: 마지막 바이트가 0x59 면 다음 조각의 헤더 앞부분일 수 있어 남김
+                keep = max(i, n - 1) if buf[-1:] == b"\x59" else n
+                self.skipped += keep - i
+                i = keep
+                break
+            self.skipped += j - i
+            if j + FRAME_LEN > n:
+                i = j
+                break
+            if checksum(buf[j:j + FRAME_LEN]) != buf[j + FRAME_LEN - 1]:
+                self.corrupt += 1
+                i = j + 1            # 이 헤더는 가짜였을 수 있음 → 다음 바이트부터 재탐색
+                continue
+            last = j
+            good += 1
+            i = j + FRAME_LEN
+        if last is not None:
+            dist, strength, temp = _PAYLOAD.unpack_from(buf, last + 2)
+            ok = self.min_strength <= strength < STRENGTH_SAT
+            self.latest = Sample(dist, strength, temp / 8.0 - 256.0,
+                                 time.monotonic() if ts is None else ts, ok)
+            self.frames += good
+            self.dropped += good - 1
+            self.weak += not ok
+        del buf[:i]
+        return self.latest if last is not None else None
+
+    def __str__(self):
+        s = self.latest
+        tail = f" last={s.dist}cm str={s.strength} {s.temp:.1f}°C" if s else ""
+        return (f"frames={self.frames} dropped={self.dropped} corrupt={self.corrupt} "
+                f"skipped={self.skipped}B weak={self.weak}{tail}")
+
+
+class TFLunaReader:
+    """pyserial 포트에서 쌓인 바이트를 한 번에 읽어 파싱 (버퍼가 비면 ser.timeout 까지 1바이트 대기)"""
+
+    def __init__(self, ser, min_strength=100):
+        self.ser = ser
+        self.parser = TFLunaParser(min_strength)
+
+    def poll(self):
+        ser = self.ser
+        data = ser.read(ser.in_waiting or 1)
+        if not data:
+            return None
+        return self.parser.feed(data)
+
+    def __str__(self):
+        return str(self.parser)
+
+
+class ApproachTrend:
+    """최근 거리 이력 → 최소제곱 기울기(cm/s, 다가오면 음수)와 임계 도달 예상 시간"""
+
+    def __init__(self, window_s=0.5, min_samples=8):
+        self.window_s = window_s
+        self.min_samples = min_samples
+        self._hist = deque()     # (ts, dist)
+
+    def update(self, s):
+        h = self._hist
+        if h and s.ts - h[-1][0] > self.window_s:
+            h.clear()            # 끊겼던 구간은 이어 붙이지 않음
+        h.append((s.ts, s.dist))
+        while s.ts - h[0][0] > self.window_s:
+            h.popleft()
+
+    def reset(self):
+        self._hist.clear()
+
+    def velocity(self):
+        """cm/s (이력이 짧으면 None)"""
+        h = self._hist
+        n = len(h)
+        if n < self.min_samples or h[-1][0] - h[0][0] < self.window_s * 0.5:
+            return None
+        t0 = h[0][0]
+        mt = sum(t - t0 for t, _ in h) / n
+        md = sum(d for _, d in h) / n
+        num = den = 0.0
+        for t, d in h:
+            dt = t - t0 - mt
+            num += dt * (d - md)
+            den += dt * dt
+        return num / den if den > 0 else None
+
+    def eta(self, threshold_cm, min_speed=0.0):
+        """지금 속도로 threshold_cm 에 닿기까지 초 (다가오지 않거나 이미 안쪽이면 None)"""
+        v = self.velocity()
+        if v is None or -v <= max(min_speed, 1e-6):
+            return None
+        d = self._hist[-1][1]
+        if d <= threshold_cm:
+            return None
+        return (d - threshold_cm) / -v
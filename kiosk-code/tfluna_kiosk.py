@@ -6,6 +6,9 @@ tfluna_kiosk.py — TF-Luna → Kiosk WebSocket (session-aware gating, hard-lock
 - scanComplete/stopVision 은 '중간 단계'로 보고 종료로 취급하지 않음
 - 첫 감지 후 최소 N초 하드락(명시 종료가 오기 전에는 절대 재무장 금지)
 - 서버가 꺼져 있거나 이벤트를 못 받는 경우에만 (옵션) away-timeout 폴백으로 재무장
+- 접근 예측: 거리 추세로 임계 도달이 PREWARM_SEC 안으로 예상되면 prewarm 1회 전송
+  (컨트롤러가 세션 없이 카메라/모델만 미리 올림 → 손님이 기다리는 구간에서 워밍업 제거)
+- 시리얼은 쌓인 바이트를 한 번에 읽어 최신 샘플로만 판단 (tfluna.TFLunaReader: 재동기/체크섬/신호세기)
 - 필요 패키지: pip install websocket-client pyserial
 """
 
@@ -17,15 +20,28 @@ import threading
 import serial
 from websocket import create_connection, WebSocketConnectionClosedException
 
+from kiosk_log import get_logger, install_dump_signal
+from tfluna import ApproachTrend, TFLunaReader
+
 # ======================= 환경변수/설정 =======================
 PORT                = os.environ.get("LIDAR_PORT", "/dev/ttyAMA0")  # /dev/ttyUSB0 등 환경에 맞게
 BAUDRATE            = int(os.environ.get("LIDAR_BAUD", "115200"))
 THRESHOLD_CM        = int(os.environ.get("LIDAR_THRESH_CM", "50"))  # 감지 임계 거리
+MIN_STRENGTH        = int(os.environ.get("LIDAR_MIN_STRENGTH", "100"))  # 이보다 약한 신호의 거리는 무시 (데이터시트 기준)
+STATS_SEC           = float(os.environ.get("LIDAR_STATS_SEC", "60"))   # 프레임/드롭/체크섬 오류 통계 로그 간격
 WS_SERVER           = os.environ.get("WS_SERVER", "ws://127.0.0.1:3000")
 
 # 하드락: 첫 감지 후 최소 이 시간 동안은 어떤 경우에도 재무장 금지
 ACTIVE_HARD_LOCK_SEC = float(os.environ.get("LIDAR_ACTIVE_LOCK", "15.0"))
 
+# 접근 예측 prewarm: 최근 TREND_SEC 초 거리 기울기로 임계 도달 시간 추정
+PREWARM_ENABLE      = os.environ.get("LIDAR_PREWARM", "1") == "1"
+PREWARM_SEC         = float(os.environ.get("LIDAR_PREWARM_SEC", "1.5"))       # 이 시간 안에 임계 도달 예상 → prewarm
+PREWARM_MAX_CM      = int(os.environ.get("LIDAR_PREWARM_MAX_CM", "300"))      # 이보다 먼 거리의 추세는 무시 (배경/통로)
+PREWARM_MIN_SPEED   = float(os.environ.get("LIDAR_PREWARM_MIN_SPEED", "20"))  # cm/s, 이보다 느리면 접근으로 안 봄 (노이즈)
+PREWARM_COOLDOWN_SEC = float(os.environ.get("LIDAR_PREWARM_COOLDOWN", "10"))  # 트리거 없이 지나간 뒤 다시 보낼 최소 간격
+TREND_SEC           = float(os.environ.get("LIDAR_TREND_SEC", "0.5"))
+
 # 오프라인 폴백(서버 이벤트를 한번도 못 받았을 때만 사용)
 OFFLINE_FALLBACK_ENABLE = os.environ.get("LIDAR_OFFLINE_FALLBACK", "1") == "1"
 REARM_AFTER_AWAY_SEC    = float(os.environ.get("LIDAR_AWAY_REARM", "2.0"))
@@ -44,8 +60,11 @@ session_armed  = True      # 트리거 가능? (근접 시 1회만 전송)
 server_seen    = False     # 서버 이벤트를 한 번이라도 받았는가(오프라인 판단)
 first_hit_ts   = None      # 최초 감지 시간(하드락 기준)
 last_far_ts    = None      # 폴백용: 멀어진 시간 기록
+prewarm_ts     = None      # 마지막 prewarm 전송 시간 (세션 종료 시 초기화)
 lock           = threading.Lock()
 
+log = get_logger("lidar")
+
 # ======================= WebSocket 유틸 =======================
 def connect_ws():
     """서버와 연결. 실패 시 재시도."""
@@ -53,10 +72,10 @@ def connect_ws():
         try:
             ws = create_connection(WS_SERVER, timeout=3)
             ws.settimeout(None)  # recv 무기한 대기
-            print("✅ WS connected")
+            log.info("✅ WS connected")
             return ws
         except Exception as e:
-            print("WS connect retry:", e)
+            log.warn("WS connect retry: %s", e, key="ws_retry", every=10.0)
             time.sleep(1.0)
 
 def safe_send(ws, obj):
@@ -69,12 +88,12 @@ def safe_send(ws, obj):
         except (WebSocketConnectionClosedException, BrokenPipeError, OSError):
             ws = connect_ws()
         except Exception as e:
-            print("WS send error:", e)
+            log.warn("WS send error: %s", e, key="ws_send")
             time.sleep(0.5)
 
 def ws_recv_loop(ws):
     """서버 → 클라이언트 이벤트 수신하여 세션 상태 갱신."""
-    global session_active, session_armed, server_seen, first_hit_ts
+    global session_active, session_armed, server_seen, first_hit_ts, prewarm_ts
     while True:
         try:
             msg = ws.recv()
@@ -86,7 +105,7 @@ def ws_recv_loop(ws):
                 continue
 
             kind = data.get("type") or data.get("action")
-            if not kind:
+            if not kind or kind == "prewarm":   # 자기가 보낸 prewarm 이 돌아온 것 → 서버 세션 이벤트 아님
                 continue
 
             with lock:
@@ -97,39 +116,28 @@ def ws_recv_loop(ws):
                     session_armed  = True
                     if first_hit_ts is None:
                         first_hit_ts = time.time()  # 하드락 기준점이 없다면 기록
-                    print("🟡 서버 이벤트 수신 → session_active=True, session_armed=False")
+                    log.info("🟡 서버 이벤트 수신 → session_active=True, session_armed=False")
                 elif kind in END_EVENTS:
                     # 명시적 종료: 다음 손님 대기(재무장)
                     session_active = False
                     session_armed  = True
                     first_hit_ts   = None         # 하드락 해제
-                    print("🔵 서버 이벤트 수신 → session_active=False, session_armed=True")
+                    prewarm_ts     = None
+                    log.info("🔵 서버 이벤트 수신 → session_active=False, session_armed=True")
 
         except Exception as e:
-            print("WS recv error:", e)
+            log.warn("WS recv error: %s", e)
             try:
                 ws.close()
             except:
                 pass
             ws = connect_ws()
 
-# ======================= TF-Luna 파싱 =======================
-def parse_tfluna_frame(ser):
-    """TF-Luna 프레임 하나 파싱 → 거리(cm) 또는 None"""
-    if ser.read(1) != b'\x59':
-        return None
-    if ser.read(1) != b'\x59':
-        return None
-    rest = ser.read(7)
-    if len(rest) < 7:
-        return None
-    distance = rest[0] + rest[1] * 256
-    return distance
-
 # ======================= 메인 루프 =======================
 def main():
-    global session_active, session_armed, server_seen, first_hit_ts, last_far_ts
+    global session_active, session_armed, server_seen, first_hit_ts, last_far_ts, prewarm_ts
 
+    install_dump_signal()   # kill -USR1 → 최근 debug 로그 덤프
     ws = connect_ws()
     # 서버 수신 스레드 시작
     t = threading.Thread(target=ws_recv_loop, args=(ws,), daemon=True)
@@ -139,12 +147,22 @@ def main():
     ser = serial.Serial(PORT, baudrate=BAUDRATE, timeout=0.1)
     time.sleep(0.5)
     ser.reset_input_buffer()
+    reader = TFLunaReader(ser, MIN_STRENGTH)
+    trend = ApproachTrend(TREND_SEC)
+    corrupt = 0
 
     while True:
         try:
-            d = parse_tfluna_frame(ser)
-            if d is None:
+            # 쌓인 바이트 전부 읽고 가장 새 샘플만 (없으면 ser.timeout 까지 대기) → 루프 sleep 불필요
+            s = reader.poll()
+            if reader.parser.corrupt != corrupt:
+                corrupt = reader.parser.corrupt
+                log.warn("[LIDAR] checksum error (%s)", reader, key="lidar_corrupt", every=10.0)
+            log.info("[LIDAR] %s", reader, key="lidar_stats", every=STATS_SEC)
+            if s is None or not s.ok:
                 continue
+            d = s.dist
+            trend.update(s)
 
             near = (d <= THRESHOLD_CM)
 
@@ -154,16 +172,26 @@ def main():
                     # 하드락 적용: 명시적 종료가 오지 않더라도 최소 N초는 감지 금지
                     if first_hit_ts and (time.time() - first_hit_ts) < ACTIVE_HARD_LOCK_SEC:
                         last_far_ts = None
-                        time.sleep(0.02)
                         continue
                     # 하드락이 끝났더라도, 종료 이벤트(END_EVENTS) 없이는 재무장 금지
                     last_far_ts = None
-                    time.sleep(0.02)
                     continue
 
+                # ── 접근 예측: 임계 도달 전에 비전 워밍업 (세션은 열지 않음) ──
+                if PREWARM_ENABLE and session_armed and not near and d <= PREWARM_MAX_CM:
+                    eta = trend.eta(THRESHOLD_CM, PREWARM_MIN_SPEED)
+                    if eta is not None and eta <= PREWARM_SEC and (
+                            prewarm_ts is None or time.time() - prewarm_ts >= PREWARM_COOLDOWN_SEC):
+                        speed = -trend.velocity()
+                        log.info("🟠 접근 예측: %dcm, %.0fcm/s → %.1fs 후 도달 예상 → prewarm", d, speed, eta)
+                        ws = safe_send(ws, {"action": "prewarm", "distance": int(d),
+                                            "speed": round(speed), "eta": round(eta, 2)})
+                        prewarm_ts = time.time()
+
                 # ── 세션 비활성 상태: 트리거 가능 ──
                 if near and session_armed:
-                    print(f"🟢 사용자 감지됨! 거리: {d}cm → 키오스크 화면 실행")
+                    lead = f" (prewarm {time.time() - prewarm_ts:.1f}s 전)" if prewarm_ts else ""
+                    log.info("🟢 사용자 감지됨! 거리: %dcm → 키오스크 화면 실행%s", d, lead)
                     ws = safe_send(ws, {"action": "lidarDistance", "distance": int(d)})
 
                     # 트리거 후: 임시로 세션 진행 상태로 전환(서버 이벤트 대기)
@@ -180,7 +208,8 @@ def main():
                         elif (time.time() - last_far_ts) >= REARM_AFTER_AWAY_SEC:
                             # 다음 손님 대기(폴백)
                             if not session_armed:
-                                print("🔄 다음 손님 대기 (offline fallback)")
+                                log.info("🔄 다음 손님 대기 (offline fallback)")
+                                prewarm_ts = None
                             session_active = False
                             session_armed  = True
                             first_hit_ts   = None
@@ -190,12 +219,10 @@ def main():
                     # 서버를 쓰는 경우엔 종료 이벤트로만 재무장 (여기선 폴백 타이머 사용 안 함)
                     last_far_ts = None if near else last_far_ts
 
-            time.sleep(0.02)  # ~50Hz loop
-
         except KeyboardInterrupt:
             break
         except Exception as e:
-            print("Loop error:", e)
+            log.warn("Loop error: %s", e, key="loop_err", every=5.0)
             time.sleep(0.2)
 
 if __name__ == "__main__":
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+tracker.py — 경량 다중 객체 추적 (ByteTrack 방식, 순수 NumPy)
+- 1단계: 높은 conf 검출 ↔ 기존 트랙 IoU 매칭, 2단계: 남은 트랙 ↔ 낮은 conf 검출
+- 새 트랙은 매칭 안 된 검출 중 birth_conf 이상 (high_conf 는 매칭 우선순위만, 기본 birth = 후단 conf 임계)
+  → 추적기를 켜도 추적기 없이 세던 검출(예: 0.15~0.4)이 개수에서 빠지지 않음
+- 트랙마다 클래스별 conf 누적(투표) → 박스 하나가 한두 프레임 깜빡여도 개수가 흔들리지 않음
+- 추적 개수가 연속 N 업데이트 동안 같고 투표가 충분히 한쪽으로 모이면 stable
+  (update 는 새로 추론한 프레임에만 호출: 모션 게이트가 건너뛴 프레임을 넣으면 hits/stable 이 부풀려짐)
+"""
+
+import numpy as np
+
+
+def iou_matrix(a, b):
+    """a (N,4), b (M,4) xyxy → IoU (N,M)"""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    wh = np.clip(rb - lt, 0, None)
+    inter = wh[..., 0] * wh[..., 1]
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def greedy_match(iou, thr):
+    """IoU 큰 쌍부터 1:1 매칭 → (행 idx, 열 idx)"""
+    rows, cols = [], []
+    if iou.size == 0:
+        return np.array(rows, np.int64), np.array(cols, np.int64)
+    iou = iou.copy()
+    while True:
+        k = int(iou.argmax())
+        r, c = divmod(k, iou.shape[1])
+        if iou[r, c] < thr:
+            break
+        rows.append(r)
+        cols.append(c)
+        iou[r, :] = -1
+        iou[:, c] = -1
+    return np.array(rows, np.int64), np.array(cols, np.int64)
+
+
+class Tracker:
+    def __init__(self, nc, iou_thr=0.3, high_conf=0.4, min_hits=2, max_age=8,
+                 stable_frames=4, min_purity=0.6, birth_conf=None):
+        self.nc = max(1, int(nc))
+        self.iou_thr = float(iou_thr)
+        self.high_conf = float(high_conf)
+        # 새 트랙 생성 하한 (high_conf 보다 높으면 의미 없으므로 자름)
+        self.birth_conf = self.high_conf if birth_conf is None else min(float(birth_conf), self.high_conf)
+        self.min_hits = int(min_hits)
+        self.max_age = int(max_age)
+        self.stable_frames = int(stable_frames)
+        self.min_purity = float(min_purity)
+        self.reset()
+
+    def reset(self):
+        self.boxes = np.zeros((0, 4), np.float32)
+        self.votes = np.zeros((0, self.nc), np.float32)   # 클래스별 conf 누적
+        self.hits = np.zeros(0, np.int32)
+        self.miss = np.zeros(0, np.int32)
+        self._counts = np.zeros(self.nc, np.int64)
+        self._same = 0
+        self.purity = 0.0
+        self.score = 0.0
+
+    # ── 갱신
+    def update(self, cls, conf, xyxy):
+        cls = np.asarray(cls, np.int64)
+        conf = np.asarray(conf, np.float32)
+        xyxy = np.asarray(xyxy, np.float32).reshape(-1, 4)
+        ok = (cls >= 0) & (cls < self.nc)
+        cls, conf, xyxy = cls[ok], conf[ok], xyxy[ok]
+
+        high = np.flatnonzero(conf >= self.high_conf)
+        low = np.flatnonzero(conf < self.high_conf)
+        T = len(self.boxes)
+        t_free = np.arange(T)
+
+        # 1단계: 높은 conf
+        r1, c1 = greedy_match(iou_matrix(self.boxes, xyxy[high]), self.iou_thr)
+        t1, d1 = t_free[r1], high[c1]
+        t_free = np.setdiff1d(t_free, t1)
+        # 2단계: 남은 트랙 ↔ 낮은 conf (가려지거나 흐려진 물체 유지)
+        r2, c2 = greedy_match(iou_matrix(self.boxes[t_free], xyxy[low]), self.iou_thr)
+        t2, d2 = t_free[r2], low[c2]
+
+        tm = np.concatenate([t1, t2])
+        dm = np.concatenate([d1, d2])
+        self.boxes[tm] = xyxy[dm]
+        np.add.at(self.votes, (tm, cls[dm]), conf[dm])
+        self.hits[tm] += 1
+        unmatched = np.ones(T, bool)
+        unmatched[tm] = False
+        self.miss[unmatched] += 1
+        self.miss[tm] = 0
+
+        # 매칭 안 된 birth_conf 이상 검출 → 새 트랙
+        new = np.setdiff1d(np.flatnonzero(conf >= self.birth_conf), dm)
+        if new.size:
+            v = np.zeros((new.size, self.nc), np.float32)
+            v[np.arange(new.size), cls[new]] = conf[new]
+            self.boxes = np.concatenate([self.boxes, xyxy[new]])
+            self.votes = np.concatenate([self.votes, v])
+            self.hits = np.concatenate([self.hits, np.ones(new.size, np.int32)])
+            self.miss = np.concatenate([self.miss, np.zeros(new.size, np.int32)])
+
+        # 오래 안 보인 트랙 제거
+        alive = self.miss <= self.max_age
+        if not alive.all():
+            self.boxes, self.votes = self.boxes[alive], self.votes[alive]
+            self.hits, self.miss = self.hits[alive], self.miss[alive]
+
+        self._update_stability()
+
+    def _update_stability(self):
+        cls, _ = self.tracks()
+        counts = np.bincount(cls, minlength=self.nc)
+        if np.array_equal(counts, self._counts):
+            self._same += 1
+        else:
+            self._counts = counts
+            self._same = 1
+        conf_rows = self.votes[self.hits >= self.min_hits]
+        if len(conf_rows):
+            purity = float((conf_rows.max(axis=1) / np.maximum(conf_rows.sum(axis=1), 1e-9)).mean())
+        else:
+            purity = 0.0
+        self.purity = purity
+        self.score = min(1.0, self._same / max(1, self.stable_frames)) * purity
+
+    # ── 결과
+    def tracks(self):
+        """확정 트랙의 (클래스, 평균 conf)"""
+        conf_ok = self.hits >= self.min_hits
+        v = self.votes[conf_ok]
+        cls = v.argmax(axis=1) if len(v) else np.zeros(0, np.int64)
+        conf = (v[np.arange(len(v)), cls] / self.hits[conf_ok]) if len(v) else np.zeros(0, np.float32)
+        return cls.astype(np.int64), conf.astype(np.float32)
+
+    @property
+    def stable(self):
+        return bool(self._counts.any() and self._same >= self.stable_frames
+                    and self.purity >= self.min_purity)
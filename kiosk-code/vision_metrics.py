@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+vision_metrics.py — 단계별 지연 히스토그램 + 카운터 (저비용)
+- observe(stage, t0): perf_counter 차이를 ms 로 링버퍼에 기록 (할당 없음)
+- snapshot(): 단계별 n/mean/p50/p95/p99 + 카운터 dict
+- 카메라/추론/후처리/캡처 스레드가 함께 기록 → 히스토그램/카운터 갱신과 스냅샷은 락 하나로 (구간이 짧음)
+- serve_metrics(): 로컬 HTTP(127.0.0.1:PORT) 또는 Unix 소켓(unix:/path)으로 GET /metrics → JSON
+"""
+
+import json
+import os
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+class LatencyHist:
+    """최근 window 개 샘플만 유지하는 롤링 분포"""
+
+    def __init__(self, window=1024):
+        self._buf = np.zeros(int(window), dtype=np.float32)
+        self._n = 0
+        self.total = 0
+
+    def add(self, ms):
+        self._buf[self._n % len(self._buf)] = ms
+        self._n += 1
+        self.total += 1
+
+    def summary(self):
+        k = min(self._n, len(self._buf))
+        if k == 0:
+            return {"n": self.total}
+        v = self._buf[:k]
+        p50, p95, p99 = np.percentile(v, (50, 95, 99))
+        return {"n": self.total, "mean": round(float(v.mean()), 3),
+                "p50": round(float(p50), 3), "p95": round(float(p95), 3), "p99": round(float(p99), 3)}
+
+
+class Metrics:
+    def __init__(self, window=1024):
+        self._window = window
+        self._hists = {}
+        self.counters = {}
+        self._gauges = {}        # 이름 → 값을 돌려주는 함수 (큐 길이/드롭 수 등)
+        self._lock = threading.Lock()
+        self._t0 = time.monotonic()
+
+    def observe(self, stage, t0):
+        """t0 = time.perf_counter() 시작 시각"""
+        self.observe_ms(stage, (time.perf_counter() - t0) * 1000.0)
+
+    def observe_ms(self, stage, ms):
+        with self._lock:
+            h = self._hists.get(stage)
+            if h is None:
+                h = self._hists[stage] = LatencyHist(self._window)
+            h.add(ms)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name, fn):
+        self._gauges[name] = fn
+
+    def snapshot(self):
+        gauges = {}
+        for k, fn in list(self._gauges.items()):
+            try:
+                gauges[k] = fn()
+            except Exception:
+                pass
+        with self._lock:
+            stages = {k: h.summary() for k, h in self._hists.items()}
+            counters = dict(self.counters)
+        return {
+            "uptimeS": round(time.monotonic() - self._t0, 1),
+            "stagesMs": stages,
+            "counters": counters,
+            "gauges": gauges,
+        }
+
+
+def serve_metrics(metrics, addr):
+    """addr: 'host:port' 또는 'unix:/run/vision.sock'. 백그라운드 스레드로 서비스."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = json.dumps(metrics.snapshot()).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass   # 요청마다 콘솔 출력 안 함
+
+    if addr.startswith("unix:"):
+        path = addr[5:]
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+        class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+
+        srv = UnixHTTPServer(path, Handler)
+    else:
+        host, port = addr.rsplit(":", 1)
+        srv = ThreadingHTTPServer((host, int(port)), Handler)
+        srv.daemon_threads = True
+
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+vision_pipeline.py — 전처리 → OpenVINO 비동기 추론 → 후처리 3단 파이프라인
+- 단계 사이 큐는 길이 제한 + drop-oldest (밀리면 오래된 프레임부터 버림)
+- 추론은 AsyncInferQueue 로 여러 요청을 동시에 띄움 (THROUGHPUT 힌트)
+- 전처리/후처리는 각자 스레드 → Pi 4코어에서 단계가 겹쳐서 돌아감
+"""
+
+import threading
+import time
+from collections import deque
+
+from kiosk_log import get_logger
+
+log = get_logger("pipeline")
+
+
+class DropOldestQueue:
+    """길이 제한 큐. 가득 차면 가장 오래된 항목을 밀어내고 돌려줌."""
+
+    def __init__(self, maxlen):
+        self._q = deque()
+        self._maxlen = max(1, int(maxlen))
+        self._cv = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item):
+        """넣고, 밀려난 항목이 있으면 반환 (호출자가 정리)"""
+        with self._cv:
+            old = None
+            if len(self._q) >= self._maxlen:
+                old = self._q.popleft()
+                self.dropped += 1
+            self._q.append(item)
+            self._cv.notify()
+            return old
+
+    def get(self, timeout=None):
+        """꺼내기 (timeout 지나면 None)"""
+        with self._cv:
+            if not self._q:
+                self._cv.wait(timeout)
+                if not self._q:
+                    return None
+            return self._q.popleft()
+
+    def __len__(self):
+        return len(self._q)
+
+
+class VisionPipeline:
+    """
+    preprocess(item) -> (tensor, meta)   전처리 스레드
+    compiled_model 비동기 추론             OpenVINO 내부 스레드
+    postprocess(output, meta)            후처리 스레드
+    """
+
+    def __init__(self, compiled_model, preprocess, postprocess, jobs=0, qlen=2, on_drop=None, metrics=None):
+        from openvino import AsyncInferQueue
+
+        self._preprocess = preprocess
+        self._postprocess = postprocess
+        self._on_drop = on_drop            # 전처리 큐에서 밀려난 항목 정리용
+        self._metrics = metrics            # vision_metrics.Metrics (선택)
+
+        self.pre_q = DropOldestQueue(qlen)
+        self.post_q = DropOldestQueue(qlen)
+
+        # jobs=0 → 장치가 알려주는 최적 요청 수
+        self._infer_q = AsyncInferQueue(compiled_model, int(jobs))
+        self._infer_q.set_callback(self._on_infer_done)
+        self.jobs = len(self._infer_q)
+
+        self._running = True
+        self._threads = [
+            threading.Thread(target=self._pre_loop, daemon=True),
+            threading.Thread(target=self._post_loop, daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, item):
+        old = self.pre_q.put(item)
+        if old is not None and self._on_drop:
+            self._on_drop(old)
+
+    def stop(self):
+        self._running = False
+        # 아직 전처리 안 된 항목 정리
+        while len(self.pre_q):
+            old = self.pre_q.get(timeout=0)
+            if old is not None and self._on_drop:
+                self._on_drop(old)
+        try:
+            self._infer_q.wait_all()
+        except Exception:
+            pass
+
+    # ── 단계별 루프
+    def _pre_loop(self):
+        while self._running:
+            item = self.pre_q.get(timeout=0.2)
+            if item is None:
+                continue
+            try:
+                tensor, meta = self._preprocess(item)
+            except Exception as e:
+                log.warn("[PIPE] preprocess err: %s", e, key="pipe_pre_err", every=5.0)
+                continue
+            if tensor is None:
+                continue
+            # 빈 요청이 없으면 여기서 대기 (그 사이 새 프레임은 pre_q 에서 오래된 것부터 버려짐)
+            self._infer_q.start_async({0: tensor}, (meta, time.perf_counter()))
+
+    def _on_infer_done(self, request, userdata):
+        # OpenVINO 콜백 스레드: 출력만 복사해서 넘기고 바로 반환
+        meta, t0 = userdata
+        if self._metrics is not None:
+            self._metrics.observe("infer", t0)
+        out = request.get_output_tensor(0).data.copy()
+        self.post_q.put((out, meta))
+
+    def _post_loop(self):
+        while self._running:
+            job = self.post_q.get(timeout=0.2)
+            if job is None:
+                continue
+            out, meta = job
+            try:
+                self._postprocess(out, meta)
+            except Exception as e:
+                log.warn("[PIPE] postprocess err: %s", e, key="pipe_post_err", every=5.0)
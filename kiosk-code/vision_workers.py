@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+"""
+vision_workers.py — 추론 워커 프로세스 풀 (WORKERS>0, GIL 없이 Pi 코어 전부 사용)
+- 카메라 reader 는 공유 메모리 FrameRing 에 그대로 기록, 워커에는 (링, 슬롯 번호) 만 보냄
+- 워커 프로세스: 색변환/ROI/보정 → 전처리 → 추론 → 디코드/NMS
+  보정된 입력 이미지는 슬롯별 공유 출력 영역에 쓰고, 결과 큐로는 작은 박스 배열만 돌려줌
+- 부모(WS 소유) 프로세스: 집계/추적/안정화/캡처/송신 (VisionPipeline 과 같은 submit 인터페이스)
+- 워커가 죽으면 잡고 있던 프레임을 놓아주고 같은 번호로 다시 띄움
+"""
+
+import atexit
+import itertools
+import multiprocessing as mp
+import queue
+import threading
+import time
+
+import numpy as np
+
+from detectors import Detector, Detections
+from vision_pipeline import DropOldestQueue
+
+_ctx = mp.get_context("spawn")   # OpenVINO/스레드가 있는 부모를 fork 하지 않음
+
+
+class WorkerModel(Detector):
+    """부모 쪽 검출기 자리: 클래스표/입력 크기만 (추론은 워커에서)"""
+
+    def __init__(self, info):
+        self.names = info["names"]
+        self.imgsz = info["imgsz"]
+        self.load_ms = info["load_ms"]
+        self.cache = info["cache"]
+
+    def detect(self, img):
+        raise RuntimeError("inference runs in worker processes (WORKERS>0)")
+
+
+def _worker_main(idx, cfg, rings, task_q, result_q):
+    """워커 프로세스 본체. rings = [(shm_name, w, h, slots, owned)]"""
+    from detectors import load_detector
+    from enhance import Enhancer
+    from frame_ring import FrameRing
+    from multiprocessing import shared_memory
+
+    det = load_detector(cfg["backend"], cfg["model_dir"], **cfg["detector"])
+    enh = Enhancer(**cfg["enhance"])
+    # owned = 부모가 만든 링: 부모의 resource_tracker 를 같이 쓰므로 등록 해제하면 부모 것이 지워짐 → 그대로
+    # 브로커 링은 부모도 등록하지 않은 남의 것 → 여기서 등록하면 컨트롤러 종료 시 브로커 공유 메모리가 지워짐
+    frames = [FrameRing(w, h, slots, attach=name, untrack=not owned) for name, w, h, slots, owned in rings]
+    result_q.put(("ready", idx, {"names": det.names, "imgsz": det.imgsz,
+                                 "load_ms": getattr(det, "load_ms", 0), "cache": getattr(det, "cache", "off")}))
+    outs = {}   # 출력 영역 이름 → (shm, (링수, 슬롯, N) 배열)
+    pc = time.perf_counter
+
+    while True:
+        task = task_q.get()
+        if task is None:
+            return
+        tid, ri, slot, seq, ts, roi, out_name = task
+        try:
+            out = outs.get(out_name)
+            if out is None:
+                shm = shared_memory.SharedMemory(name=out_name)
+                # 링마다 슬롯 수가 다를 수 있음 (브로커 링 + 로컬 링) → 가장 큰 슬롯 수로 (부모와 같은 배치)
+                slots = max(f.slots for f in frames)
+                out = outs[out_name] = (shm, np.ndarray((len(frames), slots, det.imgsz * det.imgsz * 3),
+                                                        np.uint8, buffer=shm.buf))
+            frame = frames[ri].frame_at(slot, seq, ts)
+            ms = {}
+
+            t0 = pc()
+            gray = None
+            if enh.skip_sharpness:
+                gray = frame.gray
+                if roi:
+                    x, y, w, h = roi
+                    gray = gray[y:y + h, x:x + w]
+            do = enh.wants(gray)
+            t_enh = pc() - t0
+            t0 = pc()
+            cw, ch = (roi[2], roi[3]) if roi else (frame.w, frame.h)
+            nw, nh = det.fit_size(cw, ch)
+            img = frame.bgr_at(nw, nh, roi, enh.luma if do and enh.mode == "luma" else None)
+            ms["convert"] = (pc() - t0) * 1000.0
+            if do and enh.mode != "luma":
+                t0 = pc()
+                img = enh.apply(img)
+                t_enh += pc() - t0
+            if enh.mode != "off":
+                ms["enhance"] = t_enh * 1000.0
+            dst = out[1][ri, slot, :nh * nw * 3].reshape(nh, nw, 3)
+            dst[:] = img
+
+            if det.compiled is not None:
+                t0 = pc()
+                x, lb = det.preprocess(img)
+                ms["preprocess"] = (pc() - t0) * 1000.0
+                t0 = pc()
+                raw = det.infer(x)
+                ms["infer"] = (pc() - t0) * 1000.0
+                t0 = pc()
+                dets = det.postprocess(raw, lb)
+                ms["postprocess"] = (pc() - t0) * 1000.0
+            else:
+                t0 = pc()
+                dets = det.detect(img)
+                ms["infer"] = (pc() - t0) * 1000.0
+            result_q.put(("result", idx, tid, tuple(dets), (cw, ch, nw, nh), ms))
+        except Exception as e:
+            result_q.put(("error", idx, tid, repr(e)))
+
+
+class WorkerPool:
+    """
+    submit(item) : item 은 task(item) -> (링 번호, 고정된 RingFrame, roi) 로 풀림
+    on_result(item, dets, img, cw, ch, ms) : 부모 후처리 스레드에서 호출
+      img 는 공유 출력 영역 뷰 → 그 프레임을 release() 하기 전까지만 유효
+      on_result 가 끝나면(예외 포함) 풀이 프레임을 release (on_result 안에서 먼저 놓아도 됨)
+    on_drop(item) : 처리 못 하고 버린 항목 정리 (프레임 release)
+    """
+
+    def __init__(self, workers, rings, task, on_result, cfg, qlen=2, on_drop=None,
+                 metrics=None, log=None, ready_timeout=300.0):
+        self.jobs = max(1, int(workers))
+        self._rings = rings
+        self._task = task
+        self._on_result = on_result
+        self._on_drop = on_drop
+        self._cfg = cfg
+        self._metrics = metrics
+        self._log = log
+        # owned: 이 프로세스가 만든 FrameRing (BrokerClient 는 브로커 것)
+        self._ring_specs = [(r.shm.name, r.w, r.h, r.slots, getattr(r, "_owner", False)) for r in rings]
+
+        self.pre_q = DropOldestQueue(qlen)
+        self.post_q = DropOldestQueue(qlen)
+        self._result_q = _ctx.Queue()
+        self._procs = [None] * self.jobs
+        self._task_qs = [None] * self.jobs
+        self._busy = {}                  # 워커 번호 → 처리 중 task id
+        self._inflight = {}              # task id → (item, 워커 번호)
+        self._ids = itertools.count(1)
+        self._cv = threading.Condition()
+        self.restarts = 0
+        self._running = True
+        self._out = None
+
+        for i in range(self.jobs):
+            self._spawn(i)
+        # 첫 워커가 모델을 올리면 클래스표/입력 크기 확정 → 보정 이미지 공유 영역 할당
+        info = self._wait_ready(ready_timeout)
+        self.model = WorkerModel(info)
+        from multiprocessing import shared_memory
+        # (링, 슬롯) 칸: 링마다 슬롯 수가 다를 수 있으므로 가장 큰 슬롯 수로 (워커도 같은 배치)
+        slots = max(r.slots for r in rings)
+        size = len(rings) * slots * info["imgsz"] * info["imgsz"] * 3
+        self._out = shared_memory.SharedMemory(create=True, size=size)
+        self._out_arr = np.ndarray((len(rings), slots, info["imgsz"] * info["imgsz"] * 3),
+                                   np.uint8, buffer=self._out.buf)
+        atexit.register(self.stop)
+
+        self._threads = [
+            threading.Thread(target=self._dispatch_loop, name="workers-dispatch", daemon=True),
+            threading.Thread(target=self._result_loop, name="workers-result", daemon=True),
+            threading.Thread(target=self._post_loop, name="workers-post", daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+
+    # ── 프로세스 관리
+    def _spawn(self, i):
+        q = _ctx.Queue()
+        p = _ctx.Process(target=_worker_main, name=f"vision-worker-{i}",
+                         args=(i, self._cfg, self._ring_specs, q, self._result_q), daemon=True)
+        p.start()
+        self._task_qs[i] = q
+        self._procs[i] = p
+
+    def _wait_ready(self, timeout):
+        t_end = time.monotonic() + timeout
+        while True:
+            try:
+                msg = self._result_q.get(timeout=1.0)
+            except queue.Empty:
+                if not any(p.is_alive() for p in self._procs):
+                    raise RuntimeError("all vision workers exited during model load")
+                if time.monotonic() > t_end:
+                    raise TimeoutError("vision workers did not load the model in time")
+                continue
+            if msg[0] == "ready":
+                self._ready_log(msg)
+                return msg[2]
+
+    def _ready_log(self, msg):
+        if self._log is not None:
+            self._log.info("[WORKER] %d ready (load %sms cache=%s)", msg[1], msg[2]["load_ms"], msg[2]["cache"])
+
+    def _check_workers(self):
+        """죽은 워커: 잡고 있던 프레임 정리 후 재시작"""
+        for i, p in enumerate(self._procs):
+            if p.is_alive() or not self._running:
+                continue
+            with self._cv:
+                tid = self._busy.pop(i, None)
+                job = self._inflight.pop(tid, None) if tid else None
+                self._cv.notify_all()
+            if job is not None and self._on_drop:
+                self._on_drop(job[0])
+            self.restarts += 1
+            if self._metrics is not None:
+                self._metrics.count("worker_restarts")
+            if self._log is not None:
+                self._log.warn("[WORKER] %d exited (code=%s) → restart", i, p.exitcode, key=f"worker_exit{i}")
+            self._spawn(i)
+
+    # ── 부모 스레드들
+    def submit(self, item):
+        old = self.pre_q.put(item)
+        if old is not None and self._on_drop:
+            self._on_drop(old)
+
+    def _dispatch_loop(self):
+        while self._running:
+            item = self.pre_q.get(timeout=0.2)
+            if item is None:
+                continue
+            # 빈 워커가 날 때까지 대기 (그 사이 새 프레임은 pre_q 에서 오래된 것부터 버려짐)
+            with self._cv:
+                while self._running and len(self._busy) >= self.jobs:
+                    self._cv.wait(0.2)
+                if not self._running:
+                    if self._on_drop:
+                        self._on_drop(item)
+                    return
+                i = next(k for k in range(self.jobs) if k not in self._busy)
+                tid = next(self._ids)
+                self._busy[i] = tid
+                self._inflight[tid] = (item, i)
+            ri, frame, roi = self._task(item)
+            self._task_qs[i].put((tid, ri, frame.slot, frame.seq, frame.ts, roi, self._out.name))
+
+    def _result_loop(self):
+        while self._running:
+            try:
+                msg = self._result_q.get(timeout=0.5)
+            except queue.Empty:
+                self._check_workers()
+                continue
+            except (EOFError, OSError):
+                return
+            kind, i = msg[0], msg[1]
+            if kind == "ready":
+                self._ready_log(msg)
+                continue
+            with self._cv:
+                tid = msg[2]
+                if self._busy.get(i) == tid:
+                    del self._busy[i]
+                job = self._inflight.pop(tid, None)
+                self._cv.notify_all()
+            if job is None:
+                continue
+            if kind == "error":
+                if self._log is not None:
+                    self._log.warn("[WORKER] %d task error: %s", i, msg[3], key="worker_err")
+                if self._on_drop:
+                    self._on_drop(job[0])
+                continue
+            old = self.post_q.put((job[0], msg[3], msg[4], msg[5]))
+            if old is not None and self._on_drop:
+                self._on_drop(old[0])
+            self._check_workers()
+
+    def _post_loop(self):
+        while self._running:
+            job = self.post_q.get(timeout=0.2)
+            if job is None:
+                continue
+            item, dets, (cw, ch, nw, nh), ms = job
+            ri, frame, _ = self._task(item)
+            img = self._out_arr[ri, frame.slot, :nh * nw * 3].reshape(nh, nw, 3)
+            try:
+                self._on_result(item, Detections(*dets), img, cw, ch, ms)
+            except Exception as e:
+                if self._log is not None:
+                    self._log.warn("[WORKER] result err: %s", e, key="worker_post_err")
+            finally:
+                frame.release()   # on_result 가 예외로 빠져도 슬롯 고정이 남지 않게
+
+    def stop(self):
+        if not self._running:
+            return
+        self._running = False
+        while len(self.pre_q):
+            old = self.pre_q.get(timeout=0)
+            if old is not None and self._on_drop:
+                self._on_drop(old)
+        for q in self._task_qs:
+            try:
+                q.put(None)
+            except Exception:
+                pass
+        for p in self._procs:
+            p.join(timeout=1.0)
+            if p.is_alive():
+                p.terminate()
+        if self._out is not None:
+            self._out_arr = None
+            try:
+                self._out.unlink()
+                self._out.close()
+            except (BufferError, FileNotFoundError):
+                pass
@@ -50,7 +50,8 @@ function broadcast(wss, payload, { role, sessionId } = {}) {
   for (const c of wss.clients) {
     if (c.readyState !== WebSocket.OPEN) continue;
     if (role && c.role !== role) continue;
-    if (sessionId && c.sessionId && c.sessionId !== sessionId) continue;
+    // session="*" = 모든 세션 수신 (카메라 여러 대를 맡는 컨트롤러)
+    if (sessionId && c.sessionId && c.sessionId !== "*" && c.sessionId !== sessionId) continue;
     try { c.send(msg); cnt++; } catch {}
   }
   const kind = payload.type || payload.action;
@@ -84,11 +85,12 @@ async function upsertSessionItemsOnce(sessionCode, counts) {
 // ───── Vision 시작 명령 (controller에게 재시도 포함)
 function sendStartVision(wss, sid, by="server") {
   // 1️⃣ controller + sessionId
-  let sent = broadcast(wss, { action: "startVision" }, { role: "controller", sessionId: sid });
+  // (sessionId 포함 → 멀티 카메라 컨트롤러는 해당 레인만 재개)
+  let sent = broadcast(wss, { action: "startVision", sessionId: sid }, { role: "controller", sessionId: sid });
   // 2️⃣ controller 전체
-  if (sent === 0) sent = broadcast(wss, { action: "startVision" }, { role: "controller" });
+  if (sent === 0) sent = broadcast(wss, { action: "startVision", sessionId: sid }, { role: "controller" });
   // 3️⃣ 전체 브로드캐스트 (fallback)
-  if (sent === 0) broadcast(wss, { action: "startVision" });
+  if (sent === 0) broadcast(wss, { action: "startVision", sessionId: sid });
 
   // 모니터링용 프런트 표시(선택)
   broadcast(wss, { type: "startVision", by, sessionId: sid, ts: Date.now() }, { sessionId: sid });
@@ -347,11 +349,14 @@ module.exports = (server) => {
         const phase = m.phase;   // ex) "waiting", "scan" 등
         const ready = m.ready;   // true/false
         const sid2 = m.sessionId || ws.sessionId || "default";
-        const S2 = getSess(sid2);
+        if (phase !== "waiting" && ready !== false) return;
 
         // ✅ waiting 상태면 startVision 재전송
-        if (S2.open && (phase === "waiting" || ready === false)) {
-          sendStartVision(wss, sid2, "hb-retry");
+        // (session="*" 컨트롤러가 sessionId 없이 보내면 "*" 세션이 아니라 열린 세션 전부로 풀어서)
+        const targets = sid2 === "*" ? [...SESS.keys()].filter((k) => k !== "*") : [sid2];
+        for (const t of targets) {
+          const S2 = getSess(t);
+          if (S2.open) sendStartVision(wss, t, "hb-retry");
         }
         return;
       }
@@ -368,6 +373,15 @@ module.exports = (server) => {
         return;
       }
 
+      // ── LiDAR 접근 예측 → 컨트롤러만 카메라/모델 워밍업 (세션/화면은 그대로)
+      if (kind === "prewarm") {
+        console.log("[LIDAR] prewarm", { dist: m.distance, speed: m.speed, eta: m.eta, sid });
+        const payload = { action: "prewarm", distance: m.distance, speed: m.speed, eta: m.eta, sessionId: sid, ts: Date.now() };
+        // 컨트롤러에게만 (전체 폴백 없음: 화면/라이다 클라이언트가 받을 메시지가 아님)
+        broadcast(wss, payload, { role: "controller" });
+        return;
+      }
+
       // ── 바구니 안정 → 세션 보장 + Vision 시작
       if (kind === "basketStable") {
         await startOrReuseSession(wss, sid);
@@ -444,7 +458,8 @@ module.exports = (server) => {
         } else {
           const sig = countsSignature(counts);
           if (sig !== S.lastSig) { S.lastSig = sig; S.lastChangeAt = now; S.finalCounts = counts; }
-          else if (now - S.lastChangeAt >= SCAN_STABLE_MS) {
+          // 컨트롤러 추적기(TRACKER=1)가 final 로 확정하면 SCAN_STABLE_MS 대기 생략
+          if (m.final === true || (S.lastChangeAt !== now && now - S.lastChangeAt >= SCAN_STABLE_MS)) {
             const sessionCode = S.code;
             const ts = Date.now();
             broadcast(wss, { type:"stopVision", sessionId:sid, ts });